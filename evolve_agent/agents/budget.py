@@ -0,0 +1,114 @@
+"""Per-run budgets of wall-clock time, tokens and n8n deployments.
+
+`Agent.pipeline` sets the budget of its run in `budget_var` and the stages call
+`check_budget` before doing work, so an exhausted run stops at the next stage
+boundary and returns its best partial result instead of running to `max_iteration`.
+"""
+
+import hashlib
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from .codec import encode_workflow
+from .context import run_id_var
+from .usage import UsageLedger, usage_ledger
+
+
+class BudgetExceededError(Exception):
+    """Raised at a stage boundary once a budget of the run is exhausted."""
+
+    def __init__(self, reason: str, message: str, stage: str):
+        """
+        Args:
+            reason: "deadline", "token_budget" or "deployment_budget"
+            message: What was exhausted, for the logs and the result
+            stage: The stage that was about to run
+        """
+        self.reason = reason
+        self.message = message
+        self.stage = stage
+        super().__init__(f"{message} (before {stage})")
+
+
+class RunBudget:
+    def __init__(
+        self,
+        deadline_s: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        max_deployments: Optional[int] = None,
+        ledger: UsageLedger = usage_ledger,
+    ):
+        """
+        Args:
+            deadline_s: Wall-clock seconds the run may take, None for no limit
+            max_tokens: Input and output tokens of the LLM calls of the run
+            max_deployments: Workflows the run may create on n8n
+            ledger: Usage ledger counting the tokens of the run
+        """
+        self.deadline_s = deadline_s
+        self.max_tokens = max_tokens
+        self.max_deployments = max_deployments
+        self.ledger = ledger
+        self.started_at = time.monotonic()
+        self.deployments = 0
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def tokens_used(self) -> int:
+        records = self.ledger.records.get(run_id_var.get(), [])
+        return sum(record["input_tokens"] + record["output_tokens"] for record in records)
+
+    def check(self, stage: str):
+        """Raise `BudgetExceededError` if a budget is exhausted."""
+        if self.deadline_s is not None and self.elapsed() >= self.deadline_s:
+            raise BudgetExceededError(
+                "deadline", f"Deadline of {self.deadline_s:g}s reached after {self.elapsed():.1f}s", stage
+            )
+        if self.max_tokens is not None:
+            used = self.tokens_used()
+            if used >= self.max_tokens:
+                raise BudgetExceededError(
+                    "token_budget", f"Token budget of {self.max_tokens} exhausted, {used} used", stage
+                )
+        if self.max_deployments is not None and self.deployments >= self.max_deployments:
+            raise BudgetExceededError(
+                "deployment_budget", f"Deployment budget of {self.max_deployments} workflow(s) exhausted", stage
+            )
+
+
+# Budget of the pipeline run the current task belongs to, None for no limits
+budget_var: ContextVar[Optional[RunBudget]] = ContextVar("budget", default=None)
+
+
+@contextmanager
+def budget_context(budget: RunBudget):
+    """Apply `budget` to everything executed inside the block."""
+    token = budget_var.set(budget)
+    try:
+        yield budget
+    finally:
+        budget_var.reset(token)
+
+
+def check_budget(stage: str):
+    """Check the budget of the current run before `stage`."""
+    budget = budget_var.get()
+    if budget is not None:
+        budget.check(stage)
+
+
+def count_deployment():
+    budget = budget_var.get()
+    if budget is not None:
+        budget.deployments += 1
+
+
+def workflow_fingerprint(workflow: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Hash of the compact form of a workflow without its name, equal for two
+    attempts that only differ by node IDs, positions or naming."""
+    if not workflow:
+        return None
+    return hashlib.sha256(encode_workflow({**workflow, "name": ""}).encode("utf-8")).hexdigest()[:16]
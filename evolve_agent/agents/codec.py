@@ -0,0 +1,181 @@
+"""Compact serialization of n8n workflows for prompts.
+
+Workflows reach the LLM without their UI-only and instance-specific fields (node
+positions, IDs, webhook IDs, version and instance metadata, sticky notes) and
+minified, one node per line. Connections are shortened: an output that goes to input
+0 of the same connection type is written as the bare target node name. The model
+answers in the same format, and `decode_workflow` expands the connections and restores
+the stripped fields before the workflow is deployed.
+
+Measure the savings on the template dataset with:
+    python -m evolve_agent.agents.codec evolve_agent/templates/dataset
+"""
+
+import copy
+import json
+import sys
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .models import count_tokens
+
+WORKFLOW_STRIPPED_KEYS = {"id", "versionId", "meta", "pinData", "active", "tags", "createdAt", "updatedAt"}
+NODE_STRIPPED_KEYS = {"position", "id", "webhookId", "notesInFlow"}
+STICKY_NOTE_TYPE = "n8n-nodes-base.stickyNote"
+
+DEFAULT_SETTINGS = {
+    "executionOrder": "v1",
+    "saveExecutionProgress": True,
+    "saveManualExecutions": True,
+    "saveDataErrorExecution": "all",
+    "saveDataSuccessExecution": "all",
+}
+
+# Layout of restored node positions
+ORIGIN = (250, 20)
+COLUMN_WIDTH = 220
+ROW_HEIGHT = 200
+
+
+def _minify(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def compact_connections(connections: Dict[str, Any]) -> Dict[str, Any]:
+    compacted = {}
+    for source, outputs in connections.items():
+        compacted[source] = {}
+        for connection_type, branches in outputs.items():
+            compacted[source][connection_type] = [
+                [
+                    target["node"]
+                    if target.get("type", connection_type) == connection_type and target.get("index", 0) == 0
+                    else target
+                    for target in branch or []
+                ]
+                for branch in branches
+            ]
+    return compacted
+
+
+def expand_connections(connections: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of `compact_connections`, full connections are left untouched."""
+    expanded = {}
+    for source, outputs in connections.items():
+        expanded[source] = {}
+        for connection_type, branches in outputs.items():
+            expanded[source][connection_type] = [
+                [
+                    {"node": target, "type": connection_type, "index": 0} if isinstance(target, str) else target
+                    for target in branch or []
+                ]
+                for branch in branches
+            ]
+    return expanded
+
+
+def compact_workflow(workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip the non-semantic fields of a workflow and shorten its connections."""
+    if "nodes" not in workflow:
+        return workflow  # not an n8n workflow, e.g. another tool's export in the dataset
+    compacted = {key: value for key, value in workflow.items() if key not in WORKFLOW_STRIPPED_KEYS}
+    compacted["nodes"] = [
+        {key: value for key, value in node.items() if key not in NODE_STRIPPED_KEYS}
+        for node in workflow["nodes"]
+        if node.get("type") != STICKY_NOTE_TYPE
+    ]
+    compacted["connections"] = compact_connections(workflow.get("connections") or {})
+    return compacted
+
+
+def encode_workflow(workflow: Dict[str, Any]) -> str:
+    """Serialize a workflow for a prompt: compacted, minified, one node per line.
+
+    The result is valid JSON.
+    """
+    compacted = compact_workflow(workflow)
+    if "nodes" not in compacted:
+        return _minify(compacted)
+    fields = []
+    for key, value in compacted.items():
+        if key == "nodes":
+            nodes = ",\n".join(_minify(node) for node in value)
+            fields.append(f'"nodes":[\n{nodes}\n]')
+        else:
+            fields.append(f"{_minify(key)}:{_minify(value)}")
+    return "{" + ",\n".join(fields) + "}"
+
+
+def _layout(workflow: Dict[str, Any]) -> Dict[str, List[int]]:
+    """Left-to-right positions by distance from the nodes without inputs."""
+    # Nodes without a name are left to the validation of the workflow
+    names = [node.get("name") for node in workflow["nodes"] if node.get("name")]
+    targets: Dict[str, List[str]] = {name: [] for name in names}
+    has_input = set()
+    for source, outputs in (workflow.get("connections") or {}).items():
+        for branches in outputs.values():
+            for branch in branches:
+                for target in branch or []:
+                    if source in targets and target.get("node") in targets:
+                        targets[source].append(target["node"])
+                        has_input.add(target["node"])
+
+    depth = {name: 0 for name in names if name not in has_input}
+    queue = deque(depth)
+    while queue:
+        name = queue.popleft()
+        for target in targets[name]:
+            if target not in depth:
+                depth[target] = depth[name] + 1
+                queue.append(target)
+
+    positions, rows = {}, {}
+    for name in names:
+        column = depth.get(name, 0)
+        row = rows.get(column, 0)
+        rows[column] = row + 1
+        positions[name] = [ORIGIN[0] + column * COLUMN_WIDTH, ORIGIN[1] + row * ROW_HEIGHT]
+    return positions
+
+
+def decode_workflow(workflow: Dict[str, Any], original: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Restore a workflow answered by the LLM in the compact format.
+
+    Connections are expanded, and missing node IDs, webhook IDs, positions and
+    settings are restored, from the node of the same name in `original` when given
+    and generated otherwise. Full workflows pass through unchanged.
+    """
+    workflow = copy.deepcopy(workflow)
+    if "nodes" not in workflow:
+        return workflow
+    workflow["connections"] = expand_connections(workflow.get("connections") or {})
+    original_nodes = {node["name"]: node for node in (original or {}).get("nodes", [])}
+    positions = _layout(workflow)
+    for node in workflow["nodes"]:
+        previous = original_nodes.get(node.get("name"), {})
+        node.setdefault("id", previous.get("id") or str(uuid.uuid4()))
+        node.setdefault("position", previous.get("position") or positions.get(node.get("name"), list(ORIGIN)))
+        if node.get("type") == "n8n-nodes-base.webhook":
+            node.setdefault("webhookId", previous.get("webhookId") or str(uuid.uuid4()))
+    workflow.setdefault("settings", (original or {}).get("settings") or dict(DEFAULT_SETTINGS))
+    return workflow
+
+
+def measure_savings(workflows: List[Dict[str, Any]], model_name: str = "gpt-4o") -> Dict[str, Any]:
+    """Prompt tokens of the workflows pretty-printed versus encoded."""
+    pretty = sum(count_tokens(model_name, json.dumps(workflow, indent=2)) for workflow in workflows)
+    compact = sum(count_tokens(model_name, encode_workflow(workflow)) for workflow in workflows)
+    return {
+        "workflows": len(workflows),
+        "pretty_tokens": pretty,
+        "compact_tokens": compact,
+        "savings": 1 - compact / pretty if pretty else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    directory = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent.parent / "templates" / "dataset"
+    workflows = [json.loads(path.read_text(encoding="utf-8")) for path in sorted(directory.glob("*.json"))]
+    print(json.dumps(measure_savings(workflows), indent=2))
@@ -1,3 +1,3 @@
 from typing import Literal
 
-model_ids = Literal["ollama/llama3.2", "openai/gpt-4o"]
+model_ids = Literal["ollama/llama3.2", "openai/gpt-4o", "openai/gpt-4o-mini"]
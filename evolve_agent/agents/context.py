@@ -0,0 +1,42 @@
+"""Context variables describing the pipeline run the current task belongs to.
+
+They are set by `Agent.pipeline` and copied into every asyncio task it spawns, so
+shared process-wide components can attribute work to a run without threading the run
+through every call.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# ID of the pipeline run, None outside of a run (e.g. /agent/generate_workflow)
+run_id_var: ContextVar[Optional[str]] = ContextVar("run_id", default=None)
+
+# 1-based evolution iteration of the run, 0 outside of a run
+iteration_var: ContextVar[int] = ContextVar("iteration", default=0)
+
+
+@contextmanager
+def run_context(run_id: str):
+    """Attribute everything executed inside the block to the run `run_id`."""
+    run_token = run_id_var.set(run_id)
+    iteration_token = iteration_var.set(0)
+    try:
+        yield
+    finally:
+        iteration_var.reset(iteration_token)
+        run_id_var.reset(run_token)
+
+
+# Pipeline stage the current LLM or embedding call serves, e.g. "generate_workflow"
+stage_var: ContextVar[Optional[str]] = ContextVar("stage", default=None)
+
+
+@contextmanager
+def stage_context(stage: str):
+    """Attribute the calls made inside the block to the pipeline stage `stage`."""
+    token = stage_var.set(stage)
+    try:
+        yield
+    finally:
+        stage_var.reset(token)
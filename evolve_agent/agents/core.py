@@ -1,20 +1,53 @@
+import asyncio
+import copy
 import datetime
 import json
-from pathlib import Path
+import time
+import uuid
 from textwrap import dedent
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
 from loguru import logger
 
+from ..app.config import settings
+from ..app.schemas.workflow import WebhookNodeParameters
 from ..app.services.n8n_service import N8nService
-from ..app.utils import log_context
-from .models import get_model
-from .prompt import escape_template, get_reflection_prompt, get_system_prompt
+from ..app.services.resilience import UpstreamUnavailableError, call_with_retry
+from ..app.services.run_store import RunStore, run_store_path
+from ..app.utils import RunLogRouter
+from .budget import (
+    BudgetExceededError,
+    RunBudget,
+    budget_context,
+    check_budget,
+    count_deployment,
+    workflow_fingerprint,
+)
+from .codec import decode_workflow, encode_workflow
+from .constants import model_ids
+from .context import iteration_var, run_context, run_id_var, stage_context
+from .diagnostics import diagnose_failed_execution, format_node_errors
+from .events import emit, event_bus, shorten, timed_stage
+from .fitness import FitnessEvaluator, fitness_key
+from .models import get_embeddings
+from .patch import PatchError, apply_patch, validate_workflow
+from .prompt import (
+    escape_template,
+    get_patch_prompt,
+    get_reflection_prompt,
+    get_system_prompt,
+)
 from .rag import TemplateRAG
-
-project_root = Path(__file__).parent.parent
-cache_dir = project_root / "logs" / "cache"
+from .router import get_route, get_router
+from .solution_cache import SolutionCache, format_solutions, same_parameters
+from .stage_graph import run_stage_graph
+from .usage import MeteredEmbeddings, summarize_usage, usage_ledger
+from .webhook_inputs import (
+    synthesize_webhook_inputs,
+    unwrap_input,
+    validate_webhook_inputs,
+)
 
 
 class WorkflowExecutionError(Exception):
@@ -26,11 +59,17 @@ class WorkflowExecutionError(Exception):
         stage: str,
         workflow: Dict[str, Any] = None,
         original_error: Exception = None,
+        result: Dict[str, Any] = None,
+        node_errors: List[Dict[str, Any]] = None,
     ):
         self.message = message
         self.stage = stage
         self.workflow = workflow
         self.original_error = original_error
+        # Step result of a workflow that ran but fell short, e.g. on fitness
+        self.result = result
+        # Failing nodes extracted from the n8n executions, see `diagnose_failed_execution`
+        self.node_errors = node_errors or []
         super().__init__(self.message)
 
     def __str__(self):
@@ -47,6 +86,7 @@ def get_error_msg(stage: str, message: str) -> str:
         3. get_webhook_input
         4. activate_workflow
         5. call_webhook
+        6. evaluate_fitness
 
         And the error is in the step: {stage}
         With the following error message:
@@ -55,192 +95,727 @@ def get_error_msg(stage: str, message: str) -> str:
     )
 
 
+def new_run_id() -> str:
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    # Suffix keeps concurrent runs started within the same second apart
+    return f"{timestamp}_{uuid.uuid4().hex[:6]}"
+
+
 class Agent:
-    def __init__(self):
-        self.agent_meta, _ = get_model(model_id="openai/gpt-4o", format="json", temperature=0.8)
-        rag_model, rag_embeddings = get_model(model_id="openai/gpt-4o", format="json", temperature=0.2)
-        self.agent_rag = TemplateRAG(model=rag_model, embeddings=rag_embeddings)
-        self.agent_input, _ = get_model(model_id="openai/gpt-4o", format="json", temperature=0.2)
+    def __init__(self, model_id: model_ids = "openai/gpt-4o", temperature: float = 0.2, k: int = 3):
+        """
+        Args:
+            model_id: Model used by the meta, RAG and input agents, unless
+                `settings.LLM_ROUTES` configures models for their role
+            temperature: Sampling temperature of the RAG and input agents
+            k: Number of template chunks retrieved by the RAG agent
+        """
+        self.agent_meta = get_router("meta", model_id, format="json", temperature=0.8)
+        rag_model = get_router("rag", model_id, format="json", temperature=temperature)
+        embeddings_id = get_route("embeddings", get_route("rag", model_id)[0])[0]
+        rag_embeddings = get_embeddings(embeddings_id)
+        rag_embeddings = MeteredEmbeddings(rag_embeddings, f"{embeddings_id.split('/')[0]}/{rag_embeddings.model}")
+        self.agent_rag = TemplateRAG(
+            model=rag_model, embeddings=rag_embeddings, k=k, webhook_inputs=settings.FUSED_WEBHOOK_INPUTS
+        )
+        self.agent_input = get_router("input", model_id, format="json", temperature=temperature)
+        # The routers retry and break the circuit of each model, only the retrieval of
+        # the RAG agent calls the embeddings model outside of them
+        self.embeddings_upstream = f"llm:{rag_embeddings.model_key}"
 
         self.n8n_service = N8nService()
+        self.fitness_evaluator = FitnessEvaluator(self.agent_input, self.n8n_service)
+        self.solution_cache = SolutionCache(rag_embeddings)
+        self.run_store = RunStore()
+        self.run_logs = RunLogRouter(run_store_path.parent / "run_logs", key=run_id_var.get)
 
-    def rag_generate_workflow(
+    async def rag_generate_workflow(
         self,
         prompt: str,
         archive: str = None,
         errors: str = None,
         guidelines: str = None,
+        solutions: str = None,
     ) -> Dict[str, Any]:
+        workflow, _ = await self.rag_generate_candidate(prompt, archive, errors, guidelines, solutions)
+        return workflow
+
+    async def rag_generate_candidate(
+        self,
+        prompt: str,
+        archive: str = None,
+        errors: str = None,
+        guidelines: str = None,
+        solutions: str = None,
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Generate a workflow and, with `settings.FUSED_WEBHOOK_INPUTS`, the sample
+        inputs of its webhooks in the same call.
+
+        Returns:
+            Tuple of the workflow and of the webhook inputs answered by the model,
+            unchecked, None if it answered none
+        """
         logger.info("[Agent] RAG agent generating workflow")
-        response = self.agent_rag.query(prompt, archive, errors, guidelines)
+        with stage_context("generate_workflow"):
+            response = await call_with_retry(
+                self.embeddings_upstream, self.agent_rag.aquery, prompt, archive, errors, guidelines, solutions
+            )
         logger.debug(f"[Agent] RAG agent response: {response}")
-        workflow = json.loads(response["answer"])
+        answer = json.loads(response["answer"])
+        webhook_inputs = answer.pop("webhook_inputs", None) if isinstance(answer, dict) else None
+        workflow = decode_workflow(answer)
         logger.info(f"[Agent] Generated workflow: {workflow['name']}")
-        return workflow
+        return workflow, webhook_inputs
 
-    def get_webhook_input(self, workflow: Dict[str, Any]) -> Dict[str, Any]:
-        logger.info(f"[Agent] Getting webhook input for workflow: {workflow['name']}")
+    async def rag_patch_workflow(
+        self, prompt: str, workflow: Dict[str, Any], errors: str = None, guidelines: str = None
+    ) -> Dict[str, Any]:
+        """Ask the RAG model for edit operations fixing `workflow` and apply them.
+
+        Raises:
+            PatchError: If the operations cannot be applied or yield an invalid workflow
+        """
+        logger.info(f"[Agent] RAG agent patching workflow: {workflow['name']}")
+        patch_prompt = get_patch_prompt(prompt, encode_workflow(workflow), errors or "", guidelines or "")
+        with stage_context("patch_workflow"):
+            response = (await self.agent_rag.model.ainvoke(patch_prompt)).content
+        logger.debug(f"[Agent] RAG agent patch: {response}")
+        try:
+            operations = json.loads(response)["operations"]
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            raise PatchError(f"malformed patch: {e!r}") from e
+        patched = apply_patch(workflow, operations)
+        logger.info(f"[Agent] Applied {len(operations)} edit operation(s)")
+        return patched
+
+    async def get_webhook_inputs(
+        self, workflow: Dict[str, Any], webhooks: List[WebhookNodeParameters]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Generate the input of every webhook of the workflow.
+
+        With `settings.RULE_BASED_WEBHOOK_INPUTS`, the inputs are built from the body
+        fields the nodes reference, and only the webhooks whose fields are unknown are
+        left to the input agent, in a single LLM call.
+
+        Returns:
+            Dict mapping each webhook path to its input body
+        """
+        logger.info(f"[Agent] Getting input for {len(webhooks)} webhook(s) of workflow: {workflow['name']}")
+        webhook_inputs = {}
+        if settings.RULE_BASED_WEBHOOK_INPUTS:
+            synthesized, _ = synthesize_webhook_inputs(workflow)
+            webhook_inputs = {
+                webhook.path: synthesized[webhook.path] for webhook in webhooks if webhook.path in synthesized
+            }
+            webhooks = [webhook for webhook in webhooks if webhook.path not in webhook_inputs]
+            if webhook_inputs:
+                logger.info(f"[Agent] Built webhook inputs from the referenced fields: {webhook_inputs}")
+            if not webhooks:
+                return webhook_inputs
+
+        webhook_list = "\n".join(f"- path: {webhook.path}, method: {webhook.httpMethod.value}" for webhook in webhooks)
         prompt = f"""
         You are an expert at understanding and explaining workflow templates.
+        Provide the input for every webhook of the template below. Make sure to return in a WELL-FORMED JSON object mapping each webhook path to its input, like:
+        {{"<path>": {{...}}}}
+
         And you are given the following template information:
         {escape_template(workflow)}
 
-        There is a webhook in the template. Provide the input for the webhook. Make sure to return in a WELL-FORMED JSON object.
+        The template has the following webhooks:
+        {webhook_list}
         """
-        response = self.agent_input.invoke(prompt).content
-        webhook_input = json.loads(response)
-        # XXX: hardcoded for webhook input
-        if "body" in webhook_input:
-            webhook_input = webhook_input["body"]
-        logger.info(f"[Agent] Got webhook input: {webhook_input}")
-        return webhook_input
+        with stage_context("get_webhook_input"):
+            response = (await self.agent_input.ainvoke(prompt)).content
+        response_inputs = json.loads(response)
+
+        if len(webhooks) == 1 and webhooks[0].path not in response_inputs:
+            # The model answered with the bare input of the only webhook
+            response_inputs = {webhooks[0].path: response_inputs}
+
+        webhook_inputs.update({webhook.path: unwrap_input(response_inputs.get(webhook.path)) for webhook in webhooks})
+        logger.info(f"[Agent] Got webhook inputs: {webhook_inputs}")
+        return webhook_inputs
+
+    async def call_webhooks(
+        self, webhooks: List[WebhookNodeParameters], webhook_inputs: Dict[str, Dict[str, Any]], workflow_id: str
+    ) -> Tuple[Dict[str, Any], Dict[str, Exception]]:
+        """Call all webhooks of a workflow concurrently.
+
+        Returns:
+            Tuple of the responses and the errors, both keyed by webhook path
+        """
+        outcomes = await asyncio.gather(
+            *(
+                self.n8n_service.call_webhook(
+                    webhook_path=webhook.path,
+                    webhook_method=webhook.httpMethod,
+                    data=webhook_inputs[webhook.path],
+                    workflow_id=workflow_id,
+                )
+                for webhook in webhooks
+            ),
+            return_exceptions=True,
+        )
+        responses, errors = {}, {}
+        for webhook, outcome in zip(webhooks, outcomes):
+            if isinstance(outcome, Exception):
+                errors[webhook.path] = outcome
+            else:
+                responses[webhook.path] = outcome
+        return responses, errors
 
     async def step(
         self,
-        save_dir: Path,
         step_name: str,
         prompt: str,
         archive: str = None,
         errors: str = None,
         guidelines: str = None,
+        fitness_cases: int = 0,
+        min_pass_rate: float = 1.0,
+        solutions: str = None,
+        base_workflow: Dict[str, Any] = None,
     ) -> Dict[str, Any]:
         """This is the main step method that orchestrates the entire workflow generation
         and execution process.
 
         Steps:
-            1. generate_workflow
-            2. create_workflow
-            3. get_webhook_input
-            4. activate_workflow
-            5. call_webhook
+            1. generate_workflow: with `base_workflow`, patch it with edit operations
+               and fall back to a full generation if the patch is invalid. A full
+               generation also answers the webhook inputs, which are kept if they
+               carry every field the workflow reads from its webhooks
+            2-6. see `execute_workflow`
+
+        Only workflow defects are raised as `WorkflowExecutionError`; transient n8n or
+        LLM failures are retried and, once exhausted, raised as
+        `UpstreamUnavailableError` so they do not consume an evolution iteration.
         """
 
         # 1. generate_workflow
-        workflow = self.rag_generate_workflow(prompt, archive, errors, guidelines)
+        workflow, fused_inputs, webhook_inputs = None, None, None
+        if base_workflow is not None:
+            try:
+                check_budget("patch_workflow")
+                with timed_stage("patch_workflow"):
+                    workflow = await self.rag_patch_workflow(prompt, base_workflow, errors, guidelines)
+                workflow["name"] = workflow["name"].split("---")[-1]
+            except PatchError as e:
+                logger.warning(f"[Agent] Patch rejected, regenerating the workflow: {e}")
+                emit("error", stage="patch_workflow", message=shorten(e))
+        patched = workflow is not None
+        if workflow is None:
+            check_budget("generate_workflow")
+            with timed_stage("generate_workflow"):
+                workflow, fused_inputs = await self.rag_generate_candidate(
+                    prompt, archive, errors, guidelines, solutions
+                )
+            if fused_inputs is not None:
+                webhook_inputs, problems = validate_webhook_inputs(workflow, fused_inputs)
+                if problems:
+                    logger.warning(f"[Agent] Rejected webhook inputs of the RAG answer, generating them: {problems}")
         workflow["name"] = f"{step_name}---{workflow['name']}"
-        save_path = save_dir / f"{workflow['name']}.json"
-        save_path.write_text(json.dumps(workflow, indent=2))
-        logger.debug(f"[Agent] Saved workflow to {save_path}")
+        emit("workflow_generated", name=workflow["name"], nodes=len(workflow.get("nodes", [])), patched=patched)
 
-        # 2. create_workflow
+        return await self.execute_workflow(
+            workflow, prompt, webhook_inputs=webhook_inputs, fitness_cases=fitness_cases, min_pass_rate=min_pass_rate
+        )
+
+    async def execute_workflow(
+        self,
+        workflow: Dict[str, Any],
+        prompt: str,
+        webhook_inputs: Dict[str, Dict[str, Any]] = None,
+        fitness_cases: int = 0,
+        min_pass_rate: float = 1.0,
+    ) -> Dict[str, Any]:
+        """Deploy a workflow to n8n and run it through its webhooks.
+
+        Steps:
+            2. create_workflow
+            3. get_webhook_input: one input per webhook node, in a single LLM call,
+               for the webhooks without an input in `webhook_inputs`. It only needs
+               the workflow JSON, so it runs concurrently with 2 and 4
+            4. activate_workflow
+            5. call_webhook: all webhooks concurrently
+            6. evaluate_fitness: only with `fitness_cases`, run a synthetic test suite
+               and require a pass rate of at least `min_pass_rate`
+
+        Returns:
+            Dict with the workflow and its n8n ID and name, the webhook inputs and
+            responses keyed by webhook path and the fitness (None when not evaluated)
+        """
+        # Validate locally before deploying anything
         try:
-            created_workflow = await self.n8n_service.create_workflow(workflow, is_webhook=True)
-            logger.info(
-                f'[Agent] Created workflow, "name": "{created_workflow["name"]}", "id": "{created_workflow["id"]}"'
-            )
+            webhooks = self.n8n_service.get_webhooks(workflow)
         except Exception as e:
-            logger.error(f"[Agent] Error creating workflow: {e}")
             raise WorkflowExecutionError(
-                message=f"Error creating workflow: {e}",
-                stage="create_workflow",
+                message=f"Invalid webhook node: {e}",
+                stage="get_webhook_input",
                 workflow=workflow,
                 original_error=e,
             )
-
-        # 3. get_webhook_input
-        try:
-            webhook = self.n8n_service.get_webhooks(created_workflow)[0]  # XXX: Only one webhook is supported for now
-            logger.info(f"[Agent] Got webhook: {webhook}")
-        except IndexError:
+        if not webhooks:
             raise WorkflowExecutionError(
                 message="No webhook found in the workflow",
                 stage="get_webhook_input",
                 workflow=workflow,
             )
-        except Exception as e:
+        problems = validate_workflow(workflow)
+        if problems:
             raise WorkflowExecutionError(
-                message=f"Error getting webhook input: {e}",
-                stage="get_webhook_input",
+                message="Invalid workflow: " + "; ".join(problems),
+                stage="create_workflow",
                 workflow=workflow,
-                original_error=e,
             )
-        webhook_input = self.get_webhook_input(created_workflow)
+        logger.info(f"[Agent] Got webhooks: {webhooks}")
+        check_budget("create_workflow")
+
+        # 2. create_workflow
+        async def create() -> Dict[str, Any]:
+            try:
+                with timed_stage("create_workflow"):
+                    created = await self.n8n_service.create_workflow(workflow, is_webhook=True)
+                count_deployment()
+                logger.info(f'[Agent] Created workflow, "name": "{created["name"]}", "id": "{created["id"]}"')
+                return created
+            except UpstreamUnavailableError:
+                raise
+            except Exception as e:
+                logger.error(f"[Agent] Error creating workflow: {e}")
+                raise WorkflowExecutionError(
+                    message=f"Error creating workflow: {e}",
+                    stage="create_workflow",
+                    workflow=workflow,
+                    original_error=e,
+                )
+
+        # 3. get_webhook_input, needs the workflow JSON only
+        async def get_inputs() -> Dict[str, Dict[str, Any]]:
+            given = webhook_inputs or {}
+            missing = [webhook for webhook in webhooks if webhook.path not in given]
+            if not missing:
+                return {webhook.path: given[webhook.path] for webhook in webhooks}
+            try:
+                with timed_stage("get_webhook_input"):
+                    generated = await self.get_webhook_inputs(workflow, missing)
+                return {webhook.path: given.get(webhook.path, generated.get(webhook.path, {})) for webhook in webhooks}
+            except UpstreamUnavailableError:
+                raise
+            except Exception as e:
+                raise WorkflowExecutionError(
+                    message=f"Error getting webhook input: {e}",
+                    stage="get_webhook_input",
+                    workflow=workflow,
+                    original_error=e,
+                )
 
         # 4. activate_workflow
+        async def activate(created: Dict[str, Any]):
+            # Recorded first, a cancelled activation may still have reached n8n
+            activating.append(created["id"])
+            try:
+                with timed_stage("activate_workflow"):
+                    await self.n8n_service.activate_workflow(created["id"])
+                logger.info(f"[Agent] Activated workflow: {created['id']}")
+            except UpstreamUnavailableError:
+                raise
+            except Exception as e:
+                raise WorkflowExecutionError(
+                    message=f"Error activating workflow: {e}",
+                    stage="activate_workflow",
+                    workflow=workflow,
+                    original_error=e,
+                )
+
+        # Input generation runs alongside create -> activate, the first failure cancels the rest
+        activating: List[str] = []
         try:
-            result = await self.n8n_service.activate_workflow(created_workflow["id"])
-            logger.info(f"[Agent] Activated workflow: {created_workflow['id']}")
-        except Exception as e:
-            raise WorkflowExecutionError(
-                message=f"Error activating workflow: {e}",
-                stage="activate_workflow",
-                workflow=workflow,
-                original_error=e,
+            stages = await run_stage_graph(
+                {
+                    "create_workflow": ((), create),
+                    "get_webhook_input": ((), get_inputs),
+                    "activate_workflow": (("create_workflow",), activate),
+                }
             )
+        except BaseException:
+            if activating:
+                try:
+                    await self.n8n_service.deactivate_workflow(activating[0])
+                    logger.info(f"[Agent] Deactivated workflow: {activating[0]}")
+                except Exception as e:
+                    logger.warning(f"[Agent] Failed to deactivate workflow {activating[0]}: {e}")
+            raise
+        created_workflow = stages["create_workflow"]
+        webhook_inputs = stages["get_webhook_input"]
 
         # 5. call_webhook
-        try:
-            logger.info(
-                f"[Agent] Calling webhook: {created_workflow['id']}, {webhook.path}, {webhook.httpMethod}, {webhook_input}"
-            )
-            response = await self.n8n_service.call_webhook(
-                webhook_path=webhook.path,
-                webhook_method=webhook.httpMethod,
-                data=webhook_input,
-            )
-            logger.info(f"[Agent] Webhook response: {response}")
-        except Exception as e:
+        logger.info(
+            f"[Agent] Calling {len(webhooks)} webhook(s) of workflow {created_workflow['id']}: {webhook_inputs}"
+        )
+        start = time.perf_counter()
+        responses, call_errors = await self.call_webhooks(webhooks, webhook_inputs, created_workflow["id"])
+        if not call_errors:
+            emit("stage_completed", stage="call_webhook", duration_s=round(time.perf_counter() - start, 3))
+        logger.info(f"[Agent] Webhook responses: {responses}")
+        if call_errors:
             await self.n8n_service.deactivate_workflow(created_workflow["id"])
-            logger.error(f"[Agent] Error calling webhook: {e}")
             logger.info(f"[Agent] Deactivated workflow: {created_workflow['name']}")
+            for error in call_errors.values():
+                if isinstance(error, UpstreamUnavailableError):
+                    # Infrastructure failure, not a workflow defect: skip the reflection loop
+                    raise error
+            logger.error(f"[Agent] Error calling webhooks: {call_errors}")
+            message = "\n".join(f"- {path}: {error}" for path, error in call_errors.items())
+            if responses:
+                message += "\nThe other webhooks succeeded:\n" + "\n".join(
+                    f"- {path}: {response}" for path, response in responses.items()
+                )
+            # The HTTP error only says that the workflow broke, its executions say where
+            node_errors = await diagnose_failed_execution(
+                self.n8n_service, created_workflow["id"], workflow, limit=len(call_errors)
+            )
+            if node_errors:
+                message += "\nFailing nodes:\n" + format_node_errors(node_errors)
             raise WorkflowExecutionError(
-                message=f"Error calling webhook: {e}",
+                message=f"Error calling {len(call_errors)} of {len(webhooks)} webhook(s):\n{message}",
                 stage="call_webhook",
                 workflow=workflow,
-                original_error=e,
+                original_error=next(iter(call_errors.values())),
+                node_errors=node_errors,
+            )
+        result = {
+            "workflow": workflow,
+            "workflow_id": created_workflow["id"],
+            "workflow_name": created_workflow["name"],
+            "webhook_inputs": webhook_inputs,
+            "responses": responses,
+            "fitness": None,
+        }
+
+        # 6. evaluate_fitness
+        if fitness_cases:
+            try:
+                with timed_stage("evaluate_fitness"):
+                    result["fitness"] = await self.fitness_evaluator.evaluate(
+                        prompt, created_workflow, webhooks, fitness_cases
+                    )
+            except UpstreamUnavailableError:
+                raise
+            except Exception as e:
+                await self.n8n_service.deactivate_workflow(created_workflow["id"])
+                raise WorkflowExecutionError(
+                    message=f"Error evaluating fitness: {e}",
+                    stage="evaluate_fitness",
+                    workflow=workflow,
+                    original_error=e,
+                )
+            if result["fitness"]["pass_rate"] < min_pass_rate:
+                await self.n8n_service.deactivate_workflow(created_workflow["id"])
+                failed_cases = [case for case in result["fitness"]["cases"] if not case["passed"]]
+                message = "\n".join(f"- {case['name']}: {'; '.join(case['failures'])}" for case in failed_cases)
+                raise WorkflowExecutionError(
+                    message=(
+                        f"Passed {result['fitness']['pass_rate']:.0%} of the synthetic test cases, "
+                        f"{min_pass_rate:.0%} required. Failed cases:\n{message}"
+                    ),
+                    stage="evaluate_fitness",
+                    workflow=workflow,
+                    result=result,
+                )
+        return result
+
+    async def store_solution(self, prompt: str, result: Dict[str, Any]):
+        """Add a successful step result to the solution cache, never failing the
+        run."""
+        try:
+            with stage_context("solution_cache"):
+                await self.solution_cache.add(prompt, result["workflow"], result["webhook_inputs"], result["responses"])
+        except Exception as e:
+            logger.warning(f"[Agent] Failed to cache the solution: {e}")
+
+    async def reuse_solution(
+        self, run_id: str, prompt: str, similarity: float, record: Dict[str, Any], revalidate: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """Answer a request with a cached solution, optionally re-running it on n8n
+        first.
+
+        Returns:
+            The pipeline result, or None if the re-validation failed
+        """
+        result = {
+            "run_id": run_id,
+            "success": True,
+            "iterations": 0,
+            "cached": True,
+            "cache_similarity": similarity,
+            "workflow": record["workflow"],
+            "workflow_id": None,
+            "workflow_name": record["workflow"]["name"],
+            "webhook_inputs": record["webhook_inputs"],
+            "responses": record["responses"],
+            "fitness": None,
+        }
+        if not revalidate:
+            logger.info(f"[Agent] Reusing cached solution {record['id']} (similarity {similarity:.3f})")
+            return result
+
+        workflow = copy.deepcopy(record["workflow"])
+        workflow["name"] = f"{run_id}---cached---{workflow['name'].split('---')[-1]}"
+        try:
+            execution = await self.execute_workflow(workflow, prompt, webhook_inputs=record["webhook_inputs"])
+        except WorkflowExecutionError as e:
+            logger.warning(
+                f"[Agent] Cached solution {record['id']} failed re-validation, evolving instead: {e.message}"
             )
-        return response
+            return None
+        logger.info(f"[Agent] Re-validated cached solution {record['id']} (similarity {similarity:.3f})")
+        return {**result, **execution}
 
-    async def pipeline(self, prompt: str, max_iteration: int = 5) -> Dict[str, Any]:
+    async def pipeline(
+        self,
+        prompt: str,
+        max_iteration: int = 5,
+        fitness_cases: int = 0,
+        min_pass_rate: float = 1.0,
+        use_cache: bool = True,
+        revalidate_cache: bool = True,
+        patch_refinement: bool = True,
+        deadline_s: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        max_deployments: Optional[int] = None,
+        stagnation_limit: int = 2,
+        run_id: str = None,
+    ) -> Dict[str, Any]:
         """This is the main pipeline method that orchestrates the entire workflow
         generation and execution process.
 
         It takes a prompt as input, generates a workflow based on the prompt, creates
         and activates the workflow, prepares the webhook input, and finally calls the
         webhook to execute the workflow.
+
+        With `fitness_cases`, every candidate is also scored on a synthetic test suite
+        and the evolution continues until one reaches `min_pass_rate`. If none does,
+        the best candidate by pass rate, then latency, is returned.
+
+        With `use_cache`, a previously solved request at least
+        `settings.SOLUTION_CACHE_THRESHOLD` similar and naming the same values (URLs,
+        numbers, names) is answered with its cached workflow, re-run on n8n first
+        unless `revalidate_cache` is off. Other solutions seed the RAG context instead.
+
+        With `patch_refinement`, iterations after the first edit the failed workflow
+        with a few operations instead of regenerating it, unless the meta agent
+        proposes a new architecture.
+
+        The run stops early, returning its best candidate or last attempt with a
+        `stop_reason`, once `deadline_s` seconds have passed, `max_tokens` were used
+        or `max_deployments` workflows were created, checked before each stage, or
+        when `stagnation_limit` successive reflections left the workflow unchanged.
+
+        Progress is published as events of the run, see `events.event_bus`. Pass a
+        `run_id` from `new_run_id` to subscribe to them before the run starts.
+
+        The run, its attempts, result, log and LLM usage are recorded in the run
+        store.
+
+        Returns:
+            Dict with the run ID, whether the run succeeded, the number of iterations
+            used, whether it was served from the cache, the workflow and its n8n ID
+            and name, the webhook inputs and responses keyed by webhook path, the
+            fitness, the reason the run stopped early (None otherwise) and the token
+            and cost totals
         """
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        save_dir = cache_dir / timestamp
-        save_dir.mkdir(parents=True, exist_ok=True)
-
-        with log_context(save_dir / "log.log"):
-            msg_list = [
-                SystemMessage(content=get_system_prompt()),
-                HumanMessage(content=prompt),
-            ]
-            error_msg = None
-            archives = []
-            for idx_iter in range(max_iteration):
-                try:
-                    logger.info(f"[Agent] Iteration {idx_iter + 1} of {max_iteration}")
-                    logger.info("[Agent] Meta agent invoking...")
-                    logger.debug(f"[Agent] Meta agent prompt:\n{msg_list}")
-                    response_meta = self.agent_meta.invoke(msg_list).content
-                    msg_list.append(AIMessage(content=response_meta))
-
-                    logger.info("[Agent] RAG agent invoking...")
-                    response_rag = await self.step(
-                        save_dir=save_dir,
-                        step_name=f"{timestamp}---{idx_iter + 1:02d}",
-                        prompt=prompt,
-                        archive="\n".join(archives),
-                        errors=error_msg if error_msg else "",
-                        guidelines=json.loads(response_meta)["guidelines"],
+        run_id = run_id or new_run_id()
+        budget_params = {"deadline_s": deadline_s, "max_tokens": max_tokens, "max_deployments": max_deployments}
+        params = {
+            "max_iteration": max_iteration,
+            "fitness_cases": fitness_cases,
+            "min_pass_rate": min_pass_rate,
+            "use_cache": use_cache,
+            "revalidate_cache": revalidate_cache,
+            "patch_refinement": patch_refinement,
+            "stagnation_limit": stagnation_limit,
+        }
+        await asyncio.to_thread(self.run_store.start_run, run_id, prompt, {**params, **budget_params})
+
+        status, result, error = "failed", None, None
+        event_bus.open(run_id)
+        with run_context(run_id), budget_context(RunBudget(**budget_params)):
+            self.run_logs.open(run_id)
+            emit("run_started", max_iteration=max_iteration)
+            try:
+                result = await self.evolve(run_id, prompt, **params)
+                status = "cached" if result["cached"] else "success" if result["success"] else "partial"
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                usage = usage_ledger.pop(run_id)
+                await asyncio.to_thread(self.run_store.add_usage, run_id, usage)
+                if result is not None:
+                    result["usage"] = summarize_usage(usage)
+                    logger.info(
+                        f"[Agent] Run used {result['usage']['input_tokens']} input "
+                        f"({result['usage']['cached_tokens']} cached) and "
+                        f"{result['usage']['output_tokens']} output tokens, ${result['usage']['cost']:.4f}"
                     )
-                    return response_rag
-                except WorkflowExecutionError as e:
-                    # logger.error(f"[Agent] Error in step: {e}")
-                    # logger.error("[Agent] Retrying with new prompt...")
-                    archive = json.dumps(e.workflow, indent=2)
-                    archives.append(archive)
-                    error_msg = get_error_msg(e.stage, e.message)
-                    msg_list.append(HumanMessage(content=get_reflection_prompt(archive, error_msg)))
-
-            raise Exception("Failed to generate workflow")
+                log = self.run_logs.close(run_id)
+                await asyncio.to_thread(self.run_store.finish_run, run_id, status, result, log, error)
+                emit(
+                    "done",
+                    status=status,
+                    success=bool(result and result["success"]),
+                    iterations=result["iterations"] if result else None,
+                    workflow_id=result["workflow_id"] if result else None,
+                    stop_reason=result.get("stop_reason") if result else None,
+                    error=shorten(error) if error else None,
+                )
+        return result
+
+    async def evolve(
+        self,
+        run_id: str,
+        prompt: str,
+        max_iteration: int = 5,
+        fitness_cases: int = 0,
+        min_pass_rate: float = 1.0,
+        use_cache: bool = True,
+        revalidate_cache: bool = True,
+        patch_refinement: bool = True,
+        stagnation_limit: int = 2,
+    ) -> Dict[str, Any]:
+        """The evolution loop of `pipeline`, see there for the arguments."""
+        solutions = None
+        if use_cache:
+            try:
+                with stage_context("solution_cache"):
+                    matches = await self.solution_cache.lookup(prompt, k=settings.SOLUTION_CACHE_SEED_K)
+            except Exception as e:
+                logger.warning(f"[Agent] Solution cache lookup failed: {e}")
+                matches = []
+            if matches and matches[0][0] >= settings.SOLUTION_CACHE_THRESHOLD:
+                if not same_parameters(prompt, matches[0][1]["prompt"]):
+                    logger.info(f"[Agent] Cached solution {matches[0][1]['id']} has other parameters, seeding instead")
+                else:
+                    cached_result = await self.reuse_solution(run_id, prompt, *matches[0], revalidate=revalidate_cache)
+                    if cached_result is not None:
+                        emit(
+                            "cache_hit",
+                            similarity=round(matches[0][0], 4),
+                            workflow_name=cached_result["workflow_name"],
+                        )
+                        return cached_result
+            solutions = format_solutions(matches)
+
+        msg_list = [
+            SystemMessage(content=get_system_prompt()),
+            HumanMessage(content=prompt),
+        ]
+        error_msg = None
+        archives = []
+        best_result = None
+        previous_workflow = None
+        iterations, unchanged, stop_reason, stop_message = 0, 0, None, None
+        for idx_iter in range(max_iteration):
+            iteration_var.set(idx_iter + 1)
+            emit("iteration_started", iteration=idx_iter + 1, max_iteration=max_iteration)
+            try:
+                check_budget("reflect")
+                iterations = idx_iter + 1
+                logger.info(f"[Agent] Iteration {idx_iter + 1} of {max_iteration}")
+                logger.info("[Agent] Meta agent invoking...")
+                logger.debug(f"[Agent] Meta agent prompt:\n{msg_list}")
+                with stage_context("reflect"):
+                    response_meta = (await self.agent_meta.ainvoke(msg_list)).content
+                msg_list.append(AIMessage(content=response_meta))
+                response_meta = json.loads(response_meta)
+
+                # Edit the failed workflow unless the meta agent proposes a new architecture
+                base_workflow = None
+                if patch_refinement and previous_workflow and response_meta.get("mode") != "regenerate":
+                    base_workflow = previous_workflow
+                emit(
+                    "guideline_ready",
+                    mode="patch" if base_workflow else "generate",
+                    guidelines=shorten(response_meta["guidelines"]),
+                )
+
+                logger.info("[Agent] RAG agent invoking...")
+                response_rag = await self.step(
+                    step_name=f"{run_id}---{idx_iter + 1:02d}",
+                    prompt=prompt,
+                    archive="\n".join(archives),
+                    errors=error_msg if error_msg else "",
+                    guidelines=response_meta["guidelines"],
+                    fitness_cases=fitness_cases,
+                    min_pass_rate=min_pass_rate,
+                    solutions=solutions,
+                    base_workflow=base_workflow,
+                )
+                await asyncio.to_thread(self.run_store.add_attempt, run_id, idx_iter + 1, response_rag["workflow"])
+                if use_cache:
+                    await self.store_solution(prompt, response_rag)
+                return {
+                    "run_id": run_id,
+                    "success": True,
+                    "iterations": idx_iter + 1,
+                    "cached": False,
+                    "stop_reason": None,
+                    **response_rag,
+                }
+            except BudgetExceededError as e:
+                stop_reason, stop_message = e.reason, str(e)
+                break
+            except WorkflowExecutionError as e:
+                emit("error", stage=e.stage, message=shorten(e.message))
+                await asyncio.to_thread(
+                    self.run_store.add_attempt, run_id, idx_iter + 1, e.workflow, stage=e.stage, error=e.message
+                )
+                if e.result and (
+                    best_result is None or fitness_key(e.result["fitness"]) > fitness_key(best_result["fitness"])
+                ):
+                    best_result = e.result
+                # logger.error(f"[Agent] Error in step: {e}")
+                # logger.error("[Agent] Retrying with new prompt...")
+                if previous_workflow and workflow_fingerprint(e.workflow) == workflow_fingerprint(previous_workflow):
+                    unchanged += 1
+                else:
+                    unchanged = 0
+                previous_workflow = e.workflow
+                archive = encode_workflow(e.workflow) if e.workflow else "null"
+                archives.append(archive)
+                error_msg = get_error_msg(e.stage, e.message)
+                msg_list.append(HumanMessage(content=get_reflection_prompt(archive, error_msg)))
+                if stagnation_limit and unchanged >= stagnation_limit:
+                    stop_reason = "stagnation"
+                    stop_message = f"The workflow did not change in {unchanged} successive reflection(s)"
+                    break
+
+        if stop_reason is not None:
+            logger.warning(f"[Agent] Stopping after {iterations} iteration(s): {stop_message}")
+            emit("stopped", reason=stop_reason, message=shorten(stop_message))
+        partial = {"run_id": run_id, "success": False, "iterations": iterations, "cached": False}
+        partial["stop_reason"] = stop_reason or "max_iteration"
+        if best_result is not None:
+            logger.warning(f"[Agent] No candidate reached the pass rate, returning {best_result['workflow_name']}")
+            return {**partial, **best_result}
+        if stop_reason is not None:
+            # Best effort: the last attempt and why it failed
+            return {
+                **partial,
+                "workflow": previous_workflow,
+                "workflow_id": None,
+                "workflow_name": previous_workflow.get("name") if previous_workflow else None,
+                "webhook_inputs": None,
+                "responses": None,
+                "fitness": None,
+                "stop_message": stop_message,
+                "error": error_msg,
+            }
+        raise Exception("Failed to generate workflow")
 
 
 if __name__ == "__main__":
-    import asyncio
 
     async def main():
         agent = Agent()
@@ -0,0 +1,146 @@
+"""Near-duplicate detection of workflow templates.
+
+Templates scraped from several sources are often variants of one workflow with other
+names, credentials or parameter values. Each workflow is fingerprinted by the
+multiset of its node types and the typed edges between them, and similar fingerprints
+are found with MinHash and LSH banding, then confirmed by their estimated Jaccard
+similarity. Only one canonical template per cluster needs to be indexed.
+
+Usage:
+    python -m evolve_agent.agents.dedup [templates_dir] [--threshold 0.8]
+"""
+
+import hashlib
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Set
+
+import numpy as np
+
+# Mersenne prime of the universal hash family, small enough for uint64 products
+_PRIME = (1 << 31) - 1
+
+
+def workflow_features(workflow: Dict[str, Any]) -> Set[str]:
+    """Structural features of a workflow: its node types and typed edges, each
+    numbered by occurrence so the sets compare multisets."""
+    types = {node.get("name"): node.get("type", "") for node in workflow.get("nodes", [])}
+    features = [f"node:{node_type}" for node_type in types.values() if node_type != "n8n-nodes-base.stickyNote"]
+    for source, outputs in (workflow.get("connections") or {}).items():
+        for connection_type, branches in (outputs or {}).items():
+            for branch in branches or []:
+                for target in branch or []:
+                    features.append(f"edge:{types.get(source)}>{types.get(target.get('node'))}:{connection_type}")
+    counts = Counter()
+    numbered = set()
+    for feature in features:
+        counts[feature] += 1
+        numbered.add(f"{feature}#{counts[feature]}")
+    return numbered
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, features: Set[str]) -> np.ndarray:
+        """MinHash signature of a feature set, all maximal for an empty set."""
+        if not features:
+            return np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(f.encode(), digest_size=4).digest(), "big") for f in features],
+            dtype=np.uint64,
+        )
+        return ((np.outer(hashes, self.a) + self.b) % _PRIME).min(axis=0)
+
+
+def estimated_jaccard(first: np.ndarray, second: np.ndarray) -> float:
+    return float(np.mean(first == second))
+
+
+def cluster_templates(
+    workflows: Dict[str, Dict[str, Any]], threshold: float = 0.8, num_perm: int = 128, bands: int = 16
+) -> List[Dict[str, Any]]:
+    """Cluster near-duplicate workflows.
+
+    Args:
+        workflows: Workflows by name, e.g. their file name
+        threshold: Estimated Jaccard similarity from which two workflows are duplicates
+        num_perm: Length of the MinHash signatures
+        bands: LSH bands of `num_perm // bands` rows, more bands find less similar
+            candidate pairs
+
+    Returns:
+        Clusters as dicts with the "canonical" workflow name, the medoid of the
+        cluster, and all its "members", singletons included, in a stable order
+    """
+    names = sorted(workflows)
+    hasher = MinHasher(num_perm)
+    features = {name: workflow_features(workflows[name]) for name in names}
+    signatures = {name: hasher.signature(features[name]) for name in names}
+
+    rows = num_perm // bands
+    buckets: Dict[tuple, List[str]] = defaultdict(list)
+    # Workflows without nodes are not duplicates of each other
+    for name in filter(features.get, names):
+        for band in range(bands):
+            buckets[(band, signatures[name][band * rows : (band + 1) * rows].tobytes())].append(name)
+
+    parent = {name: name for name in names}
+
+    def find(name: str) -> str:
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    checked = set()
+    for bucket in buckets.values():
+        for i, first in enumerate(bucket):
+            for second in bucket[i + 1 :]:
+                if (first, second) in checked:
+                    continue
+                checked.add((first, second))
+                if estimated_jaccard(signatures[first], signatures[second]) >= threshold:
+                    parent[find(second)] = find(first)
+
+    members: Dict[str, List[str]] = defaultdict(list)
+    for name in names:
+        members[find(name)].append(name)
+
+    clusters = []
+    for group in members.values():
+        canonical = max(
+            group,
+            key=lambda name: (
+                sum(estimated_jaccard(signatures[name], signatures[other]) for other in group),
+                -names.index(name),
+            ),
+        )
+        clusters.append({"canonical": canonical, "members": group})
+    return sorted(clusters, key=lambda cluster: cluster["canonical"])
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description="Report near-duplicate workflow templates")
+    parser.add_argument(
+        "templates_dir", nargs="?", type=Path, default=Path(__file__).parent.parent / "templates" / "dataset"
+    )
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    templates = {}
+    for path in sorted(args.templates_dir.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            templates[path.name] = json.load(f)
+    clusters = cluster_templates(templates, threshold=args.threshold)
+    for cluster in clusters:
+        if len(cluster["members"]) > 1:
+            print(f"{cluster['canonical']}: {', '.join(m for m in cluster['members'] if m != cluster['canonical'])}")
+    print(f"{len(templates)} templates, {len(clusters)} after deduplication")
@@ -0,0 +1,110 @@
+"""Node-level diagnosis of failed n8n executions.
+
+A failing webhook call only tells that the workflow broke, e.g. "500 Internal Server
+Error". The execution saved by n8n tells which node broke and why, which is what the
+reflection needs to fix the workflow in one iteration instead of guessing.
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, List
+
+from loguru import logger
+
+from ..app.services.n8n_service import N8nService
+
+# Error executions are saved when the execution ends, possibly after the webhook answered
+FETCH_ATTEMPTS = 3
+FETCH_DELAY = 0.5
+
+MAX_NODE_ERRORS = 3
+MAX_PARAMETERS_LENGTH = 600
+MAX_MESSAGE_LENGTH = 400
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def extract_node_errors(execution: Dict[str, Any], workflow: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Extract the failing nodes of an n8n execution.
+
+    Args:
+        execution: Execution fetched with its data
+        workflow: The executed workflow, for the parameters of the failing nodes
+
+    Returns:
+        List of dicts with the node name, type, parameters, error message and
+        description, the node that stopped the execution first
+    """
+    result_data = ((execution or {}).get("data") or {}).get("resultData") or {}
+    nodes = {node.get("name"): node for node in workflow.get("nodes", [])}
+
+    failures = []
+    top_error = result_data.get("error")
+    if top_error:
+        node_name = (top_error.get("node") or {}).get("name") or result_data.get("lastNodeExecuted")
+        failures.append((node_name, top_error))
+    for node_name, runs in (result_data.get("runData") or {}).items():
+        for run in runs or []:
+            if run.get("error"):
+                failures.append((node_name, run["error"]))
+
+    errors, seen = [], set()
+    for node_name, error in failures:
+        message = str(error.get("message") or "Unknown error")
+        if (node_name, message) in seen:
+            continue
+        seen.add((node_name, message))
+        node = nodes.get(node_name) or error.get("node") or {}
+        errors.append(
+            {
+                "node": node_name,
+                "type": node.get("type"),
+                "parameters": node.get("parameters", {}),
+                "message": message,
+                "description": error.get("description"),
+                "http_code": error.get("httpCode"),
+            }
+        )
+    return errors[:MAX_NODE_ERRORS]
+
+
+def format_node_errors(errors: List[Dict[str, Any]]) -> str:
+    """Format node errors compactly for the reflection prompt."""
+    lines = []
+    for error in errors:
+        message = error["message"]
+        if error.get("http_code"):
+            message = f"[HTTP {error['http_code']}] {message}"
+        lines.append(f'- Node "{error["node"]}" ({error["type"]}): {_truncate(message, MAX_MESSAGE_LENGTH)}')
+        if error.get("description"):
+            lines.append(f"  Details: {_truncate(str(error['description']), MAX_MESSAGE_LENGTH)}")
+        parameters = json.dumps(error["parameters"], separators=(",", ":"), ensure_ascii=False)
+        lines.append(f"  Parameters: {_truncate(parameters, MAX_PARAMETERS_LENGTH)}")
+    return "\n".join(lines)
+
+
+async def diagnose_failed_execution(
+    n8n_service: N8nService, workflow_id: str, workflow: Dict[str, Any], limit: int = 1
+) -> List[Dict[str, Any]]:
+    """Fetch the latest failed executions of a workflow and extract their failing
+    nodes, an empty list if there are none or they cannot be fetched."""
+    for attempt in range(FETCH_ATTEMPTS):
+        try:
+            executions = await n8n_service.get_workflow_executions(
+                workflow_id, status="error", limit=limit, include_data=True
+            )
+        except Exception as e:
+            logger.warning(f"[Diagnostics] Could not fetch the executions of workflow {workflow_id}: {e}")
+            return []
+        if executions:
+            errors = []
+            for execution in executions:
+                errors.extend(extract_node_errors(execution, workflow))
+            logger.info(f"[Diagnostics] Failing nodes of workflow {workflow_id}: {[e['node'] for e in errors]}")
+            return errors[:MAX_NODE_ERRORS]
+        if attempt < FETCH_ATTEMPTS - 1:
+            await asyncio.sleep(FETCH_DELAY)
+    logger.info(f"[Diagnostics] No failed execution saved for workflow {workflow_id}")
+    return []
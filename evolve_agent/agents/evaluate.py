@@ -0,0 +1,257 @@
+"""Batch evaluation of `Agent.pipeline` over a prompt set and a matrix of configurations.
+
+Usage:
+    python -m evolve_agent.agents.evaluate prompts.jsonl \
+        --models openai/gpt-4o --temperatures 0.2 0.5 --max-iterations 3 5 --k 3 \
+        --concurrency 4 --output logs/eval/results.jsonl
+
+Each line of the prompts file is either a JSON object with a "prompt" key (and an
+optional "id") or a bare JSON string.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import get_usage_metadata_callback
+from loguru import logger
+
+from ..app.config import data_dir
+from .core import Agent
+
+eval_dir = data_dir / "eval"
+
+
+def load_prompts(path: Path) -> List[Dict[str, str]]:
+    """Load prompts from a JSONL file.
+
+    Args:
+        path: Path to the JSONL file
+
+    Returns:
+        List of dicts with "id" and "prompt" keys
+    """
+    prompts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"prompt": item}
+            if "prompt" not in item:
+                raise ValueError(f"Line {line_no} of {path} has no 'prompt' key")
+            prompts.append({"id": str(item.get("id", line_no)), "prompt": item["prompt"]})
+    return prompts
+
+
+def expand_matrix(
+    models: List[str], temperatures: List[float], max_iterations: List[int], ks: List[int]
+) -> List[Dict[str, Any]]:
+    """Expand the configuration axes into the list of all combinations."""
+    return [
+        {"model_id": model_id, "temperature": temperature, "max_iteration": max_iteration, "k": k}
+        for model_id, temperature, max_iteration, k in itertools.product(models, temperatures, max_iterations, ks)
+    ]
+
+
+def config_key(config: Dict[str, Any]) -> str:
+    return f"{config['model_id']}|t={config['temperature']}|iter={config['max_iteration']}|k={config['k']}"
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Percentile with linear interpolation between closest ranks, `q` in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Aggregate run records into per-configuration statistics.
+
+    Args:
+        records: Records as produced by `run_one`
+
+    Returns:
+        Dict mapping the configuration key to its aggregate statistics
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        groups.setdefault(config_key(record["config"]), []).append(record)
+
+    summary = {}
+    for key, group in groups.items():
+        successes = [r for r in group if r["success"]]
+        iterations = [r["iterations"] for r in successes]
+        latencies = [r["latency_s"] for r in group]
+        total_tokens = [r["total_tokens"] for r in group]
+        pass_rates = [r["pass_rate"] for r in group if r.get("pass_rate") is not None]
+        summary[key] = {
+            "runs": len(group),
+            "success_rate": len(successes) / len(group),
+            "mean_pass_rate": statistics.mean(pass_rates) if pass_rates else None,
+            "iterations_to_success": {
+                "mean": statistics.mean(iterations) if iterations else None,
+                "median": statistics.median(iterations) if iterations else None,
+            },
+            "tokens": {
+                "input": sum(r["input_tokens"] for r in group),
+                "output": sum(r["output_tokens"] for r in group),
+                "total": sum(total_tokens),
+                "mean_per_run": statistics.mean(total_tokens),
+            },
+            "cost": sum(r["cost"] for r in group if r.get("cost") is not None),
+            "latency_s": {
+                "mean": statistics.mean(latencies),
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p99": percentile(latencies, 99),
+            },
+        }
+    return summary
+
+
+async def run_one(
+    agent: Agent,
+    config: Dict[str, Any],
+    item: Dict[str, str],
+    semaphore: asyncio.Semaphore,
+    fitness_cases: int = 0,
+    use_cache: bool = False,
+) -> Dict[str, Any]:
+    """Run the pipeline for one prompt under one configuration and record the
+    outcome."""
+    async with semaphore:
+        record = {
+            "prompt_id": item["id"],
+            "prompt": item["prompt"],
+            "config": config,
+            "run_id": None,
+            "success": False,
+            "iterations": config["max_iteration"],
+            "pass_rate": None,
+            "cost": None,
+            "error": None,
+        }
+        start = time.perf_counter()
+        # The usage callback lives in a contextvar, so each task only sees its own calls
+        with get_usage_metadata_callback() as usage_callback:
+            try:
+                result = await agent.pipeline(
+                    item["prompt"], config["max_iteration"], fitness_cases=fitness_cases, use_cache=use_cache
+                )
+                record.update(run_id=result["run_id"], success=result["success"], iterations=result["iterations"])
+                if result["fitness"]:
+                    record["pass_rate"] = result["fitness"]["pass_rate"]
+                if result.get("usage"):
+                    record["cost"] = result["usage"]["cost"]
+            except Exception as e:
+                logger.error(f"[Eval] Prompt {item['id']} failed with {config_key(config)}: {e}")
+                record["error"] = str(e)
+        record["latency_s"] = time.perf_counter() - start
+
+        usage = usage_callback.usage_metadata.values()
+        record["input_tokens"] = sum(u.get("input_tokens", 0) for u in usage)
+        record["output_tokens"] = sum(u.get("output_tokens", 0) for u in usage)
+        record["total_tokens"] = sum(u.get("total_tokens", 0) for u in usage)
+        return record
+
+
+async def evaluate(
+    prompts: List[Dict[str, str]],
+    configs: List[Dict[str, Any]],
+    output_path: Path,
+    concurrency: int = 4,
+    fitness_cases: int = 0,
+    use_cache: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    """Run every prompt under every configuration, streaming records to
+    `output_path`.
+
+    Args:
+        prompts: Prompts as returned by `load_prompts`
+        configs: Configurations as returned by `expand_matrix`
+        output_path: JSONL file receiving one record per finished run
+        concurrency: Maximum number of pipelines running at the same time
+        fitness_cases: Number of synthetic test cases scoring each run, 0 to disable
+        use_cache: Answer prompts from the solution cache, which earlier runs and
+            configurations fill, instead of measuring every run from scratch
+
+    Returns:
+        Aggregate statistics per configuration
+    """
+    # max_iteration is a pipeline argument, so configurations differing only in it share an agent
+    agents: Dict[Tuple[str, float, int], Agent] = {}
+    for config in configs:
+        agent_key = (config["model_id"], config["temperature"], config["k"])
+        if agent_key not in agents:
+            agents[agent_key] = Agent(model_id=config["model_id"], temperature=config["temperature"], k=config["k"])
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [
+        run_one(
+            agents[(config["model_id"], config["temperature"], config["k"])],
+            config,
+            item,
+            semaphore,
+            fitness_cases,
+            use_cache,
+        )
+        for config in configs
+        for item in prompts
+    ]
+    logger.info(f"[Eval] Running {len(tasks)} pipelines with concurrency {concurrency}")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    records = []
+    with open(output_path, "w", encoding="utf-8") as f:
+        for future in asyncio.as_completed(tasks):
+            record = await future
+            records.append(record)
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            logger.info(f"[Eval] {len(records)}/{len(tasks)} done")
+    return summarize(records)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Batch evaluation of the EvolveAgent pipeline")
+    parser.add_argument("prompts", type=Path, help="JSONL file of prompts")
+    parser.add_argument("--models", nargs="+", default=["openai/gpt-4o"], help="Model IDs to evaluate")
+    parser.add_argument("--temperatures", nargs="+", type=float, default=[0.2], help="RAG agent temperatures")
+    parser.add_argument("--max-iterations", nargs="+", type=int, default=[5], help="Pipeline iteration limits")
+    parser.add_argument("--k", nargs="+", type=int, default=[3], help="Number of retrieved template chunks")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum concurrent pipelines")
+    parser.add_argument("--fitness-cases", type=int, default=0, help="Synthetic test cases per run, 0 to disable")
+    parser.add_argument(
+        "--use-cache", action="store_true", help="Answer prompts solved by earlier runs from the solution cache"
+    )
+    parser.add_argument("--output", type=Path, default=eval_dir / "results.jsonl", help="JSONL results file")
+    parser.add_argument("--summary", type=Path, default=None, help="Optional JSON file for the summary")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    prompts = load_prompts(args.prompts)
+    configs = expand_matrix(args.models, args.temperatures, args.max_iterations, args.k)
+    summary = asyncio.run(evaluate(prompts, configs, args.output, args.concurrency, args.fitness_cases, args.use_cache))
+    summary_text = json.dumps(summary, indent=2)
+    if args.summary:
+        args.summary.parent.mkdir(parents=True, exist_ok=True)
+        args.summary.write_text(summary_text)
+    print(summary_text)
+
+
+if __name__ == "__main__":
+    main()
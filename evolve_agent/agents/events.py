@@ -0,0 +1,127 @@
+"""Structured progress events of pipeline runs, streamed to clients as Server-Sent
+Events.
+
+Events are published to the run of the calling task (see `run_id_var`). Each run keeps
+its history, so a client connecting after the run started, or reconnecting with
+`Last-Event-ID`, receives the events it missed.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from .context import run_id_var
+
+# Finished runs whose events are kept for late subscribers
+MAX_FINISHED_RUNS = 256
+MAX_EVENTS_PER_RUN = 1000
+HEARTBEAT_INTERVAL = 15.0
+MAX_TEXT_LENGTH = 300
+
+
+def shorten(text: Any, limit: int = MAX_TEXT_LENGTH) -> str:
+    """Keep event payloads small."""
+    text = str(text)
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+class _RunChannel:
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.subscribers: List[asyncio.Queue] = []
+        self.next_id = 1
+        self.done = False
+
+
+class RunEventBus:
+    """Process-wide publish/subscribe of run events."""
+
+    def __init__(self):
+        self.channels: OrderedDict = OrderedDict()  # run_id -> _RunChannel
+        # Called with the run ID and every published event, e.g. to forward the events
+        # of a worker process to the app
+        self.listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+    def open(self, run_id: str):
+        """Create the channel of a run, so subscribers can wait for its first event."""
+        if run_id not in self.channels:
+            self.channels[run_id] = _RunChannel()
+
+    def publish(self, event_type: str, run_id: Optional[str] = None, **data: Any):
+        """Publish an event to `run_id`, by default the run of the calling task.
+
+        A "done" event closes the run.
+        """
+        run_id = run_id or run_id_var.get()
+        if run_id is None:
+            return
+        self.open(run_id)
+        channel = self.channels[run_id]
+        event = {"id": channel.next_id, "type": event_type, "time": time.time(), "data": data}
+        channel.next_id += 1
+        if len(channel.events) < MAX_EVENTS_PER_RUN or event_type == "done":
+            channel.events.append(event)
+        for queue in channel.subscribers:
+            queue.put_nowait(event)
+        for listener in self.listeners:
+            listener(run_id, event)
+        if event_type == "done":
+            channel.done = True
+            self.channels.move_to_end(run_id)
+            finished = [key for key, c in self.channels.items() if c.done and not c.subscribers]
+            for key in finished[: max(0, len(finished) - MAX_FINISHED_RUNS)]:
+                del self.channels[key]
+
+    def has_run(self, run_id: str) -> bool:
+        return run_id in self.channels
+
+    async def subscribe(self, run_id: str, last_event_id: int = 0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield the events of a run after `last_event_id` until it is done, and None
+        every `HEARTBEAT_INTERVAL` seconds without events."""
+        self.open(run_id)
+        channel = self.channels[run_id]
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in channel.events:
+            queue.put_nowait(event)
+        channel.subscribers.append(queue)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event["id"] <= last_event_id:
+                    continue
+                yield event
+                if event["type"] == "done":
+                    return
+        finally:
+            channel.subscribers.remove(queue)
+
+
+event_bus = RunEventBus()
+
+
+def emit(event_type: str, **data: Any):
+    """Publish an event to the run of the calling task."""
+    event_bus.publish(event_type, **data)
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """Emit a stage_completed event with the duration of the block if it succeeds."""
+    start = time.perf_counter()
+    yield
+    emit("stage_completed", stage=stage, duration_s=round(time.perf_counter() - start, 3))
+
+
+def format_sse(event: Optional[Dict[str, Any]]) -> str:
+    """Format an event as a Server-Sent Event, None as a heartbeat comment."""
+    if event is None:
+        return ": heartbeat\n\n"
+    payload = json.dumps({"time": event["time"], **event["data"]}, default=str)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
@@ -0,0 +1,226 @@
+import asyncio
+import datetime
+import json
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from ..app.schemas.workflow import WebhookNodeParameters
+from ..app.services.n8n_service import N8nService
+from ..app.services.resilience import UpstreamUnavailableError
+from .context import stage_context
+from .prompt import escape_template
+
+_MISSING = object()
+
+
+def resolve_path(data: Any, path: str) -> Any:
+    """Resolve a dotted path such as "items.0.name" in a JSON response, `_MISSING` if
+    absent.
+
+    An empty path designates the whole response.
+    """
+    if not path:
+        return data
+    for key in path.split("."):
+        if isinstance(data, dict) and key in data:
+            data = data[key]
+        elif isinstance(data, list) and key.isdigit() and int(key) < len(data):
+            data = data[int(key)]
+        else:
+            return _MISSING
+    return data
+
+
+_TYPES = {"string": str, "number": (int, float), "boolean": bool, "object": dict, "array": list}
+
+
+def check_expectation(response: Any, expectation: Dict[str, Any]) -> Optional[str]:
+    """Check one expected-output predicate against a webhook response.
+
+    Supported operators: exists, not_empty, equals, contains, type.
+
+    Returns:
+        None if the predicate holds, otherwise a short description of the failure
+    """
+    path = expectation.get("path", "")
+    op = expectation.get("op", "exists")
+    expected = expectation.get("value")
+    value = resolve_path(response, path)
+
+    if value is _MISSING:
+        return f"'{path}' is missing"
+    if op == "exists":
+        return None
+    if op == "not_empty":
+        return None if value not in (None, "", [], {}) else f"'{path}' is empty"
+    if op == "equals":
+        return None if value == expected else f"'{path}' is {value!r}, expected {expected!r}"
+    if op == "contains":
+        if isinstance(value, str) and isinstance(expected, str):
+            ok = expected.lower() in value.lower()
+        else:
+            ok = isinstance(value, (list, dict, str)) and expected in value
+        return None if ok else f"'{path}' does not contain {expected!r}"
+    if op == "type":
+        expected_type = _TYPES.get(expected)
+        if expected_type is None:
+            return f"unknown type {expected!r}"
+        ok = isinstance(value, expected_type) and not (expected != "boolean" and isinstance(value, bool))
+        return None if ok else f"'{path}' is {type(value).__name__}, expected {expected}"
+    return f"unknown operator {op!r}"
+
+
+def _execution_duration(execution: Dict[str, Any]) -> Optional[float]:
+    try:
+        started = datetime.datetime.fromisoformat(execution["startedAt"].replace("Z", "+00:00"))
+        stopped = datetime.datetime.fromisoformat(execution["stoppedAt"].replace("Z", "+00:00"))
+    except (KeyError, TypeError, AttributeError, ValueError):
+        return None
+    return (stopped - started).total_seconds()
+
+
+def _latency_stats(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "mean": statistics.mean(values) if values else None,
+        "max": max(values) if values else None,
+    }
+
+
+class FitnessEvaluator:
+    """Measure the correctness and speed of an activated workflow on a suite of
+    synthetic test cases."""
+
+    def __init__(self, model, n8n_service: N8nService, concurrency: int = 8):
+        """
+        Args:
+            model: JSON-mode chat model generating the test cases, e.g. a `ModelRouter`
+                retrying its transient errors
+            n8n_service: Service used to call the webhooks and fetch executions
+            concurrency: Maximum number of test cases running at the same time
+        """
+        self.model = model
+        self.n8n_service = n8n_service
+        self.concurrency = concurrency
+
+    async def generate_cases(
+        self, prompt: str, workflow: Dict[str, Any], webhooks: List[WebhookNodeParameters], n_cases: int
+    ) -> List[Dict[str, Any]]:
+        """Generate `n_cases` synthetic inputs with expected-output predicates in a
+        single LLM call."""
+        webhook_list = "\n".join(f"- path: {webhook.path}, method: {webhook.httpMethod.value}" for webhook in webhooks)
+        case_prompt = f"""
+        You are an expert at testing n8n workflows.
+        Each test case gives the webhook path, the input body and expectations on the JSON response.
+        An expectation has a dotted "path" into the response ("" for the whole response), an "op" among
+        "exists", "not_empty", "equals", "contains", "type", and a "value" for "equals", "contains" and
+        "type" (one of "string", "number", "boolean", "object", "array").
+        Only expect what the request guarantees, do not guess free-form texts.
+
+        Make sure to return in a WELL-FORMED JSON object like:
+        {{"cases": [{{"name": "...", "webhook": "<path>", "input": {{...}}, "expectations": [{{"path": "...", "op": "...", "value": ...}}]}}]}}
+
+        The workflow below was built for the following request:
+        {prompt}
+
+        Workflow:
+        {escape_template(workflow)}
+
+        Its webhooks are:
+        {webhook_list}
+
+        Write {n_cases} diverse test cases checking that the workflow fulfils the request.
+        """
+        with stage_context("evaluate_fitness"):
+            response = (await self.model.ainvoke(case_prompt)).content
+        paths = {webhook.path for webhook in webhooks}
+        cases = []
+        for case in json.loads(response).get("cases", [])[:n_cases]:
+            if case.get("webhook") not in paths:
+                if len(paths) > 1:
+                    logger.warning(f"[Fitness] Dropping case for unknown webhook: {case.get('webhook')}")
+                    continue
+                case["webhook"] = webhooks[0].path
+            case.setdefault("name", f"case-{len(cases) + 1}")
+            case.setdefault("input", {})
+            case.setdefault("expectations", [])
+            cases.append(case)
+        return cases
+
+    async def run_case(
+        self, case: Dict[str, Any], webhook: WebhookNodeParameters, workflow_id: str, semaphore: asyncio.Semaphore
+    ) -> Dict[str, Any]:
+        """Call the webhook of a workflow with the case input and check its expectations."""
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await self.n8n_service.call_webhook(
+                    webhook_path=webhook.path,
+                    webhook_method=webhook.httpMethod,
+                    data=case["input"],
+                    workflow_id=workflow_id,
+                )
+            except UpstreamUnavailableError:
+                raise
+            except Exception as e:
+                return {
+                    "name": case["name"],
+                    "passed": False,
+                    "latency_s": time.perf_counter() - start,
+                    "failures": [f"webhook call failed: {e}"],
+                }
+            latency = time.perf_counter() - start
+
+        failures = [f for f in (check_expectation(response, e) for e in case["expectations"]) if f]
+        return {"name": case["name"], "passed": not failures, "latency_s": latency, "failures": failures}
+
+    async def evaluate(
+        self,
+        prompt: str,
+        workflow: Dict[str, Any],
+        webhooks: List[WebhookNodeParameters],
+        n_cases: int,
+    ) -> Dict[str, Any]:
+        """Run a synthetic test suite against an activated workflow.
+
+        Args:
+            prompt: The user request the workflow was generated for
+            workflow: The created n8n workflow, including its ID
+            webhooks: The webhooks of the workflow
+            n_cases: Number of test cases to generate
+
+        Returns:
+            Dict with the pass rate, per-case results, the round-trip latency of the
+            webhook calls and the execution time reported by n8n
+        """
+        cases = await self.generate_cases(prompt, workflow, webhooks, n_cases)
+        logger.info(f"[Fitness] Running {len(cases)} test case(s) on workflow {workflow['id']}")
+        webhook_by_path = {webhook.path: webhook for webhook in webhooks}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *(self.run_case(case, webhook_by_path[case["webhook"]], workflow["id"], semaphore) for case in cases)
+        )
+
+        # Executions cannot be matched to the concurrent calls, so n8n timings are aggregated
+        executions = await self.n8n_service.get_workflow_executions(
+            workflow["id"], limit=len(cases) + 1, include_data=False
+        )
+        execution_durations = [d for d in map(_execution_duration, executions) if d is not None]
+
+        passed = sum(result["passed"] for result in results)
+        fitness = {
+            "pass_rate": passed / len(results) if results else 0.0,
+            "cases": results,
+            "latency_s": _latency_stats([result["latency_s"] for result in results]),
+            "execution_s": _latency_stats(execution_durations),
+        }
+        logger.info(f"[Fitness] Passed {passed}/{len(results)}, latency {fitness['latency_s']}")
+        return fitness
+
+
+def fitness_key(fitness: Dict[str, Any]) -> tuple:
+    """Sort key ranking candidates by pass rate, then by mean latency."""
+    mean_latency = fitness["latency_s"]["mean"]
+    return (fitness["pass_rate"], -(mean_latency if mean_latency is not None else float("inf")))
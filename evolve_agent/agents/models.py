@@ -1,16 +1,239 @@
+import asyncio
+import functools
+import heapq
+import itertools
 import os
-from typing import Literal, Optional
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Literal, Optional
 
+import tiktoken
 from dotenv import load_dotenv
 from langchain.schema import HumanMessage, SystemMessage
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import BaseMessage
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from loguru import logger
 
+from ..app.config import settings
 from .constants import model_ids
+from .context import iteration_var, run_id_var
 
 load_dotenv()
 
 
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute / 60` units per second."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available."""
+        self._refill()
+        amount = min(amount, self.capacity)  # a single oversized call must not block forever
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Charge (positive) or refund (negative) units after the fact."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class _ModelQueue:
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.waiters: List[tuple] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class LLMScheduler:
+    """Process-wide scheduler keeping LLM calls within per-model requests-per-minute and
+    tokens-per-minute budgets.
+
+    Waiting calls are served in priority order: runs in a later evolution iteration
+    first, so pipelines already in progress finish before new ones start, then the
+    run that was granted the fewest calls, so concurrent pipelines share the budget
+    fairly, then arrival order. Models without configured limits are not throttled.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, float]] = None):
+        self.queues: Dict[str, _ModelQueue] = {}
+        self.grants: OrderedDict = OrderedDict()  # run_id -> granted calls, bounded LRU
+        self.sequence = itertools.count()
+        for model_key, limit in (limits or {}).items():
+            self.configure(model_key, rpm=limit["rpm"], tpm=limit["tpm"])
+
+    def configure(self, model_key: str, rpm: float, tpm: float):
+        self.queues[model_key] = _ModelQueue(rpm, tpm)
+
+    async def acquire(self, model_key: str, estimated_tokens: int) -> float:
+        """Wait until the call fits the budget of `model_key`.
+
+        Returns:
+            Seconds spent waiting in the queue
+        """
+        queue = self.queues.get(model_key)
+        if queue is None:
+            return 0.0
+        run_id = run_id_var.get()
+        priority = (-iteration_var.get(), self.grants.get(run_id, 0), next(self.sequence))
+        future = asyncio.get_running_loop().create_future()
+        start = time.monotonic()
+        heapq.heappush(queue.waiters, (priority, estimated_tokens, run_id, future))
+        self._dispatch(queue)
+        await future  # cancelling the caller cancels the future, which the dispatcher skips
+
+        waited = time.monotonic() - start
+        queue.total_wait += waited
+        queue.max_wait = max(queue.max_wait, waited)
+        return waited
+
+    def reconcile(self, model_key: str, estimated_tokens: int, actual_tokens: int):
+        """Correct the token budget with the usage reported by the provider."""
+        queue = self.queues.get(model_key)
+        if queue is None:
+            return
+        queue.tokens.adjust(actual_tokens - estimated_tokens)
+        self._dispatch(queue)
+
+    def _dispatch(self, queue: _ModelQueue):
+        if queue.timer is not None:
+            queue.timer.cancel()
+            queue.timer = None
+        while queue.waiters:
+            _, estimated_tokens, run_id, future = queue.waiters[0]
+            if future.done():
+                heapq.heappop(queue.waiters)
+                continue
+            delay = max(queue.requests.wait_time(1), queue.tokens.wait_time(estimated_tokens))
+            if delay > 0:
+                queue.timer = asyncio.get_running_loop().call_later(delay, self._dispatch, queue)
+                return
+            heapq.heappop(queue.waiters)
+            queue.requests.consume(1)
+            queue.tokens.consume(estimated_tokens)
+            queue.granted += 1
+            self.grants[run_id] = self.grants.pop(run_id, 0) + 1
+            if len(self.grants) > 1024:
+                self.grants.popitem(last=False)
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Queue depth, wait times and remaining budget per model."""
+        stats = {}
+        for model_key, queue in self.queues.items():
+            queue.requests._refill()
+            queue.tokens._refill()
+            stats[model_key] = {
+                "queue_depth": sum(1 for waiter in queue.waiters if not waiter[-1].done()),
+                "granted": queue.granted,
+                "mean_wait_s": queue.total_wait / queue.granted if queue.granted else 0.0,
+                "max_wait_s": queue.max_wait,
+                "available_requests": queue.requests.tokens,
+                "available_tokens": queue.tokens.tokens,
+            }
+        return stats
+
+
+llm_scheduler = LLMScheduler(settings.LLM_RATE_LIMITS)
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name: str) -> Optional[tiktoken.Encoding]:
+    """Tiktoken encoding of a model, None if it cannot be loaded (e.g. offline)."""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"[Models] No tiktoken encoding for {model_name}, estimating from characters: {e}")
+        return None
+
+
+def count_tokens(model_name: str, text: str) -> int:
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_tokens(model_name: str, input: Any, max_output_tokens: int) -> int:
+    """Estimate the tokens a call will consume (prompt plus completion) with
+    tiktoken."""
+    if isinstance(input, PromptValue):
+        input = input.to_messages()
+    if isinstance(input, str):
+        texts = [input]
+    elif isinstance(input, list):
+        texts = [m.content if isinstance(m, BaseMessage) else str(m) for m in input]
+    else:
+        texts = [str(input)]
+    # ~4 tokens of per-message overhead in the chat format
+    prompt_tokens = sum(count_tokens(model_name, str(text)) + 4 for text in texts)
+    return prompt_tokens + max_output_tokens
+
+
+class ScheduledChatModel(Runnable):
+    """Chat model wrapper that queues every async call on the shared `LLMScheduler`.
+
+    Synchronous `invoke` is passed through unthrottled, the agents only use the async
+    API.
+    """
+
+    def __init__(self, model: Runnable, model_key: str, scheduler: LLMScheduler = llm_scheduler):
+        self.model = model
+        self.model_key = model_key
+        self.scheduler = scheduler
+        self.model_name = model_key.split("/", 1)[-1]
+        self.max_output_tokens = (
+            getattr(model, "max_tokens", None)
+            or getattr(model, "num_predict", None)
+            or settings.LLM_DEFAULT_OUTPUT_TOKENS
+        )
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self.model.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        estimated_tokens = estimate_tokens(self.model_name, input, self.max_output_tokens)
+        await self.scheduler.acquire(self.model_key, estimated_tokens)
+        actual_tokens = estimated_tokens
+        try:
+            response = await self.model.ainvoke(input, config, **kwargs)
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                actual_tokens = usage["total_tokens"]
+            return response
+        finally:
+            self.scheduler.reconcile(self.model_key, estimated_tokens, actual_tokens)
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "model":  # not set yet, avoid recursing during construction
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
 def get_openai_model(
     model_id: str = "gpt-4o-mini",
     format: Literal["json", "text"] = "json",
@@ -24,6 +247,8 @@ def get_openai_model(
     model = ChatOpenAI(
         model_name=model_id,
         openai_api_key=os.getenv("OPENAI_API_KEY"),
+        # OpenAI-compatible servers, e.g. vLLM, can be configured per model ID
+        base_url=settings.LLM_BASE_URLS.get(f"openai/{model_id}"),
         model_kwargs=model_kwargs,
         temperature=temperature,
     )
@@ -31,18 +256,23 @@ def get_openai_model(
     return model, embeddings
 
 
+def get_ollama_base_url(model_id: str) -> str:
+    return settings.LLM_BASE_URLS.get(f"ollama/{model_id}") or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+
 def get_ollama_model(
     model_id: str = "llama3.2",
     format: Literal["json", "text"] = "json",
     temperature: Optional[float] = None,
 ):
+    base_url = get_ollama_base_url(model_id)
     model = ChatOllama(
         model=model_id,
-        base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+        base_url=base_url,
         format=format,
         temperature=temperature,
     )
-    embeddings = OllamaEmbeddings(model=model_id)
+    embeddings = OllamaEmbeddings(model=model_id, base_url=base_url)
     return model, embeddings
 
 
@@ -50,13 +280,32 @@ def get_model(
     model_id: model_ids = "ollama/llama3.2",
     format: Literal["json", "text"] = "json",
     temperature: Optional[float] = None,
+    scheduled: bool = True,
 ):
+    """Get a chat model and its embeddings.
+
+    With `scheduled`, the chat model is wrapped so its async calls respect the
+    process-wide rate limits of `llm_scheduler`.
+    """
     if "ollama" in model_id:
-        return get_ollama_model(model_id.split("/")[1], format, temperature)
+        model, embeddings = get_ollama_model(model_id.split("/")[1], format, temperature)
     elif "openai" in model_id:
-        return get_openai_model(model_id.split("/")[1], format, temperature)
+        model, embeddings = get_openai_model(model_id.split("/")[1], format, temperature)
     else:
         raise ValueError(f"Invalid model ID: {model_id}")
+    if scheduled:
+        model = ScheduledChatModel(model, model_id)
+    return model, embeddings
+
+
+def get_embeddings(model_id: model_ids = "ollama/llama3.2") -> Embeddings:
+    """Get the embeddings model of a model ID."""
+    provider, name = model_id.split("/", 1)
+    if provider == "ollama":
+        return OllamaEmbeddings(model=name, base_url=get_ollama_base_url(name))
+    if provider == "openai":
+        return OpenAIEmbeddings(model=name if name.startswith("text-embedding") else "text-embedding-3-large")
+    raise ValueError(f"Invalid model ID: {model_id}")
 
 
 if __name__ == "__main__":
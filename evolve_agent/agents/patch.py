@@ -0,0 +1,159 @@
+"""Node-level edit operations for refining a workflow without regenerating it.
+
+A patch is a list of operations applied in order:
+    {"op": "update_node", "node": "<name>", "patch": {...}}  JSON Merge Patch (RFC 7396)
+                                                             of the node, null deletes
+    {"op": "add_node", "node": {...}}                        a node in the compact format
+    {"op": "remove_node", "node": "<name>"}                  with its connections
+    {"op": "rename_node", "node": "<name>", "name": "<new>"} updating its connections
+    {"op": "connect", "from": "<name>", "to": "<name>", "type": "main", "output": 0, "index": 0}
+    {"op": "disconnect", "from": "<name>", "to": "<name>", "type": "main"}
+"""
+
+import copy
+from typing import Any, Dict, List
+
+from .codec import decode_workflow
+
+
+class PatchError(ValueError):
+    """Raised when a patch cannot be applied or yields an invalid workflow."""
+
+
+def merge_patch(target: Any, patch: Any) -> Any:
+    """Apply a JSON Merge Patch (RFC 7396)."""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = copy.deepcopy(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def validate_workflow(workflow: Dict[str, Any]) -> List[str]:
+    """Check the structure of a workflow locally, before it is deployed.
+
+    Returns:
+        List of problems, empty if the workflow is valid
+    """
+    problems = []
+    names = set()
+    for node in workflow.get("nodes", []):
+        name = node.get("name")
+        if not name or not node.get("type"):
+            problems.append(f"node without a name or type: {node}")
+        elif name in names:
+            problems.append(f'duplicate node name "{name}"')
+        elif not isinstance(node.get("parameters", {}), dict):
+            problems.append(f'parameters of node "{name}" are not an object')
+        names.add(name)
+    if not any(node.get("type") == "n8n-nodes-base.webhook" for node in workflow.get("nodes", [])):
+        problems.append("no webhook node")
+    for source, outputs in (workflow.get("connections") or {}).items():
+        if source not in names:
+            problems.append(f'connection from unknown node "{source}"')
+        for branches in outputs.values():
+            for branch in branches:
+                for target in branch or []:
+                    if target.get("node") not in names:
+                        problems.append(f'connection from "{source}" to unknown node "{target.get("node")}"')
+    return problems
+
+
+def _find_node(workflow: Dict[str, Any], name: str) -> int:
+    for i, node in enumerate(workflow["nodes"]):
+        if node.get("name") == name:
+            return i
+    raise PatchError(f'unknown node "{name}"')
+
+
+def _remove_targets(workflow: Dict[str, Any], predicate) -> None:
+    for outputs in workflow["connections"].values():
+        for connection_type, branches in outputs.items():
+            outputs[connection_type] = [[t for t in branch or [] if not predicate(t)] for branch in branches]
+
+
+def apply_patch(workflow: Dict[str, Any], operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply edit operations to a copy of a workflow and validate the result.
+
+    Added nodes get IDs and positions, and untouched nodes keep theirs.
+
+    Raises:
+        PatchError: If an operation is malformed or refers to an unknown node, or if
+            the patched workflow is invalid
+    """
+    if not isinstance(operations, list) or not all(isinstance(operation, dict) for operation in operations):
+        raise PatchError(f"operations must be a list of objects, got {operations!r}")
+    patched = copy.deepcopy(workflow)
+    patched.setdefault("connections", {})
+    for i, operation in enumerate(operations):
+        kind = operation.get("op")
+        try:
+            if kind == "update_node":
+                index = _find_node(patched, operation["node"])
+                patch = operation.get("patch") or {}
+                if "name" in patch:
+                    raise PatchError("use rename_node to rename a node")
+                patched["nodes"][index] = merge_patch(patched["nodes"][index], patch)
+            elif kind == "add_node":
+                node = operation["node"]
+                if any(n.get("name") == node.get("name") for n in patched["nodes"]):
+                    raise PatchError(f'node "{node.get("name")}" already exists')
+                patched["nodes"].append(copy.deepcopy(node))
+            elif kind == "remove_node":
+                name = operation["node"]
+                patched["nodes"].pop(_find_node(patched, name))
+                patched["connections"].pop(name, None)
+                _remove_targets(patched, lambda target: target.get("node") == name)
+            elif kind == "rename_node":
+                name, new_name = operation["node"], operation["name"]
+                index = _find_node(patched, name)
+                if any(n.get("name") == new_name for n in patched["nodes"]):
+                    raise PatchError(f'node "{new_name}" already exists')
+                patched["nodes"][index]["name"] = new_name
+                if name in patched["connections"]:
+                    patched["connections"][new_name] = patched["connections"].pop(name)
+                for outputs in patched["connections"].values():
+                    for branches in outputs.values():
+                        for branch in branches:
+                            for target in branch or []:
+                                if target.get("node") == name:
+                                    target["node"] = new_name
+            elif kind == "connect":
+                source, target = operation["from"], operation["to"]
+                _find_node(patched, source)
+                _find_node(patched, target)
+                connection_type = operation.get("type", "main")
+                output, input_index = int(operation.get("output", 0)), int(operation.get("index", 0))
+                branches = patched["connections"].setdefault(source, {}).setdefault(connection_type, [])
+                while len(branches) <= output:
+                    branches.append([])
+                link = {"node": target, "type": connection_type, "index": input_index}
+                if link not in branches[output]:
+                    branches[output].append(link)
+            elif kind == "disconnect":
+                source, target = operation["from"], operation["to"]
+                connection_type = operation.get("type", "main")
+                outputs = patched["connections"].get(source, {})
+                if connection_type in outputs:
+                    outputs[connection_type] = [
+                        [t for t in branch or [] if t.get("node") != target] for branch in outputs[connection_type]
+                    ]
+            else:
+                raise PatchError(f"unknown operation {kind!r}")
+        except PatchError as e:
+            raise PatchError(f"operation {i + 1} ({kind}): {e}") from e
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise PatchError(f"operation {i + 1} ({kind}) is malformed: {e!r}") from e
+
+    try:
+        patched = decode_workflow(patched, original=workflow)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise PatchError(f"invalid patched workflow: {e!r}") from e
+    problems = validate_workflow(patched)
+    if problems:
+        raise PatchError("invalid patched workflow: " + "; ".join(problems))
+    return patched
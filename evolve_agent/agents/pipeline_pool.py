@@ -0,0 +1,283 @@
+"""Pool of worker processes running pipelines, fed by the app.
+
+JSON parsing, validation, text splitting and prompt formatting of concurrent
+pipelines compete for the GIL of one process. With `settings.PIPELINE_EXECUTOR` set
+to "process", the app hands its pipeline runs to worker processes, each running many
+of them concurrently on its own event loop. Runs go to the worker with the fewest
+runs in flight.
+
+The app process builds the template index before starting the workers, which then
+open it read-only: the array store is memory-mapped, so every worker shares the same
+pages of the OS page cache instead of holding a copy (a Chroma index is loaded by
+every worker). Workers write their runs to the shared run store and solution cache,
+and send the events and log records of their runs back to the app, which publishes
+them as if the runs were its own, so `/runs/{run_id}/events`, `/runs/{run_id}/log`
+and the log stream keep working. The app keeps `settings.PIPELINE_APP_RATE_SHARE` of
+the LLM rate limits for its own few calls, e.g. of `/agent/generate_workflow`, and the
+workers, which make the pipeline calls, split the rest, so that together they stay
+within the limits.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from ..app.config import settings
+from ..app.services.run_store import run_store_path
+from ..app.utils import RunLogRouter
+from .context import run_context, run_id_var
+from .core import Agent
+from .events import event_bus
+from .models import llm_scheduler
+
+# Seconds between two checks that the workers are alive
+MONITOR_INTERVAL = 1.0
+SHUTDOWN_TIMEOUT = 10.0
+
+
+class PipelineWorkerError(Exception):
+    """Raised for a run whose worker died, or whose error could not be sent back."""
+
+
+def _portable_error(error: Exception) -> Exception:
+    """The error if it survives pickling, a `PipelineWorkerError` describing it otherwise."""
+    try:
+        return pickle.loads(pickle.dumps(error))
+    except Exception:
+        return PipelineWorkerError(f"{type(error).__name__}: {error}")
+
+
+def _share_rate_limits(share: float):
+    """Limit the LLM calls of this process to `share` of the configured rate limits."""
+    for model_key, limit in settings.LLM_RATE_LIMITS.items():
+        llm_scheduler.configure(model_key, rpm=limit["rpm"] * share, tpm=limit["tpm"] * share)
+
+
+def _forward_logs(messages: multiprocessing.Queue):
+    logger.remove()
+
+    def sink(message):
+        record = message.record
+        messages.put(
+            (
+                "log",
+                run_id_var.get(),
+                record["level"].name,
+                str(message).rstrip("\n"),
+                record["name"],
+                record["function"],
+                record["line"],
+            )
+        )
+
+    logger.add(sink, level="DEBUG", format="{message}")
+
+
+async def _run(agent: Any, messages: multiprocessing.Queue, prompt: str, run_id: str, params: Dict[str, Any]):
+    try:
+        result = await agent.pipeline(prompt, run_id=run_id, **params)
+        # A result failing to pickle in the feeder thread of the queue would never arrive
+        pickle.dumps(result)
+    except Exception as e:
+        messages.put(("result", run_id, None, _portable_error(e)))
+    else:
+        messages.put(("result", run_id, result, None))
+
+
+async def _serve(index: int, tasks: multiprocessing.Queue, messages: multiprocessing.Queue, agent_factory: Callable):
+    agent = agent_factory()
+    # Runs are logged to a file of this worker, the app keeps its own for the same run
+    agent.run_logs = RunLogRouter(run_store_path.parent / "run_logs" / f"worker-{index}", key=run_id_var.get)
+    event_bus.listeners.append(lambda run_id, event: messages.put(("event", run_id, event["type"], event["data"])))
+    messages.put(("ready", index, os.getpid()))
+
+    loop = asyncio.get_running_loop()
+    running = set()
+    while True:
+        task = await loop.run_in_executor(None, tasks.get)
+        if task is None:
+            break
+        running.add(loop.create_task(_run(agent, messages, *task)))
+        running = {run for run in running if not run.done()}
+    if running:
+        await asyncio.wait(running)
+
+
+def _worker_main(
+    index: int, share: float, tasks: multiprocessing.Queue, messages: multiprocessing.Queue, agent_factory: Callable
+):
+    _forward_logs(messages)
+    _share_rate_limits(share)
+    asyncio.run(_serve(index, tasks, messages, agent_factory))
+
+
+class _Worker:
+    def __init__(self, index: int, process: multiprocessing.Process, tasks: multiprocessing.Queue):
+        self.index = index
+        self.process = process
+        self.tasks = tasks
+        self.runs: set = set()
+        self.ready = False
+
+
+class PipelinePool:
+    def __init__(self, workers: int, run_logs: RunLogRouter = None, agent_factory: Callable = Agent):
+        """
+        Args:
+            workers: Number of worker processes
+            run_logs: Log router of the app, capturing the forwarded records of each
+                run while it runs
+            agent_factory: Picklable callable building the `Agent` of a worker
+        """
+        self.size = workers
+        # Share of the LLM rate limits of each worker, the app keeps its own
+        self.worker_share = (1 - settings.PIPELINE_APP_RATE_SHARE) / workers
+        self.run_logs = run_logs
+        self.agent_factory = agent_factory
+        self.context = multiprocessing.get_context("spawn")
+        self.messages: Optional[multiprocessing.Queue] = None
+        self.workers: List[_Worker] = []
+        self.futures: Dict[str, Tuple[asyncio.Future, _Worker]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.reader: Optional[threading.Thread] = None
+        self.closing = False
+
+    def _spawn(self, index: int) -> _Worker:
+        tasks = self.context.Queue()
+        process = self.context.Process(
+            target=_worker_main,
+            args=(index, self.worker_share, tasks, self.messages, self.agent_factory),
+            name=f"pipeline-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        return _Worker(index, process, tasks)
+
+    def start(self):
+        """Start the workers, from the event loop of the app."""
+        if self.workers:
+            return
+        self.loop = asyncio.get_running_loop()
+        _share_rate_limits(settings.PIPELINE_APP_RATE_SHARE)
+        self.messages = self.context.Queue()
+        self.workers = [self._spawn(index) for index in range(self.size)]
+        self.reader = threading.Thread(target=self._read, name="pipeline-pool-reader", daemon=True)
+        self.reader.start()
+        logger.info(f"[Pool] Started {self.size} pipeline worker(s)")
+
+    async def run(self, prompt: str, run_id: str, **params: Any) -> Dict[str, Any]:
+        """Run a pipeline on the least busy worker, see `Agent.pipeline`."""
+        self.start()
+        worker = min(self.workers, key=lambda w: len(w.runs))
+        future = self.loop.create_future()
+        self.futures[run_id] = (future, worker)
+        worker.runs.add(run_id)
+        event_bus.open(run_id)
+        if self.run_logs is not None:
+            self.run_logs.open(run_id)
+        try:
+            worker.tasks.put((prompt, run_id, params))
+            return await future
+        finally:
+            self.futures.pop(run_id, None)
+            worker.runs.discard(run_id)
+            if self.run_logs is not None:
+                self.run_logs.close(run_id)
+
+    def _read(self):
+        """Hand the messages of the workers to the event loop, and replace dead workers."""
+        while not self.closing:
+            try:
+                message = self.messages.get(timeout=MONITOR_INTERVAL)
+            except queue.Empty:
+                message = None
+            except (EOFError, OSError):
+                return
+            if self.closing:
+                return
+            if message is not None:
+                self.loop.call_soon_threadsafe(self._dispatch, message)
+            for worker in self.workers:
+                if not worker.process.is_alive():
+                    self.loop.call_soon_threadsafe(self._replace, worker)
+
+    def _dispatch(self, message: tuple):
+        kind, run_id, *data = message
+        if kind == "event":
+            event_type, payload = data
+            event_bus.publish(event_type, run_id=run_id, **payload)
+        elif kind == "log":
+            level, text, name, function, line = data
+            patched = logger.patch(lambda record: record.update(name=name, function=function, line=line))
+            if run_id is None:
+                patched.log(level, text)
+            else:
+                with run_context(run_id):
+                    patched.log(level, text)
+        elif kind == "result":
+            result, error = data
+            future = self.futures.get(run_id, (None,))[0]
+            if future is not None and not future.done():
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+        elif kind == "ready":
+            index, pid = run_id, data[0]
+            if index < len(self.workers):
+                self.workers[index].ready = True
+            logger.info(f"[Pool] Worker {index} ready (pid {pid})")
+
+    def _replace(self, worker: _Worker):
+        if self.closing or self.workers[worker.index] is not worker:
+            return
+        logger.error(f"[Pool] Worker {worker.index} exited with code {worker.process.exitcode}, restarting it")
+        for run_id in list(worker.runs):
+            future = self.futures.get(run_id, (None,))[0]
+            if future is not None and not future.done():
+                future.set_exception(PipelineWorkerError(f"Worker {worker.index} exited during run {run_id}"))
+        self.workers[worker.index] = self._spawn(worker.index)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": [
+                {
+                    "index": worker.index,
+                    "pid": worker.process.pid,
+                    "alive": worker.process.is_alive(),
+                    "ready": worker.ready,
+                    "runs": len(worker.runs),
+                }
+                for worker in self.workers
+            ],
+            "runs": len(self.futures),
+        }
+
+    def close(self):
+        """Let the workers finish their runs and stop them."""
+        if not self.workers or self.closing:
+            return
+        self.closing = True
+        for worker in self.workers:
+            worker.tasks.put(None)
+        for worker in self.workers:
+            worker.process.join(SHUTDOWN_TIMEOUT)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        logger.info(f"[Pool] Stopped {len(self.workers)} pipeline worker(s)")
+
+
+def get_pipeline_pool(run_logs: RunLogRouter = None) -> Optional[PipelinePool]:
+    """The pool configured by `settings.PIPELINE_EXECUTOR`, None to run pipelines in
+    the app process."""
+    if settings.PIPELINE_EXECUTOR == "inline":
+        return None
+    if settings.PIPELINE_EXECUTOR != "process":
+        raise ValueError(f"Unknown pipeline executor {settings.PIPELINE_EXECUTOR!r}, expected 'inline' or 'process'")
+    return PipelinePool(settings.PIPELINE_WORKERS or os.cpu_count() or 1, run_logs)
@@ -5,6 +5,8 @@ from typing import Any, Dict
 from langchain import hub
 from langchain.prompts import PromptTemplate
 
+from .codec import encode_workflow
+
 root = Path(__file__).parent
 project_root = root.parent
 templates_dir = project_root / "templates"
@@ -13,7 +15,7 @@ credentials_template = templates_dir / "credentials.json"
 
 
 def escape_template(template: Dict[str, Any]) -> str:
-    template_str = json.dumps(template, indent=2)
+    template_str = encode_workflow(template)
     # Escape curly braces in the JSON by replacing { with {{ and } with }}
     # escaped_template = template_str.replace("{", "{{").replace("}", "}}")
     return template_str
@@ -24,25 +26,10 @@ def get_webhook_template() -> str:
     return escape_template(webhook_template)
 
 
-def get_system_prompt() -> str:
-    return """You are an expert at understanding and explaining n8n workflow templates.
-You need to communicate with other agents to generate a workflow.
-Do give GUIDELINES to the the RAG agent which will be used to search for the best template.
-
-Please return in JSON format like:
-{
-    "thought": "...",
-    "guidelines": "..."
-}"""
-
-
-def get_reflection_prompt(archive: str, errors: str) -> str:
-    return f"""Here is the previous agent RAG response:
-{archive}
-
-Errors happened in the previous workflow:
-{errors}
-
+# Static instructions first and the run's variable parts last, so that successive
+# calls share a long prefix that the provider can serve from its prompt cache
+REFLECTION_INSTRUCTIONS = """# Reflection
+When the workflow failed, you are given the previous agent RAG response and the errors that happened.
 Carefully review the proposed new architecture and reflect on the following points:
 
 1. **Interestingness**: Assess whether your proposed architecture is interesting or innovative compared to existing methods in the archive. If you determine that the proposed architecture is not interesting, suggest a new architecture that addresses these shortcomings.
@@ -58,47 +45,88 @@ Carefully review the proposed new architecture and reflect on the following poin
 - Check if there is redundant code or unnecessary steps in the implementation. Replace them with effective implementation.
 - Try to avoid the implementation being too similar to the previous agent.
 
-And then, you need to improve or revise the implementation, or implement the new proposed architecture based on the reflection.
+And then, you need to improve or revise the implementation, or implement the new proposed architecture based on the reflection."""
+
+
+def get_system_prompt() -> str:
+    return f"""You are an expert at understanding and explaining n8n workflow templates.
+You need to communicate with other agents to generate a workflow.
+Do give GUIDELINES to the the RAG agent which will be used to search for the best template.
+
+# Response
+Every response has the following fields:
+"thought": Your proposal of the architecture of the workflow.
+"guidelines": Provide the GUIDELINES to the the RAG agent which will be used to search for the best template, mainly focus on how to improve the implementation of "nodes" and "connections".
 
-Your response should be organized as follows:
+Only when you reflect on a failed workflow (see "# Reflection"), also give:
 "reflection": Provide your thoughts on the interestingness of the architecture, identify any mistakes in the implementation, and suggest improvements.
-"thought": Revise your previous proposal or propose a new architecture if necessary, using the same format as the example response.
 "name": Provide a name for the revised or new architecture. (Don't put words like "new" or "improved" in the name.)
-"guidelines": Provide the GUIDELINES to the the RAG agent which will be used to search for the best template, mainly focus on how to improve the implementation of "nodes" and "connections".
+"mode": "patch" if the previous workflow only needs some nodes or connections fixed, "regenerate" if you propose a different architecture.
 
 Please return in JSON format like:
-{{"reflection": "...",
+{{
+    "reflection": "...",
     "thought": "...",
     "name": "...",
-    "guidelines": "..."
-}}"""
-
+    "guidelines": "...",
+    "mode": "patch"
+}}
+leaving out "reflection", "name" and "mode" for the first request, which has no failed workflow yet.
 
-def get_rag_prompt() -> PromptTemplate:
-    # prompt = hub.pull("rlm/rag-prompt")
-    template = """You are an expert at understanding and generating n8n workflow templates.
+{REFLECTION_INSTRUCTIONS}"""
 
-# Context
-And you are given the following template information:
-{context}
 
-# Archive
-Here is the archive of the discovered architectures:
+def get_reflection_prompt(archive: str, errors: str) -> str:
+    return f"""Here is the previous agent RAG response:
 {archive}
 
-# Errors
-Errors happened in the last archive workflow:
+Errors happened in the previous workflow:
 {errors}
 
-# Guidelines:
-{guidelines}
+Reflect on it as described in "# Reflection" and return the JSON object described in "# Response", with the reflection fields."""
+
+
+def get_patch_prompt(question: str, workflow: str, errors: str, guidelines: str) -> str:
+    return f"""You are an expert at fixing n8n workflows.
+
+# Task
+Fix the workflow below with the smallest set of edit operations, applied in order:
+- {{"op": "update_node", "node": "<name>", "patch": {{...}}}}: JSON Merge Patch of the node, e.g. {{"parameters": {{"url": "..."}}}}, null deletes a key
+- {{"op": "add_node", "node": {{"name": "...", "type": "...", "typeVersion": 1, "parameters": {{...}}}}}}
+- {{"op": "remove_node", "node": "<name>"}}
+- {{"op": "rename_node", "node": "<name>", "name": "<new name>"}}
+- {{"op": "connect", "from": "<name>", "to": "<name>", "type": "main", "output": 0, "index": 0}}
+- {{"op": "disconnect", "from": "<name>", "to": "<name>", "type": "main"}}
+
+Do not repeat unchanged nodes. Make sure to return in a WELL-FORMED JSON object like:
+{{"operations": [...]}}
 
 # Question
-Answer the question based on the templates provided:
+The workflow was built for the following request:
+{question}
 
-Question: {input}
+# Workflow
+{workflow}
+
+# Errors
+{errors}
+
+# Guidelines
+{guidelines}"""
 
-# NOTED
+
+def get_rag_prompt(webhook_inputs: bool = False) -> PromptTemplate:
+    """
+    Args:
+        webhook_inputs: Also ask for a sample input of every webhook of the workflow,
+            under a "webhook_inputs" key next to the workflow
+    """
+    # prompt = hub.pull("rlm/rag-prompt")
+    # Static parts first, then the parts fixed for a request (retrieved templates,
+    # solutions, question), then those changing at every iteration
+    template = """You are an expert at understanding and generating n8n workflow templates.
+
+# Output format
 Here is an example of the output format for the next workflow architecture:
 {example}
 
@@ -106,12 +134,42 @@ Here is an example of the output format for the next workflow architecture:
 Here is the credentials for some nodes in the workflow:
 {credentials}
 
+# Rules
 Remember to:
 1. Imitate the style of the template
 2. Make sure to return in a WELL-FORMED JSON object
 3. Focus on the "nodes" and "connections" keys
 4. DO generate the workflow using the same webhook mechanism as the example workflow provided
-5. DO refer to the example workflow provided to generate the workflow, especially the "nodes" and "connections" keys"""
+5. DO refer to the example workflow provided to generate the workflow, especially the "nodes" and "connections" keys
+6. Leave out node positions and IDs, and write a connection to input 0 as the bare target node name, as the example and the workflows below do"""
+    if webhook_inputs:
+        template += """
+7. Add a "webhook_inputs" key next to "nodes" and "connections", mapping the path of every webhook node to a sample request body that exercises the workflow, with every field the nodes read from the request, like "webhook_inputs": {{"<path>": {{...}}}}"""
+    template += """
+
+# Context
+And you are given the following template information:
+{context}
+
+# Similar solutions
+Here are working workflows for similar requests solved before:
+{solutions}
+
+# Question
+Answer the question based on the templates provided:
+
+Question: {input}
+
+# Archive
+Here is the archive of the discovered architectures:
+{archive}
+
+# Errors
+Errors happened in the last archive workflow:
+{errors}
+
+# Guidelines:
+{guidelines}"""
 
     return PromptTemplate.from_template(
         template=template,
@@ -0,0 +1,147 @@
+"""Benchmark of the provider prompt cache over the iterations of a run.
+
+Providers such as OpenAI serve the longest prompt prefix they have recently seen,
+from 1024 tokens on and in steps of 128, at a lower price and latency. The RAG
+prompt keeps its static parts, the retrieved templates and the question first, so
+the iterations of a run only differ by their archive, errors and guidelines at the
+end. This renders the RAG prompts of a simulated run and reports the prefix each
+shares with the previous one, with the cost of the input tokens with and without
+caching. With --live, the prompts are also sent to the model, reporting the cached
+tokens and latency of every call.
+
+Usage:
+    python -m evolve_agent.agents.prompt_cache [--iterations 5] [--model openai/gpt-4o] [--live]
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from .codec import encode_workflow
+from .models import count_tokens
+from .prompt import get_rag_prompt
+from .rag import CHUNK_SIZE
+from .usage import estimate_cost
+
+MIN_CACHED_PREFIX = 1024
+CACHE_INCREMENT = 128
+
+
+def cacheable_tokens(prefix_tokens: int) -> int:
+    """Tokens of a shared prefix the provider serves from its cache."""
+    if prefix_tokens < MIN_CACHED_PREFIX:
+        return 0
+    return prefix_tokens // CACHE_INCREMENT * CACHE_INCREMENT
+
+
+def simulate_run(
+    templates: List[Dict[str, Any]], question: str, iterations: int = 5, webhook_inputs: bool = True
+) -> List[str]:
+    """RAG prompts of a run whose first `iterations - 1` workflows fail.
+
+    The start of the first three templates is the retrieved context, and every failed
+    iteration adds one of the others to the archive.
+    """
+    rag_prompt = get_rag_prompt(webhook_inputs)
+    context = "\n\n".join(encode_workflow(template)[:CHUNK_SIZE] for template in templates[:3])
+    others = templates[3:] or templates
+    archives, prompts = [], []
+    for i in range(iterations):
+        prompts.append(
+            rag_prompt.format(
+                context=context,
+                solutions="",
+                input=question,
+                archive="\n".join(archives),
+                errors=f"Stage: call_webhook\nError calling 1 of 1 webhook(s): 500 (iteration {i})" if i else "",
+                guidelines=f"Iteration {i + 1}: respond to the webhook with the generated answer",
+            )
+        )
+        archives.append(encode_workflow(others[i % len(others)]))
+    return prompts
+
+
+def measure_prefix_reuse(prompts: List[str], model_key: str = "openai/gpt-4o") -> Dict[str, Any]:
+    """Input tokens of successive prompts and those the prompt cache would serve,
+    counting only the prefix shared with the previous prompt."""
+    model_name = model_key.split("/", 1)[-1]
+    calls, previous = [], None
+    for prompt in prompts:
+        tokens = count_tokens(model_name, prompt)
+        shared = count_tokens(model_name, os.path.commonprefix([previous, prompt])) if previous else 0
+        cached = min(cacheable_tokens(shared), tokens)
+        calls.append(
+            {
+                "input_tokens": tokens,
+                "shared_prefix_tokens": shared,
+                "cached_tokens": cached,
+                "cost": estimate_cost(model_key, tokens, 0, cached),
+                "uncached_cost": estimate_cost(model_key, tokens, 0),
+            }
+        )
+        previous = prompt
+    cost = sum(call["cost"] for call in calls)
+    uncached_cost = sum(call["uncached_cost"] for call in calls)
+    return {
+        "calls": calls,
+        "input_tokens": sum(call["input_tokens"] for call in calls),
+        "cached_tokens": sum(call["cached_tokens"] for call in calls),
+        "cost": cost,
+        "uncached_cost": uncached_cost,
+        "savings": 1 - cost / uncached_cost if uncached_cost else 0.0,
+    }
+
+
+async def measure_live(prompts: List[str], model_id: str = "openai/gpt-4o") -> List[Dict[str, Any]]:
+    """Send the prompts to the model in order, with the usage it reports per call."""
+    from .context import run_context
+    from .models import get_model
+    from .usage import usage_ledger
+
+    model = get_model(model_id=model_id, format="json", temperature=0)[0]
+    run_id = f"prompt-cache-{int(time.time())}"
+    with run_context(run_id):
+        for prompt in prompts:
+            start = time.monotonic()
+            response = await model.ainvoke(prompt)
+            usage_ledger.record_chat("rag", model_id, prompt, response, time.monotonic() - start)
+    return [
+        {key: record[key] for key in ("input_tokens", "cached_tokens", "output_tokens", "latency_s", "cost")}
+        for record in usage_ledger.pop(run_id)
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import json
+
+    parser = argparse.ArgumentParser(description="Measure prompt cache reuse over the iterations of a run")
+    parser.add_argument(
+        "templates_dir", nargs="?", type=Path, default=Path(__file__).parent.parent / "templates" / "dataset"
+    )
+    parser.add_argument("--question", default="Build a chatbot answering questions about our product catalog")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--model", default="openai/gpt-4o")
+    parser.add_argument("--live", action="store_true", help="Also send the prompts to the model")
+    args = parser.parse_args()
+
+    templates = [json.loads(path.read_text(encoding="utf-8")) for path in sorted(args.templates_dir.glob("*.json"))]
+    prompts = simulate_run(templates, args.question, args.iterations)
+    report = measure_prefix_reuse(prompts, args.model)
+    for i, call in enumerate(report["calls"], 1):
+        print(
+            f"iteration {i}: {call['input_tokens']} input tokens, {call['shared_prefix_tokens']} shared, "
+            f"{call['cached_tokens']} cacheable, ${call['cost']:.4f} (${call['uncached_cost']:.4f} uncached)"
+        )
+    print(
+        f"expected: {report['cached_tokens']} of {report['input_tokens']} input tokens cached, "
+        f"${report['cost']:.4f} instead of ${report['uncached_cost']:.4f} ({report['savings']:.0%} saved)"
+    )
+    if args.live:
+        for i, call in enumerate(asyncio.run(measure_live(prompts, args.model)), 1):
+            print(
+                f"live iteration {i}: {call['input_tokens']} input tokens, {call['cached_tokens']} cached, "
+                f"{call['latency_s']:.2f}s, ${call['cost']:.4f}"
+            )
@@ -1,3 +1,4 @@
+import hashlib
 import json
 from pathlib import Path
 from typing import Dict, List
@@ -7,36 +8,66 @@ from langchain.chains.retrieval import create_retrieval_chain
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from loguru import logger
 
+from ..app.config import data_dir, settings
+from .codec import encode_workflow
+from .dedup import cluster_templates
 from .prompt import get_rag_prompt
+from .vector_store import ArrayVectorStore
 
 root = Path(__file__).parent
 project_root = root.parent
 templates_dir = project_root / "templates" / "dataset"
+# Array index of the templates, kept out of the source tree
+index_dir = data_dir / "template_index"
+
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 200
+# Source digest of the Chroma index, next to it in the templates directory
+CHROMA_SOURCE_FILE = "chroma.source"
 
 
 class JSONTemplateLoader:
-    def __init__(self, directory_path: Path):
+    def __init__(self, directory_path: Path, dedup_threshold: float = 0.0):
+        """
+        Args:
+            directory_path: Directory of the JSON templates
+            dedup_threshold: Similarity from which templates are near-duplicates, of
+                which only a canonical one is loaded, 0 to load every template
+        """
         self.directory_path = directory_path
+        self.dedup_threshold = dedup_threshold
 
     def load(self) -> List[Document]:
-        documents = []
-        for filename in self.directory_path.iterdir():
+        templates = {}
+        for filename in sorted(self.directory_path.iterdir()):
             if filename.suffix == ".json":
                 with open(filename, "r", encoding="utf-8") as f:
-                    content = json.load(f)
-                    # Convert JSON to string while preserving structure
-                    text = json.dumps(content, indent=2)
-                    metadata = {
-                        "source": str(filename.name),  # Convert to string
-                        "type": "template",
-                        "path": str(filename),  # Store full path as string
-                    }
-                    documents.append(Document(page_content=text, metadata=metadata))
+                    templates[filename.name] = json.load(f)
+
+        if self.dedup_threshold:
+            clusters = cluster_templates(templates, threshold=self.dedup_threshold)
+            logger.info(f"[RAG] {len(templates)} templates, {len(clusters)} after deduplication")
+        else:
+            clusters = [{"canonical": name, "members": [name]} for name in templates]
+
+        documents = []
+        for cluster in clusters:
+            name = cluster["canonical"]
+            # Same compact format as the other workflows in the prompt, one node per line
+            text = encode_workflow(templates[name])
+            metadata = {
+                "source": name,
+                "type": "template",
+                "path": str(self.directory_path / name),  # Store full path as string
+                # Vector stores such as Chroma only take scalar metadata
+                "cluster_size": len(cluster["members"]),
+                "duplicates": ",".join(member for member in cluster["members"] if member != name),
+            }
+            documents.append(Document(page_content=text, metadata=metadata))
         return documents
 
 
@@ -48,6 +79,10 @@ class TemplateRAG:
         model: ChatOllama | ChatOpenAI,
         embeddings: OllamaEmbeddings | OpenAIEmbeddings,
         templates_dir: Path = templates_dir,
+        k: int = 3,
+        vector_store: str = None,
+        index_dir: Path = index_dir,
+        webhook_inputs: bool = False,
     ):
         """Initialize the RAG system.
 
@@ -55,14 +90,22 @@ class TemplateRAG:
             templates_dir: Directory containing JSON template files
             model: Language model to use for generation
             embeddings: Embeddings model to use for vector store
+            k: Number of template chunks retrieved as context for each query
+            vector_store: "array" or "chroma", `settings.RAG_VECTOR_STORE` by default
+            index_dir: Directory of the array index
+            webhook_inputs: Answer sample webhook inputs together with the workflow
         """
         self.templates_dir = templates_dir
         self.model = model
         self.embeddings = embeddings
+        self.k = k
+        self.vector_store = vector_store or settings.RAG_VECTOR_STORE
+        self.index_dir = index_dir
+        self.webhook_inputs = webhook_inputs
 
-        self.loader = JSONTemplateLoader(templates_dir)
+        self.loader = JSONTemplateLoader(templates_dir, dedup_threshold=settings.RAG_DEDUP_THRESHOLD)
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=2000, chunk_overlap=200, separators=["\n\n", "\n", " ", ""]
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, separators=["\n\n", "\n", " ", ""]
         )
         self.vectorstore = None
         self.retrieval_chain = None
@@ -71,36 +114,76 @@ class TemplateRAG:
     def initialize(self):
         """Initialize the RAG system by loading documents and setting up the retrieval
         chain."""
-        if (self.templates_dir / "chroma.sqlite3").exists():
-            logger.info("[RAG] Loading existing vector store...")
-            self.vectorstore = Chroma(
-                persist_directory=str(self.templates_dir),
-                embedding_function=self.embeddings,
-            )
+        if self.vector_store == "chroma":
+            self.vectorstore = self._open_chroma()
+        elif self.vector_store == "array":
+            self.vectorstore = self._open_array_store()
         else:
-            logger.info("[RAG] Creating new vector store...")
-            documents = self.loader.load()
-            split_documents = self.text_splitter.split_documents(documents)
-
-            self.vectorstore = Chroma.from_documents(
-                documents=split_documents,
-                embedding=self.embeddings,
-                persist_directory=str(self.templates_dir),
-            )
+            raise ValueError(f"Unknown vector store {self.vector_store!r}, expected 'array' or 'chroma'")
 
-        rag_prompt = get_rag_prompt()
+        rag_prompt = get_rag_prompt(self.webhook_inputs)
 
-        retriever = self.vectorstore.as_retriever(search_kwargs={"k": 3})
+        retriever = self.vectorstore.as_retriever(search_kwargs={"k": self.k})
         document_chain = create_stuff_documents_chain(self.model, rag_prompt)
         self.retrieval_chain = create_retrieval_chain(retriever, document_chain)
         logger.info("[RAG] System initialized")
 
+    def _open_chroma(self):
+        # Imported lazily, the array store does not need the chromadb stack
+        from langchain_chroma import Chroma
+
+        source = self._source_digest()
+        marker = self.templates_dir / CHROMA_SOURCE_FILE
+        if (self.templates_dir / "chroma.sqlite3").exists():
+            if marker.exists() and marker.read_text() == source:
+                logger.info("[RAG] Loading existing vector store...")
+                return Chroma(persist_directory=str(self.templates_dir), embedding_function=self.embeddings)
+            # Built from other templates, chunks or embeddings, e.g. pretty-printed before the codec
+            logger.info("[RAG] Templates changed since the vector store was built, rebuilding it...")
+            Chroma(persist_directory=str(self.templates_dir), embedding_function=self.embeddings).delete_collection()
+        else:
+            logger.info("[RAG] Creating new vector store...")
+        split_documents = self.text_splitter.split_documents(self.loader.load())
+        store = Chroma.from_documents(
+            documents=split_documents, embedding=self.embeddings, persist_directory=str(self.templates_dir)
+        )
+        marker.write_text(source)
+        return store
+
+    def _source_digest(self) -> str:
+        """Hash of the templates, deduplication, chunking and embeddings model the index
+        is built from."""
+        digest = hashlib.sha256()
+        model = getattr(self.embeddings, "model_key", None) or getattr(self.embeddings, "model", None)
+        digest.update(f"{model}|{CHUNK_SIZE}|{CHUNK_OVERLAP}|{self.loader.dedup_threshold}".encode())
+        for path in sorted(self.templates_dir.glob("*.json")):
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+        return digest.hexdigest()
+
+    def _open_array_store(self) -> ArrayVectorStore:
+        store = ArrayVectorStore(
+            self.index_dir,
+            self.embeddings,
+            dtype=settings.RAG_INDEX_DTYPE,
+            ann_threshold=settings.RAG_ANN_THRESHOLD,
+            nprobe=settings.RAG_ANN_NPROBE,
+        )
+        source = self._source_digest()
+        if not store.is_current(source):
+            logger.info("[RAG] Building the template index...")
+            documents = self.text_splitter.split_documents(self.loader.load())
+            vectors = self.embeddings.embed_documents([document.page_content for document in documents])
+            store.build(documents, vectors, source)
+        return store
+
     def query(
         self,
         question: str,
         archive: str = None,
         errors: str = None,
         guidelines: str = None,
+        solutions: str = None,
         DEBUG: bool = False,
     ) -> Dict:
         """Query the RAG system about workflow templates.
@@ -110,6 +193,7 @@ class TemplateRAG:
             archive: The archive of the discovered architectures
             errors: The errors that happened in the last archive workflow
             guidelines: The guidelines for the RAG system
+            solutions: Previously successful workflows for similar requests
 
         Returns:
             Dict containing the answer and other relevant information
@@ -117,19 +201,62 @@ class TemplateRAG:
         if not self.retrieval_chain:
             raise ValueError("RAG system not initialized. Call initialize() first.")
         if DEBUG:
-            rag_prompt = get_rag_prompt()
+            rag_prompt = get_rag_prompt(self.webhook_inputs)
             prompt = rag_prompt.format(
                 context="",
                 input=question,
                 archive=archive,
                 errors=errors,
                 guidelines=guidelines,
+                solutions=solutions or "",
             )
             response = self.model.invoke(prompt)
             return {"answer": response.content}
 
         return self.retrieval_chain.invoke(
-            {"input": question, "archive": archive, "errors": errors, "guidelines": guidelines}
+            {
+                "input": question,
+                "archive": archive,
+                "errors": errors,
+                "guidelines": guidelines,
+                "solutions": solutions or "",
+            }
+        )
+
+    async def aquery(
+        self,
+        question: str,
+        archive: str = None,
+        errors: str = None,
+        guidelines: str = None,
+        solutions: str = None,
+        DEBUG: bool = False,
+    ) -> Dict:
+        """Async version of `query`, so concurrent pipelines do not block the event
+        loop while waiting on the model."""
+        if not self.retrieval_chain:
+            raise ValueError("RAG system not initialized. Call initialize() first.")
+        if DEBUG:
+            rag_prompt = get_rag_prompt(self.webhook_inputs)
+            prompt = rag_prompt.format(
+                context="",
+                input=question,
+                archive=archive,
+                errors=errors,
+                guidelines=guidelines,
+                solutions=solutions or "",
+            )
+            response = await self.model.ainvoke(prompt)
+            return {"answer": response.content}
+
+        return await self.retrieval_chain.ainvoke(
+            {
+                "input": question,
+                "archive": archive,
+                "errors": errors,
+                "guidelines": guidelines,
+                "solutions": solutions or "",
+            }
         )
 
     def get_relevant_templates(self, query: str, k: int = 3) -> List[Document]:
@@ -148,11 +275,16 @@ class TemplateRAG:
 
 
 if __name__ == "__main__":
-    from .core import get_model
+    from .models import get_embeddings
+    from .router import get_route, get_router
+    from .usage import MeteredEmbeddings
 
-    print("Testing with Ollama model...")
-    # rag_model, rag_embeddings = get_model(model_id="ollama/llama3.2", format="json", temperature=0.2)
-    rag_model, rag_embeddings = get_model(model_id="openai/gpt-4o-mini", format="json", temperature=0.2)
+    # Same models as the RAG agent of `Agent`, e.g. "ollama/llama3.2"
+    model_id = "openai/gpt-4o-mini"
+    rag_model = get_router("rag", model_id, format="json", temperature=0.2)
+    embeddings_id = get_route("embeddings", get_route("rag", model_id)[0])[0]
+    embeddings = get_embeddings(embeddings_id)
+    rag_embeddings = MeteredEmbeddings(embeddings, f"{embeddings_id.split('/')[0]}/{embeddings.model}")
     rag = TemplateRAG(templates_dir=templates_dir, model=rag_model, embeddings=rag_embeddings)
 
     # 1. Test basic template querying
@@ -0,0 +1,196 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from loguru import logger
+
+from ..app.config import settings
+from ..app.services.resilience import (
+    CircuitOpenError,
+    UpstreamUnavailableError,
+    backoff_delay,
+    get_breaker,
+    is_transient,
+)
+from .models import get_model
+from .usage import usage_ledger
+
+# Weight of the latest call in the moving average of a candidate's latency
+LATENCY_EWMA_ALPHA = 0.3
+
+
+def _unavailable(error: Exception) -> bool:
+    """Whether a failed call says nothing about the request, e.g. a timeout or an open circuit."""
+    return isinstance(error, (TimeoutError, UpstreamUnavailableError)) or is_transient(error)
+
+
+class _Candidate:
+    def __init__(self, model_key: str, model: Runnable):
+        self.model_key = model_key
+        self.model = model
+        self.breaker = get_breaker(f"llm:{model_key}")
+        self.latency: Optional[float] = None
+        self.calls = 0
+        self.failures = 0
+
+    def observe(self, latency: float):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self.latency
+
+
+class ModelRouter(Runnable):
+    """Chat model serving an agent role from a chain of candidate models.
+
+    Each call goes to the first candidate and falls back to the next one when it
+    times out or fails, after retrying transient errors (e.g. rate limits) with
+    backoff. Candidates whose circuit is open are skipped. Once every candidate
+    failed, the call is not worth retrying as a whole: infrastructure failures are
+    raised as `UpstreamUnavailableError`, which callers do not retry. With
+    `latency_aware`, candidates are tried fastest first by their moving average
+    latency, unmeasured candidates first so they get measured.
+    """
+
+    def __init__(
+        self,
+        role: str,
+        candidates: List[Tuple[str, Runnable]],
+        timeout: Optional[float] = None,
+        latency_aware: bool = False,
+        max_attempts: Optional[int] = None,
+        base_delay: Optional[float] = None,
+    ):
+        """
+        Args:
+            role: Agent role served, e.g. "meta", for logging
+            candidates: (model ID, chat model) pairs in order of preference
+            timeout: Seconds before a call falls back to the next candidate
+            latency_aware: Whether to order candidates by observed latency
+            max_attempts: Calls per candidate on transient errors, defaults to
+                settings.RETRY_MAX_ATTEMPTS
+            base_delay: Initial backoff in seconds, defaults to settings.RETRY_BASE_DELAY
+        """
+        if not candidates:
+            raise ValueError(f"No model configured for the {role} role")
+        self.role = role
+        self.candidates = [_Candidate(model_key, model) for model_key, model in candidates]
+        self.timeout = timeout
+        self.latency_aware = latency_aware
+        self.max_attempts = max_attempts or settings.RETRY_MAX_ATTEMPTS
+        self.base_delay = settings.RETRY_BASE_DELAY if base_delay is None else base_delay
+
+    @property
+    def model_key(self) -> str:
+        return self.candidates[0].model_key
+
+    def ranked(self) -> List[_Candidate]:
+        if not self.latency_aware:
+            return list(self.candidates)
+        return sorted(self.candidates, key=lambda c: c.latency or 0.0)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        """Synchronous calls go to the preferred candidate without fallback, the
+        agents only use the async API."""
+        return self.candidates[0].model.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        errors: List[Tuple[str, Exception]] = []
+        for candidate in self.ranked():
+            try:
+                return await self._call(candidate, input, config, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                errors.append((candidate.model_key, e))
+                if not isinstance(e, CircuitOpenError):
+                    logger.warning(f"[Router] {self.role} call to {candidate.model_key} failed, falling back: {e}")
+
+        message = "; ".join(f"{model_key}: {type(e).__name__}: {e}" for model_key, e in errors)
+        defects = [e for _, e in errors if not _unavailable(e)]
+        if defects:
+            raise defects[-1]
+        # Nothing wrong with the request itself, keep it out of the reflection loop
+        raise UpstreamUnavailableError(f"llm:{self.role}", f"all models failed: {message}", errors[-1][1])
+
+    async def _call(self, candidate: _Candidate, input: Any, config: Optional[RunnableConfig], **kwargs: Any) -> Any:
+        """Call one candidate, retrying its transient errors."""
+        for attempt in range(1, self.max_attempts + 1):
+            candidate.breaker.before_call()
+            candidate.calls += 1
+            start = time.monotonic()
+            try:
+                response = await asyncio.wait_for(candidate.model.ainvoke(input, config, **kwargs), self.timeout)
+            except asyncio.CancelledError:
+                candidate.breaker.trial_in_flight = False
+                raise
+            except Exception as e:
+                usage_ledger.record(self.role, candidate.model_key, 0, 0, time.monotonic() - start, error=True)
+                candidate.failures += 1
+                if isinstance(e, asyncio.TimeoutError):
+                    # A timeout is at least as slow as the limit, and not retried on the same model
+                    candidate.breaker.record_failure()
+                    candidate.observe(self.timeout)
+                    raise TimeoutError(f"no response within {self.timeout}s") from e
+                if not is_transient(e):
+                    # The model answered, a bad request must not open its circuit for every role
+                    candidate.breaker.record_success()
+                    raise
+                candidate.breaker.record_failure()
+                if attempt == self.max_attempts:
+                    raise
+                delay = backoff_delay(e, attempt, self.base_delay)
+                logger.warning(
+                    f"[Router] Transient error from {candidate.model_key} ({e}), retry {attempt} in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+            latency = time.monotonic() - start
+            candidate.breaker.record_success()
+            candidate.observe(latency)
+            record = usage_ledger.record_chat(self.role, candidate.model_key, input, response, latency)
+            if record is not None and not record["estimated"]:
+                logger.info(
+                    f"[Router] {self.role} call to {candidate.model_key}: {record['input_tokens']} input tokens "
+                    f"({record['cached_tokens']} cached), {record['output_tokens']} output, {latency:.2f}s"
+                )
+            return response
+
+    def stats(self) -> Dict[str, Any]:
+        """Latency, call counts and circuit state of every candidate."""
+        return {
+            candidate.model_key: {
+                "latency_s": candidate.latency,
+                "calls": candidate.calls,
+                "failures": candidate.failures,
+                "circuit": candidate.breaker.state,
+            }
+            for candidate in self.ranked()
+        }
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "candidates":  # not set yet, avoid recursing during construction
+            raise AttributeError(name)
+        return getattr(self.candidates[0].model, name)
+
+
+def get_route(role: str, default_model_id: str) -> List[str]:
+    """Model IDs configured for an agent role in `settings.LLM_ROUTES`, in order of
+    preference, falling back to `default_model_id`."""
+    return settings.LLM_ROUTES.get(role) or [default_model_id]
+
+
+def get_router(
+    role: str,
+    default_model_id: str,
+    format: Literal["json", "text"] = "json",
+    temperature: Optional[float] = None,
+) -> ModelRouter:
+    """Build the router of an agent role from its configured route."""
+    candidates = [
+        (model_id, get_model(model_id=model_id, format=format, temperature=temperature)[0])
+        for model_id in get_route(role, default_model_id)
+    ]
+    logger.info(f"[Router] {role} agent: {' -> '.join(model_id for model_id, _ in candidates)}")
+    return ModelRouter(role, candidates, timeout=settings.LLM_TIMEOUT, latency_aware=settings.LLM_LATENCY_ROUTING)
@@ -0,0 +1,172 @@
+import asyncio
+import datetime
+import json
+import os
+import re
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+
+from ..app.config import data_dir
+from .codec import encode_workflow
+
+try:
+    import fcntl
+except ImportError:  # Windows, where a single process writes the cache
+    fcntl = None
+
+solutions_dir = data_dir / "solutions"
+
+# Values a request is parameterized by: URLs, emails, quoted strings, numbers and
+# capitalized words within a sentence, e.g. a city or a service
+_LITERAL = re.compile(
+    r"https?://[^\s,;]+|[\w.+-]+@[\w-]+\.[\w.]+|\"[^\"]+\"|'[^']+'|\d+(?:[.,:]\d+)*|(?<![.!?]\s)(?<!^)\b[A-Z][\w-]*"
+)
+
+
+class SolutionCache:
+    """Persistent store of successful pipeline runs with an embedding index over their
+    prompts.
+
+    Records are appended to `records.jsonl` and their normalized prompt embeddings
+    kept row-aligned in `embeddings.npy`, so a lookup is a single matrix-vector
+    product.
+
+    Several processes, e.g. the workers of `PipelinePool`, may share a directory:
+    writes are serialized by a file lock and each cache reloads the solutions the
+    others stored before a lookup.
+    """
+
+    def __init__(self, embeddings: Embeddings, directory: Path = solutions_dir):
+        """
+        Args:
+            embeddings: Embeddings model used for the prompts
+            directory: Directory holding the records and their embeddings
+        """
+        self.embeddings = embeddings
+        self.directory = directory
+        self.records_path = directory / "records.jsonl"
+        self.vectors_path = directory / "embeddings.npy"
+
+        self.records: List[Dict[str, Any]] = []
+        self.vectors: np.ndarray = None
+        # Sizes and times of the files last loaded, to notice writes of other processes
+        self.loaded: Optional[Tuple[int, int]] = None
+        if not self.refresh():
+            logger.warning("[Cache] Records and embeddings are out of sync, starting from an empty cache")
+        logger.info(f"[Cache] Loaded {len(self.records)} solution(s)")
+
+    def _file_state(self) -> Optional[Tuple[int, int]]:
+        try:
+            return self.records_path.stat().st_size, self.vectors_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> bool:
+        """Reload the solutions if the files changed since they were loaded.
+
+        Returns:
+            False if the records and embeddings are out of sync, e.g. while another
+            process writes them, keeping the solutions loaded before
+        """
+        state = self._file_state()
+        if state is None or state == self.loaded:
+            return True
+        self.loaded = state
+        with open(self.records_path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        vectors = np.load(self.vectors_path)
+        if len(vectors) != len(records):
+            self.loaded = None
+            return False
+        self.records, self.vectors = records, vectors
+        return True
+
+    @asynccontextmanager
+    async def _write_lock(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / ".lock", "w") as lock:
+            if fcntl is not None:
+                # Waited for in a thread, other runs go on while another process writes
+                await asyncio.to_thread(fcntl.flock, lock, fcntl.LOCK_EX)
+            yield
+
+    async def _embed(self, prompt: str) -> np.ndarray:
+        vector = np.asarray(await self.embeddings.aembed_query(prompt), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    async def lookup(self, prompt: str, k: int = 3) -> List[Tuple[float, Dict[str, Any]]]:
+        """Find the `k` cached solutions whose prompts are most similar to `prompt`.
+
+        Returns:
+            List of (cosine similarity, record) pairs, most similar first
+        """
+        self.refresh()
+        if not self.records:
+            return []
+        query = await self._embed(prompt)
+        if query.shape[0] != self.vectors.shape[1]:
+            logger.warning("[Cache] Embedding dimension changed, ignoring cached solutions")
+            return []
+        scores = self.vectors @ query
+        top = np.argsort(-scores)[:k]
+        return [(float(scores[i]), self.records[i]) for i in top]
+
+    async def add(
+        self,
+        prompt: str,
+        workflow: Dict[str, Any],
+        webhook_inputs: Dict[str, Dict[str, Any]],
+        responses: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Store a successful solution."""
+        vector = await self._embed(prompt)
+        record = {
+            "id": uuid.uuid4().hex,
+            "created_at": datetime.datetime.now().isoformat(),
+            "prompt": prompt,
+            "workflow": workflow,
+            "webhook_inputs": webhook_inputs,
+            "responses": responses,
+        }
+        async with self._write_lock():
+            self.refresh()
+            if self.vectors is not None and self.vectors.shape[1] != vector.shape[0]:
+                logger.warning("[Cache] Embedding dimension changed, not caching the solution")
+                return record
+
+            self.records.append(record)
+            self.vectors = vector[None, :] if self.vectors is None else np.vstack([self.vectors, vector])
+            # Readers load the embeddings whole, never half-written
+            partial = self.vectors_path.with_suffix(".tmp.npy")
+            np.save(partial, self.vectors)
+            os.replace(partial, self.vectors_path)
+            with open(self.records_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            self.loaded = self._file_state()
+        logger.info(f"[Cache] Stored solution {record['id']} ({len(self.records)} total)")
+        return record
+
+
+def prompt_literals(prompt: str) -> Set[str]:
+    """Parameter values of a prompt, see `_LITERAL`."""
+    return {literal.rstrip(".").lower() for literal in _LITERAL.findall(prompt.strip())}
+
+
+def same_parameters(prompt: str, other: str) -> bool:
+    """Whether two prompts name the same values, so a solution of one answers the
+    other. Prompts differing in a city, amount or URL are embedded very close."""
+    return prompt_literals(prompt) == prompt_literals(other)
+
+
+def format_solutions(matches: List[Tuple[float, Dict[str, Any]]]) -> str:
+    """Format cached solutions as context for the RAG agent."""
+    return "\n\n".join(
+        f"Request (similarity {score:.2f}): {record['prompt']}\nWorkflow:\n{encode_workflow(record['workflow'])}"
+        for score, record in matches
+    )
@@ -0,0 +1,39 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Sequence, Tuple
+
+# Stage name -> (names of the stages it depends on, async function taking their results)
+StageGraph = Dict[str, Tuple[Sequence[str], Callable[..., Awaitable[Any]]]]
+
+
+async def run_stage_graph(stages: StageGraph) -> Dict[str, Any]:
+    """Run the stages of a dependency graph, each as soon as its dependencies are done.
+
+    Stages must be listed after their dependencies. When a stage fails, the stages
+    still running are cancelled and its error is raised.
+
+    Returns:
+        Dict mapping each stage name to its result
+    """
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(name: str) -> Any:
+        dependencies, fn = stages[name]
+        return await fn(*[await tasks[dependency] for dependency in dependencies])
+
+    seen = set()
+    for name, (dependencies, _) in stages.items():
+        unknown = [dependency for dependency in dependencies if dependency not in seen]
+        if unknown:
+            raise ValueError(f"Stage {name} depends on {unknown}, which must be listed before it")
+        seen.add(name)
+    for name in stages:
+        tasks[name] = asyncio.create_task(run(name), name=name)
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return {name: task.result() for name, task in tasks.items()}
@@ -0,0 +1,179 @@
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import BaseMessage
+
+from ..app.config import settings
+from .context import iteration_var, run_id_var, stage_var
+from .models import count_tokens, estimate_tokens
+
+
+def estimate_cost(model_key: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+    """Cost in USD of a call with the prices of `settings.LLM_PRICES`, 0 for models
+    without a price (e.g. local Ollama models)."""
+    price = settings.LLM_PRICES.get(model_key)
+    if not price:
+        return 0.0
+    cached_price = price.get("cached_input", price.get("input", 0.0))
+    return (
+        (input_tokens - cached_tokens) * price.get("input", 0.0)
+        + cached_tokens * cached_price
+        + output_tokens * price.get("output", 0.0)
+    ) / 1_000_000
+
+
+class UsageLedger:
+    """Process-wide record of the tokens, latency and cost of every LLM and embedding
+    call, attributed to the pipeline run, iteration and stage of the calling task.
+
+    Records are buffered per run until `Agent.pipeline` moves them to the run store.
+    Calls made outside of a run are not recorded.
+    """
+
+    def __init__(self):
+        self.records: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+
+    def record(
+        self,
+        role: str,
+        model_key: str,
+        input_tokens: int,
+        output_tokens: int,
+        latency: float,
+        cached_tokens: int = 0,
+        estimated: bool = False,
+        error: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """Record a call of the current run.
+
+        Returns:
+            The record, None outside of a run
+        """
+        run_id = run_id_var.get()
+        if run_id is None:
+            return None
+        record = {
+            "iteration": iteration_var.get(),
+            "role": role,
+            "stage": stage_var.get(),
+            "model": model_key,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cached_tokens": cached_tokens,
+            "latency_s": latency,
+            "cost": estimate_cost(model_key, input_tokens, output_tokens, cached_tokens),
+            "estimated": estimated,
+            "error": error,
+            "created_at": time.time(),
+        }
+        self.records[run_id].append(record)
+        return record
+
+    def record_chat(
+        self, role: str, model_key: str, input: Any, response: Any, latency: float
+    ) -> Optional[Dict[str, Any]]:
+        """Record a chat model call from the usage metadata of its response, estimated
+        with tiktoken when the provider reports none."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            return self.record(
+                role,
+                model_key,
+                usage.get("input_tokens", 0),
+                usage.get("output_tokens", 0),
+                latency,
+                cached_tokens=(usage.get("input_token_details") or {}).get("cache_read", 0) or 0,
+            )
+        model_name = model_key.split("/", 1)[-1]
+        content = response.content if isinstance(response, BaseMessage) else str(response)
+        return self.record(
+            role,
+            model_key,
+            estimate_tokens(model_name, input, 0),
+            count_tokens(model_name, str(content)),
+            latency,
+            estimated=True,
+        )
+
+    def pop(self, run_id: str) -> List[Dict[str, Any]]:
+        return self.records.pop(run_id, [])
+
+
+usage_ledger = UsageLedger()
+
+
+def summarize_usage(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Totals of usage records, overall and per agent role and per stage."""
+
+    def totals(group: List[Dict[str, Any]]) -> Dict[str, Any]:
+        input_tokens = sum(r["input_tokens"] for r in group)
+        cached_tokens = sum(r["cached_tokens"] for r in group)
+        return {
+            "calls": len(group),
+            "input_tokens": input_tokens,
+            "output_tokens": sum(r["output_tokens"] for r in group),
+            "cached_tokens": cached_tokens,
+            # Share of the input tokens served from the provider's prompt cache
+            "cache_hit_rate": cached_tokens / input_tokens if input_tokens else 0.0,
+            "latency_s": sum(r["latency_s"] for r in group),
+            "cost": sum(r["cost"] for r in group),
+        }
+
+    by_role, by_stage = defaultdict(list), defaultdict(list)
+    for record in records:
+        by_role[record["role"]].append(record)
+        by_stage[record["stage"] or "other"].append(record)
+    return {
+        **totals(records),
+        "by_role": {role: totals(group) for role, group in by_role.items()},
+        "by_stage": {stage: totals(group) for stage, group in by_stage.items()},
+    }
+
+
+class MeteredEmbeddings(Embeddings):
+    """Embeddings wrapper recording every call in the usage ledger.
+
+    Embedding APIs report no usage through langchain, so tokens are counted with
+    tiktoken.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_key: str, ledger: UsageLedger = usage_ledger):
+        self.embeddings = embeddings
+        self.model_key = model_key
+        self.ledger = ledger
+
+    def _record(self, texts: List[str], start: float):
+        model_name = self.model_key.split("/", 1)[-1]
+        tokens = sum(count_tokens(model_name, text) for text in texts)
+        self.ledger.record("embeddings", self.model_key, tokens, 0, time.monotonic() - start, estimated=True)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.monotonic()
+        vectors = self.embeddings.embed_documents(texts)
+        self._record(texts, start)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        start = time.monotonic()
+        vector = self.embeddings.embed_query(text)
+        self._record([text], start)
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.monotonic()
+        vectors = await self.embeddings.aembed_documents(texts)
+        self._record(texts, start)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        start = time.monotonic()
+        vector = await self.embeddings.aembed_query(text)
+        self._record([text], start)
+        return vector
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "embeddings":  # not set yet, avoid recursing during construction
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
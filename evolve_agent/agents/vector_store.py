@@ -0,0 +1,253 @@
+"""Array-backed vector store of the template index.
+
+The normalized embeddings are kept in a `.npy` file opened memory-mapped, with the
+chunk texts and metadata in a row-aligned `documents.jsonl` sidecar. Opening the
+index reads no vectors, and concurrent workers share the pages through the OS cache.
+
+Search is an exact, vectorized top-k over the rows. Past `ann_threshold` rows an
+inverted-file (IVF) layer is built: rows are clustered around spherical k-means
+centroids and a query only scores the rows of its `nprobe` nearest clusters.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from loguru import logger
+
+# Rows converted to float32 at a time when scoring
+BLOCK_ROWS = 65536
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 50000
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _write_atomic(path: Path, write) -> None:
+    # Readers may have the previous file mapped, so a new file replaces it
+    tmp = path.with_name(path.name + ".tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+class ArrayVectorStore(VectorStore):
+    """Vector store of normalized embeddings in a memory-mapped array."""
+
+    def __init__(
+        self,
+        directory: Path,
+        embedding: Embeddings,
+        dtype: str = "float16",
+        ann_threshold: int = 20000,
+        nprobe: int = 8,
+    ):
+        """
+        Args:
+            directory: Directory of the index files
+            embedding: Embeddings model of the documents and queries
+            dtype: Storage type of the vectors, "float16" or "float32"
+            ann_threshold: Number of rows from which the IVF layer is built
+            nprobe: Number of clusters scored per query by the IVF layer
+        """
+        self.directory = Path(directory)
+        self.embedding = embedding
+        self.dtype = np.dtype(dtype)
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+
+        self.vectors_path = self.directory / "vectors.npy"
+        self.documents_path = self.directory / "documents.jsonl"
+        self.ivf_path = self.directory / "ivf.npz"
+        self.manifest_path = self.directory / "manifest.json"
+
+        self.manifest: Dict[str, Any] = {}
+        self.vectors: Optional[np.ndarray] = None
+        self.documents: List[Dict[str, Any]] = []
+        self.ivf: Optional[Dict[str, np.ndarray]] = None
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def _load(self):
+        if not (self.manifest_path.exists() and self.vectors_path.exists() and self.documents_path.exists()):
+            return
+        self.manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        self.vectors = np.load(self.vectors_path, mmap_mode="r")
+        with open(self.documents_path, "r", encoding="utf-8") as f:
+            self.documents = [json.loads(line) for line in f if line.strip()]
+        if len(self.documents) != len(self.vectors):
+            logger.warning("[VectorStore] Documents and vectors are out of sync, ignoring the index")
+            self.manifest, self.vectors, self.documents = {}, None, []
+            return
+        if self.ivf_path.exists():
+            with np.load(self.ivf_path) as ivf:
+                self.ivf = {key: ivf[key] for key in ivf.files}
+        logger.info(f"[VectorStore] Opened {len(self.documents)} vector(s) from {self.directory}")
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def is_current(self, source: str) -> bool:
+        """Whether the index was built from `source`, e.g. a hash of the templates and
+        embeddings model."""
+        return self.vectors is not None and self.manifest.get("source") == source
+
+    def build(self, documents: List[Document], vectors: np.ndarray, source: str = None):
+        """Replace the index with `documents` and their embeddings."""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32)).astype(self.dtype)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        def write_vectors(path: Path):
+            with open(path, "wb") as f:
+                np.save(f, vectors)
+
+        _write_atomic(self.vectors_path, write_vectors)
+
+        def write_documents(path: Path):
+            with open(path, "w", encoding="utf-8") as f:
+                for document in documents:
+                    record = {"page_content": document.page_content, "metadata": document.metadata}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        _write_atomic(self.documents_path, write_documents)
+
+        ivf = self._build_ivf(vectors) if len(vectors) >= self.ann_threshold else None
+        if ivf is not None:
+
+            def write_ivf(path: Path):
+                with open(path, "wb") as f:
+                    np.savez(f, **ivf)
+
+            _write_atomic(self.ivf_path, write_ivf)
+        elif self.ivf_path.exists():
+            self.ivf_path.unlink()
+
+        manifest = {"source": source, "count": len(vectors), "dimension": vectors.shape[1], "dtype": self.dtype.name}
+        _write_atomic(self.manifest_path, lambda path: path.write_text(json.dumps(manifest), encoding="utf-8"))
+        self.ivf = None
+        self._load()
+
+    def _build_ivf(self, vectors: np.ndarray) -> Dict[str, np.ndarray]:
+        n_lists = max(1, int(np.sqrt(len(vectors))))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), KMEANS_SAMPLE), replace=False)]
+        sample = sample.astype(np.float32)
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            for i in range(n_lists):
+                members = sample[assignments == i]
+                if len(members):
+                    centroids[i] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        assignments = np.concatenate(
+            [
+                np.argmax(vectors[start : start + BLOCK_ROWS].astype(np.float32) @ centroids.T, axis=1)
+                for start in range(0, len(vectors), BLOCK_ROWS)
+            ]
+        )
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+        logger.info(f"[VectorStore] Built an IVF layer of {n_lists} clusters over {len(vectors)} vectors")
+        return {"centroids": centroids, "order": order, "offsets": offsets}
+
+    def _candidates(self, query: np.ndarray, k: int) -> Optional[np.ndarray]:
+        """Rows of the `nprobe` clusters nearest to `query`, None to scan every row."""
+        if self.ivf is None:
+            return None
+        centroids, order, offsets = self.ivf["centroids"], self.ivf["order"], self.ivf["offsets"]
+        lists = _top_k(centroids @ query, self.nprobe)
+        rows = np.concatenate([order[offsets[i] : offsets[i + 1]] for i in lists])
+        if len(rows) < k:
+            return None
+        # Ascending rows read the mapped file sequentially
+        return np.sort(rows)
+
+    def search_vector(self, query: List[float], k: int = 4) -> List[Tuple[int, float]]:
+        """Find the `k` rows most similar to a query embedding.
+
+        Returns:
+            List of (row, cosine similarity) pairs, most similar first
+        """
+        if self.vectors is None or not len(self.vectors):
+            return []
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        if query.shape[0] != self.vectors.shape[1]:
+            raise ValueError(f"Query dimension {query.shape[0]} does not match the index ({self.vectors.shape[1]})")
+        rows = self._candidates(query, k)
+        if rows is None:
+            scores = np.concatenate(
+                [
+                    self.vectors[start : start + BLOCK_ROWS].astype(np.float32) @ query
+                    for start in range(0, len(self.vectors), BLOCK_ROWS)
+                ]
+            )
+            return [(int(i), float(scores[i])) for i in _top_k(scores, k)]
+        scores = self.vectors[rows].astype(np.float32) @ query
+        return [(int(rows[i]), float(scores[i])) for i in _top_k(scores, k)]
+
+    def _document(self, row: int) -> Document:
+        record = self.documents[row]
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [self._document(row) for row, _ in self.search_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return [(self._document(row), score) for row, score in self.search_vector(self.embedding.embed_query(query), k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(await self.embedding.aembed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        """Embed and append texts, rewriting the index."""
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [self._document(row) for row in range(len(self.documents))]
+        documents += [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+        new_vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        vectors = (
+            new_vectors if self.vectors is None else np.concatenate([self.vectors.astype(np.float32), new_vectors])
+        )
+        self.build(documents, vectors, self.manifest.get("source"))
+        return [str(row) for row in range(len(documents) - len(texts), len(documents))]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        directory: Path = None,
+        source: str = None,
+        **kwargs: Any,
+    ) -> "ArrayVectorStore":
+        store = cls(directory, embedding, **kwargs)
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+        store.build(documents, np.asarray(embedding.embed_documents(list(texts)), dtype=np.float32), source)
+        return store
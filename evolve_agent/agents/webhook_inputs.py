@@ -0,0 +1,317 @@
+"""Webhook inputs of generated workflows.
+
+The fields a webhook must receive show in the expressions of the nodes reading its
+request, e.g. `{{ $json.body.city }}` in a node right after the webhook or
+`$('Webhook').item.json.body.city` anywhere. They are used to check the sample
+inputs the RAG model answers together with the workflow, and to build inputs
+without an LLM call: each field gets a sample value of the type its expression
+suggests, e.g. a number when compared to one or a string when lowercased, else of
+the type its name suggests.
+
+A webhook whose body is read whole, e.g. by a Code node, or not at all cannot be
+resolved this way and is left to the input agent.
+"""
+
+import re
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+WEBHOOK_NODE_TYPE = "n8n-nodes-base.webhook"
+
+# `.city`, `["city"]` or `[0]`
+_ACCESS = r"""(?:\.[A-Za-z_$][\w$]*|\[\s*(?:'[^']*'|"[^"]*"|\d+)\s*\])"""
+_SEGMENT = re.compile(r"""\.([A-Za-z_$][\w$]*)|\[\s*(?:'([^']*)'|"([^"]*)"|(\d+))\s*\]""")
+# The request body in the JSON of an item and the accesses into it
+_BODY = r"""json(?:\.body|\[\s*['"]body['"]\s*\])(?P<rest>""" + _ACCESS + "*)"
+# `$json` and `$input.item.json` are the item of the node right before
+_DIRECT = re.compile(r"\$(?:input\.(?:item|first\(\)|last\(\)|all\(\)\[\d+\])\.)?" + _BODY)
+# `$('Webhook').item.json`, `$('Webhook').first().json` or `$node["Webhook"].json`
+_NAMED = re.compile(
+    r"""\$(?:\(\s*(?P<q1>['"])(?P<node>.+?)(?P=q1)\s*\)|node\[\s*(?P<q2>['"])(?P<node_key>.+?)(?P=q2)\s*\])"""
+    r"""(?:\.item|\.first\(\)|\.last\(\)|\.all\(\)\[\d+\])?\.""" + _BODY
+)
+
+_STRING_METHODS = {"toLowerCase", "toUpperCase", "trim", "split", "replace", "startsWith", "endsWith", "substring"}
+_ARRAY_METHODS = {"map", "filter", "join", "forEach", "find", "some", "every", "reduce"}
+_NUMBER_METHODS = {"toFixed", "toPrecision"}
+_NUMBER_BEFORE = re.compile(r"(?:Number|parseInt|parseFloat|Math\.\w+)\(\s*$")
+_NUMBER_AFTER = re.compile(r"^\s*(?:[*/%]|[<>]=?|-)\s*[\d$(]")
+_BOOLEAN_AFTER = re.compile(r"^\s*[!=]==?\s*(?:true|false)\b")
+# Types of the n8n filter operators, e.g. of the conditions of an If node
+_OPERATOR_TYPES = {"string": "string", "number": "number", "boolean": "boolean", "dateTime": "date", "array": "array"}
+
+_NUMBER_WORDS = {
+    "amount": 1000,
+    "income": 1000,
+    "price": 100,
+    "total": 100,
+    "age": 30,
+    "count": 2,
+    "quantity": 2,
+    "qty": 2,
+    "score": 5,
+    "rating": 5,
+    "year": 2025,
+    "limit": 10,
+    "page": 1,
+}
+_BOOLEAN_PREFIXES = {"is", "has", "can", "should", "enabled", "active"}
+_STRING_SAMPLES = [
+    ({"email", "mail"}, "jane.doe@example.com"),
+    ({"phone", "telephone", "tel", "mobile"}, "+15555550123"),
+    ({"url", "link", "website"}, "https://example.com"),
+    ({"date", "day"}, "2025-01-15"),
+    ({"time", "hour", "heure"}, "10:30"),
+    ({"id", "uuid"}, "12345"),
+    ({"name", "nom", "prenom", "firstname", "lastname", "username"}, "Jane Doe"),
+    ({"city", "ville"}, "Paris"),
+    ({"country"}, "France"),
+    ({"language", "lang"}, "en"),
+    (
+        {"message", "content", "text", "question", "prompt", "query", "input", "chatinput"},
+        "Hello, can you help me with my request?",
+    ),
+]
+
+Field = Tuple[Any, ...]  # body keys and list indexes leading to a value
+
+
+def _strings(value: Any) -> Iterator[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _strings(item)
+
+
+def _typed_strings(parameters: Any) -> Iterator[Tuple[str, Optional[str]]]:
+    """Strings of node parameters, with the type of the filter condition they belong to."""
+    if isinstance(parameters, dict):
+        operator = parameters.get("operator")
+        if "leftValue" in parameters and isinstance(operator, dict):
+            type_hint = _OPERATOR_TYPES.get(operator.get("type"))
+            for key in ("leftValue", "rightValue"):
+                for text in _strings(parameters.get(key)):
+                    yield text, type_hint
+            return
+        for value in parameters.values():
+            yield from _typed_strings(value)
+    elif isinstance(parameters, list):
+        for value in parameters:
+            yield from _typed_strings(value)
+    elif isinstance(parameters, str):
+        yield parameters, None
+
+
+def _successors(workflow: Dict[str, Any], name: str) -> Set[str]:
+    outputs = (workflow.get("connections") or {}).get(name) or {}
+    return {target.get("node") for branch in outputs.get("main") or [] for target in branch or []}
+
+
+def _reference(text: str, match: re.Match, type_hint: Optional[str]) -> Tuple[Field, Optional[str]]:
+    """Field of a body reference and the type its use suggests."""
+    field = []
+    for name, single, double, index in _SEGMENT.findall(match.group("rest")):
+        field.append(int(index) if index else name or single or double)
+    before, after = text[: match.start()], text[match.end() :]
+    if field and field[-1] == "length":
+        field.pop()
+    elif field and isinstance(field[-1], str) and after.lstrip().startswith("("):
+        method = field.pop()
+        if method in _STRING_METHODS:
+            type_hint = "string"
+        elif method in _ARRAY_METHODS:
+            type_hint = "array"
+        elif method in _NUMBER_METHODS:
+            type_hint = "number"
+    elif _NUMBER_BEFORE.search(before) or _NUMBER_AFTER.match(after):
+        type_hint = "number"
+    elif _BOOLEAN_AFTER.match(after):
+        type_hint = "boolean"
+    return tuple(field), type_hint
+
+
+class WebhookFields:
+    """Body fields the nodes of a workflow read from one webhook."""
+
+    def __init__(self, path: str):
+        self.path = path
+        # Type suggested by the uses of each field, None if none did
+        self.fields: Dict[Field, Optional[str]] = {}
+        # References to the whole body, whose fields are unknown
+        self.opaque = 0
+
+    @property
+    def resolved(self) -> bool:
+        """Whether the fields are known, so that an input can be built from them."""
+        return bool(self.fields) and not self.opaque
+
+    def add(self, field: Field, type_hint: Optional[str]):
+        if not field:
+            self.opaque += 1
+        elif self.fields.get(field) is None:
+            self.fields[field] = type_hint
+
+    def top_level(self) -> Set[str]:
+        return {field[0] for field in self.fields if isinstance(field[0], str)}
+
+
+def analyze_webhooks(workflow: Dict[str, Any]) -> Dict[str, WebhookFields]:
+    """Find the body fields every webhook of a workflow is read with.
+
+    Returns:
+        Dict mapping each webhook path to its fields
+    """
+    webhooks = {
+        node.get("name"): node["parameters"]["path"]
+        for node in workflow.get("nodes", [])
+        if node.get("type") == WEBHOOK_NODE_TYPE and (node.get("parameters") or {}).get("path")
+    }
+    analysis = {path: WebhookFields(path) for path in webhooks.values()}
+    readers = {name: _successors(workflow, name) for name in webhooks}
+    for node in workflow.get("nodes", []):
+        for text, type_hint in _typed_strings(node.get("parameters") or {}):
+            for match in _NAMED.finditer(text):
+                path = webhooks.get(match.group("node") or match.group("node_key"))
+                if path is not None:
+                    analysis[path].add(*_reference(text, match, type_hint))
+            for match in _DIRECT.finditer(text):
+                for name, successors in readers.items():
+                    if node.get("name") in successors:
+                        analysis[webhooks[name]].add(*_reference(text, match, type_hint))
+    return analysis
+
+
+def referenced_fields(workflow: Dict[str, Any]) -> Dict[str, Set[str]]:
+    """Top-level body fields the nodes of a workflow read from each of its webhooks."""
+    return {path: fields.top_level() for path, fields in analyze_webhooks(workflow).items()}
+
+
+def _words(name: str) -> List[str]:
+    return [word.lower() for word in re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+", name)]
+
+
+def _keyword(words: List[str], keywords) -> Optional[str]:
+    """First keyword among the words of a name, longer keywords also matching the
+    start or end of a word, e.g. "date" in "daterdv"."""
+    for word in words:
+        for keyword in keywords:
+            if word == keyword or (len(keyword) >= 4 and (word.startswith(keyword) or word.endswith(keyword))):
+                return keyword
+    return None
+
+
+def guess_type(name: str) -> str:
+    """Type of a field suggested by its name."""
+    words = _words(name)
+    if words and words[0] in _BOOLEAN_PREFIXES:
+        return "boolean"
+    if _keyword(words, _NUMBER_WORDS):
+        return "number"
+    return "string"
+
+
+def sample_value(name: str, type_hint: Optional[str]) -> Any:
+    """Plausible value of a field of a type, guessed from its name if None."""
+    type_hint = type_hint or guess_type(name)
+    words = _words(name)
+    if type_hint == "number":
+        return _NUMBER_WORDS.get(_keyword(words, _NUMBER_WORDS), 1)
+    if type_hint == "boolean":
+        return True
+    if type_hint == "array":
+        return [sample_value(name, "string")]
+    if type_hint == "date":
+        return "2025-01-15T10:30:00Z"
+    for keywords, sample in _STRING_SAMPLES:
+        if _keyword(words, keywords):
+            return sample
+    return f"sample {name}"
+
+
+def _child(container: Any, key: Any, default: Any) -> Any:
+    # Lists get a single element, whatever index the expressions read
+    if isinstance(container, list):
+        if not container or not isinstance(container[0], type(default)):
+            container[:1] = [default]
+        return container[0]
+    if not isinstance(container.get(key), type(default)):
+        container[key] = default
+    return container[key]
+
+
+def build_input(fields: Dict[Field, Optional[str]]) -> Dict[str, Any]:
+    """Input body holding a sample value of every field, nested as the fields read it."""
+    body: Dict[str, Any] = {}
+    # Shorter fields first, so that the values of longer ones replace them by containers
+    for field, type_hint in sorted(fields.items(), key=lambda item: len(item[0])):
+        container: Any = body
+        for key, next_key in zip(field, field[1:]):
+            container = _child(container, key, [] if isinstance(next_key, int) else {})
+        name = next((key for key in reversed(field) if isinstance(key, str)), "item")
+        value = sample_value(name, type_hint)
+        if isinstance(container, list):
+            if not container:
+                container.append(value)
+        elif not isinstance(container.get(field[-1]), (dict, list)):
+            container[field[-1]] = value
+    return body
+
+
+def synthesize_webhook_inputs(workflow: Dict[str, Any]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """Build the inputs of the webhooks of a workflow from the fields its nodes read.
+
+    Returns:
+        Tuple of the inputs keyed by webhook path and of the paths of the webhooks
+        whose fields are not known
+    """
+    inputs, unresolved = {}, []
+    for path, fields in analyze_webhooks(workflow).items():
+        if fields.resolved:
+            inputs[path] = build_input(fields.fields)
+        else:
+            unresolved.append(path)
+    return inputs, unresolved
+
+
+def unwrap_input(webhook_input: Any) -> Dict[str, Any]:
+    """Body of a webhook input, which models often wrap in a "body" key."""
+    if not isinstance(webhook_input, dict):
+        return {}
+    if isinstance(webhook_input.get("body"), dict):
+        return webhook_input["body"]
+    return webhook_input
+
+
+def validate_webhook_inputs(
+    workflow: Dict[str, Any], webhook_inputs: Any
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    """Check sample inputs against the fields the workflow reads from its webhooks.
+
+    Args:
+        workflow: The workflow the inputs were generated with
+        webhook_inputs: Inputs keyed by webhook path, as answered by the model
+
+    Returns:
+        Tuple of the valid inputs and of the problems of the others, both keyed by
+        webhook path
+    """
+    if not isinstance(webhook_inputs, dict):
+        webhook_inputs = {}
+    valid, problems = {}, {}
+    for path, fields in referenced_fields(workflow).items():
+        if path not in webhook_inputs:
+            problems[path] = "no input"
+            continue
+        if not isinstance(webhook_inputs[path], dict):
+            problems[path] = f"input is a {type(webhook_inputs[path]).__name__}, not an object"
+            continue
+        body = unwrap_input(webhook_inputs[path])
+        missing = sorted(field for field in fields if body.get(field) is None)
+        if missing:
+            problems[path] = f"missing field(s) {', '.join(missing)}"
+            continue
+        valid[path] = body
+    return valid, problems
@@ -1,3 +1,6 @@
+from pathlib import Path
+from typing import Dict, List
+
 from dotenv import load_dotenv
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -7,9 +10,90 @@ load_dotenv()
 
 
 class Settings(BaseSettings):
+    # Directory of the app log, run store, solutions and template index,
+    # evolve_agent/logs by default
+    DATA_DIR: str = Field(default="")
+
     # n8n settings
     N8N_BASE_URL: str = Field(default="http://n8n:5678")
     N8N_API_KEY: str = Field(default="your-n8n-api-key")
+    # Pool of n8n instances replacing N8N_BASE_URL, e.g.
+    # [{"name": "n8n-1", "url": "http://n8n-1:5678", "api_key": "..."}], the API key
+    # defaults to N8N_API_KEY
+    N8N_BACKENDS: List[Dict[str, str]] = Field(default_factory=list)
+    N8N_PLACEMENT: str = Field(default="least_load", description='"least_load" or "hash" of the workflow name')
+    N8N_HEALTH_INTERVAL: float = Field(default=15.0)
+    N8N_HEALTH_FAILURES: int = Field(default=2, description="Consecutive failed health checks ejecting a backend")
+
+    # Retry and circuit breaking for transient n8n / LLM errors
+    RETRY_MAX_ATTEMPTS: int = Field(default=3)
+    RETRY_BASE_DELAY: float = Field(default=0.5)
+    RETRY_MAX_DELAY: float = Field(default=8.0)
+    BREAKER_FAILURE_THRESHOLD: int = Field(default=5)
+    BREAKER_RESET_TIMEOUT: float = Field(default=30.0)
+
+    # Process-wide LLM budgets per model ID, from the limits of your provider account, e.g.
+    # LLM_RATE_LIMITS='{"openai/gpt-4o": {"rpm": 500, "tpm": 30000}}'. Models not listed
+    # are not throttled
+    LLM_RATE_LIMITS: Dict[str, Dict[str, float]] = Field(default_factory=dict)
+    # Completion tokens assumed when a model sets no max_tokens
+    LLM_DEFAULT_OUTPUT_TOKENS: int = Field(default=1024)
+
+    # Model IDs per agent role ("meta", "rag", "input") in order of fallback, e.g.
+    # {"input": ["ollama/llama3.2", "openai/gpt-4o-mini"]}. Roles not listed use the
+    # model of the agent. Only the first "embeddings" entry is used.
+    LLM_ROUTES: Dict[str, List[str]] = Field(default_factory=dict)
+    # Base URLs of Ollama or OpenAI-compatible endpoints per model ID
+    LLM_BASE_URLS: Dict[str, str] = Field(default_factory=dict)
+    LLM_TIMEOUT: float = Field(default=120.0, description="Seconds before falling back to the next model")
+    # USD per million tokens per model ID, for the usage ledger
+    LLM_PRICES: Dict[str, Dict[str, float]] = Field(
+        default_factory=lambda: {
+            "openai/gpt-4o": {"input": 2.5, "cached_input": 1.25, "output": 10.0},
+            "openai/gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.6},
+            "openai/text-embedding-3-large": {"input": 0.13},
+        }
+    )
+    LLM_LATENCY_ROUTING: bool = Field(default=False, description="Try the fastest model of a route first")
+
+    # Prompt similarity above which a cached solution answers a request directly, if both
+    # name the same values: prompts differing only in a city, amount or URL are often
+    # more similar than this. Lower it with care, revalidate_cache re-runs the hit on n8n
+    SOLUTION_CACHE_THRESHOLD: float = Field(default=0.92)
+    # Number of nearest cached solutions seeding the RAG context otherwise
+    SOLUTION_CACHE_SEED_K: int = Field(default=2)
+
+    # Template index: "chroma" or "array" (memory-mapped NumPy vectors, built in DATA_DIR
+    # on first start). Either index is rebuilt when the templates or embeddings change
+    RAG_VECTOR_STORE: str = Field(default="chroma")
+    RAG_INDEX_DTYPE: str = Field(default="float16", description="Storage type of the array index vectors")
+    # Similarity of node types and edges from which templates are indexed once, 0 to index all
+    RAG_DEDUP_THRESHOLD: float = Field(default=0.8)
+    # Rows from which the array index clusters its vectors and scores only the nearest clusters
+    RAG_ANN_THRESHOLD: int = Field(default=20000)
+    RAG_ANN_NPROBE: int = Field(default=8)
+
+    # Answer the webhook test inputs together with the workflow, the input agent only
+    # generates those missing or not matching the fields the workflow reads
+    FUSED_WEBHOOK_INPUTS: bool = Field(default=True)
+    # Build the webhook inputs from the body fields the nodes reference, without an LLM call
+    RULE_BASED_WEBHOOK_INPUTS: bool = Field(default=True)
+
+    # Seconds a finished pipeline or generation still answers identical requests
+    SINGLE_FLIGHT_GRACE: float = Field(default=10.0)
+
+    # "inline" runs pipelines in the app process, "process" in a pool of worker
+    # processes sharing the template index, of PIPELINE_WORKERS or one per CPU
+    PIPELINE_EXECUTOR: str = Field(default="inline")
+    PIPELINE_WORKERS: int = Field(default=0)
+    # Share of LLM_RATE_LIMITS kept by the app process with the "process" executor, for
+    # its own calls, e.g. of /agent/generate_workflow. The workers split the rest
+    PIPELINE_APP_RATE_SHARE: float = Field(default=0.1, gt=0, lt=1)
+
+    # Retention of the run store
+    RUN_STORE_MAX_AGE_DAYS: float = Field(default=30)
+    RUN_STORE_MAX_SIZE_MB: float = Field(default=500)
+    RUN_STORE_PRUNE_EVERY: int = Field(default=50, description="Prune after this many finished runs")
 
     class Config:
         env_file = ".env"
@@ -18,3 +102,4 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
+data_dir = Path(settings.DATA_DIR) if settings.DATA_DIR else Path(__file__).parent.parent / "logs"
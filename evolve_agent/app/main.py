@@ -1,16 +1,15 @@
-from pathlib import Path
-
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
+from .config import data_dir
 from .routes import router
+from .services.resilience import UpstreamUnavailableError
 from .utils import setup_logger
 
-project_root = Path(__file__).parent.parent
-
 API_PREFIX = "/api/v1"
 app = FastAPI(title="Evolve Agent", description="API for managing Evolve Agent")
-logger = setup_logger(project_root / "logs" / "app.log")
+logger = setup_logger(data_dir / "app.log")
 
 
 # CORS configuration
@@ -22,6 +21,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(UpstreamUnavailableError)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailableError) -> JSONResponse:
+    """Report exhausted transient n8n / LLM failures as 503 instead of 500."""
+    return JSONResponse(status_code=503, content={"detail": str(exc), "upstream": exc.upstream})
+
+
 # Include routes under the API prefix
 app.include_router(router, prefix=API_PREFIX)
 
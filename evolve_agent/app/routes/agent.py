@@ -1,19 +1,35 @@
-from typing import Any, Dict, Set, Tuple
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from loguru import logger
 
-from evolve_agent.agents.core import Agent
+from evolve_agent.agents.core import Agent, new_run_id
+from evolve_agent.agents.events import event_bus, format_sse
+from evolve_agent.agents.models import llm_scheduler
+from evolve_agent.agents.pipeline_pool import get_pipeline_pool
+from evolve_agent.agents.usage import summarize_usage
+from evolve_agent.app.config import settings
 from evolve_agent.app.schemas.agent import PipelineRequest, WorkflowRequest
 from evolve_agent.app.services.n8n_service import N8nService
+from evolve_agent.app.services.single_flight import Flight, SingleFlight, request_key
 
 router = APIRouter()
 agent = Agent()
 n8n_service = N8nService()
+# Worker processes running the pipelines, None to run them in this process
+pipeline_pool = get_pipeline_pool(agent.run_logs)
+if pipeline_pool is not None:
+    router.add_event_handler("startup", pipeline_pool.start)
+    router.add_event_handler("shutdown", pipeline_pool.close)
 
 # Track active WebSocket connections by client address
 active_clients: Set[str] = set()
 connection_logger_ids: Dict[str, int] = {}
+# Identical concurrent requests share one execution
+pipeline_flights = SingleFlight("pipeline", grace=settings.SINGLE_FLIGHT_GRACE)
+generation_flights = SingleFlight("generation", grace=settings.SINGLE_FLIGHT_GRACE)
 
 
 def get_client_id(websocket: WebSocket) -> str:
@@ -77,11 +93,152 @@ async def websocket_endpoint(websocket: WebSocket):
 @router.post("/generate_workflow")
 async def generate_workflow(request: WorkflowRequest) -> Dict[str, Any]:
     """Generate a new n8n workflow based on the prompt."""
-    workflow_json = agent.rag_generate_workflow(request.prompt)
-    return await n8n_service.create_workflow(workflow_json)
+
+    async def generate() -> Dict[str, Any]:
+        workflow_json = await agent.rag_generate_workflow(request.prompt)
+        return await n8n_service.create_workflow(workflow_json)
+
+    return await generation_flights.run(request_key("generate_workflow", request.prompt), generate)
+
+
+def join_pipeline(request: PipelineRequest) -> Flight:
+    """Join the pipeline running for the same request, or start one."""
+    params = request.model_dump(exclude={"prompt"})
+    run_id = new_run_id()
+    run = agent.pipeline if pipeline_pool is None else pipeline_pool.run
+    flight = pipeline_flights.join(
+        request_key("pipeline", request.prompt, **params),
+        lambda: run(request.prompt, run_id=run_id, **params),
+        run_id=run_id,
+    )
+    if flight.data["run_id"] == run_id:
+        event_bus.open(run_id)  # subscribers may connect before the pipeline starts
+    return flight
 
 
 @router.post("/pipeline")
 async def pipeline(request: PipelineRequest) -> Dict[str, Any]:
     """Generate a new n8n workflow based on the prompt with iterative refinement."""
-    return await agent.pipeline(request.prompt, request.max_iteration)
+    return await join_pipeline(request).wait()
+
+
+@router.post("/pipeline/start")
+async def start_pipeline(request: PipelineRequest) -> Dict[str, str]:
+    """Start a pipeline in the background and return its run ID, whose progress is
+    streamed by `/runs/{run_id}/events`."""
+    return {"run_id": join_pipeline(request).data["run_id"]}
+
+
+@router.get("/runs/{run_id}/events")
+async def stream_run_events(run_id: str, last_event_id: Optional[str] = Header(default=None)) -> StreamingResponse:
+    """Stream the progress events of a pipeline run as Server-Sent Events until it is
+    done. Reconnecting clients resume after their `Last-Event-ID`."""
+    if not event_bus.has_run(run_id):
+        raise HTTPException(status_code=404, detail=f"No events for run {run_id}")
+    try:
+        after = int(last_event_id or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Last-Event-ID must be an integer")
+
+    async def stream():
+        async for event in event_bus.subscribe(run_id, after):
+            yield format_sse(event)
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/scheduler")
+async def scheduler_stats() -> Dict[str, Any]:
+    """Queue depth, wait times and remaining budget of the shared LLM scheduler per
+    model, the coalesced duplicate requests and the pipeline workers."""
+    return {
+        "models": llm_scheduler.stats(),
+        "coalescing": {"pipeline": pipeline_flights.stats(), "generation": generation_flights.stats()},
+        "pool": pipeline_pool.stats() if pipeline_pool is not None else None,
+    }
+
+
+@router.get("/runs")
+async def list_runs(
+    status: Optional[str] = None,
+    prompt: Optional[str] = None,
+    workflow_hash: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = 50,
+) -> List[Dict[str, Any]]:
+    """List pipeline runs, most recent first, filtered by status, prompt, workflow
+    hash or creation time (Unix timestamps)."""
+    return await asyncio.to_thread(agent.run_store.list_runs, status, prompt, workflow_hash, since, until, limit)
+
+
+@router.get("/runs/{run_id}")
+async def get_run(run_id: str) -> Dict[str, Any]:
+    """Get a pipeline run with its result and attempts."""
+    run = await asyncio.to_thread(agent.run_store.get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+    return run
+
+
+@router.get("/runs/{run_id}/log", response_class=PlainTextResponse)
+async def get_run_log(run_id: str) -> str:
+    """Get the captured log of a pipeline run, so far if it is running."""
+    log = agent.run_logs.read(run_id)
+    if log is None:
+        log = await asyncio.to_thread(agent.run_store.get_log, run_id)
+    if log is None:
+        raise HTTPException(status_code=404, detail=f"No log for run {run_id}")
+    return log
+
+
+@router.get("/runs/{run_id}/usage")
+async def get_run_usage(run_id: str) -> Dict[str, Any]:
+    """Get every LLM and embedding call of a pipeline run with its totals."""
+    if await asyncio.to_thread(agent.run_store.get_run, run_id) is None:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+    calls = await asyncio.to_thread(agent.run_store.get_usage, run_id)
+    return {"totals": summarize_usage(calls), "calls": calls}
+
+
+@router.get("/usage")
+async def usage_report(
+    group_by: str = "role,stage",
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """Token and cost totals of all runs grouped by a comma-separated list of "day",
+    "role", "stage", "model" and "status", e.g. "day,stage" to spot prompt bloat."""
+    try:
+        columns = [column for column in group_by.split(",") if column]
+        return await asyncio.to_thread(agent.run_store.usage_report, columns, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/workflows/{digest}")
+async def get_stored_workflow(digest: str) -> Dict[str, Any]:
+    """Get a workflow recorded by a run attempt, by its content hash."""
+    workflow = await asyncio.to_thread(agent.run_store.get_workflow, digest)
+    if workflow is None:
+        raise HTTPException(status_code=404, detail=f"Workflow {digest} not found")
+    return workflow
+
+
+@router.post("/runs/compact")
+async def compact_runs() -> Dict[str, Any]:
+    """Prune old runs past the retention limits and reclaim the database space."""
+    return {"deleted": await asyncio.to_thread(agent.run_store.compact)}
+
+
+@router.get("/models")
+async def model_stats() -> Dict[str, Any]:
+    """Candidate models of every agent role with their latency, failures and circuit
+    state."""
+    return {
+        "meta": agent.agent_meta.stats(),
+        "rag": agent.agent_rag.model.stats(),
+        "input": agent.agent_input.stats(),
+    }
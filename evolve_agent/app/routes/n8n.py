@@ -26,13 +26,21 @@ async def import_workflow(workflow_json: Dict[str, Any]) -> Dict[str, Any]:
         raise HTTPException(status_code=500, detail=f"Failed to import workflow: {str(e)}")
 
 
+@router.get("/backends")
+async def get_backends() -> Dict[str, Any]:
+    """Health, circuit state and load of the n8n backends of the pool."""
+    return n8n_service.pool.stats()
+
+
 @router.get("/executions/{execution_id}")
 async def get_execution_results(
-    execution_id: str, include_data: bool = Query(True, description="Include detailed execution data")
+    execution_id: str,
+    include_data: bool = Query(True, description="Include detailed execution data"),
+    backend: Optional[str] = Query(None, description="n8n backend of the execution, IDs are unique per backend"),
 ) -> Dict[str, Any]:
     """Get detailed results of a workflow execution."""
     try:
-        return await n8n_service.get_execution_results(execution_id, include_data)
+        return await n8n_service.get_execution_results(execution_id, include_data, backend)
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Execution {execution_id} not found")
 
@@ -58,11 +66,12 @@ async def call_webhook(
     webhook_path: str,
     data: Dict[str, Any],
     method: str = Query("POST", description="HTTP method to use for the webhook call"),
+    workflow_id: Optional[str] = Query(None, description="Workflow of the webhook, if several share its path"),
 ) -> Dict[str, Any]:
     """Call a webhook with the specified path and data."""
     try:
         webhook_method = HTTPMethod(method.upper())
-        return await n8n_service.call_webhook(webhook_path, webhook_method, data)
+        return await n8n_service.call_webhook(webhook_path, webhook_method, data, workflow_id=workflow_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid HTTP method: {method}")
     except Exception as e:
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 
 class WorkflowRequest(BaseModel):
@@ -8,3 +10,14 @@ class WorkflowRequest(BaseModel):
 class PipelineRequest(BaseModel):
     prompt: str
     max_iteration: int = 5
+    fitness_cases: int = Field(default=0, ge=0, description="Synthetic test cases scoring each candidate, 0 to disable")
+    min_pass_rate: float = Field(default=1.0, ge=0.0, le=1.0, description="Pass rate a candidate must reach")
+    use_cache: bool = Field(default=True, description="Reuse or seed from solutions of similar past requests")
+    revalidate_cache: bool = Field(default=True, description="Re-run a cached solution on n8n before returning it")
+    patch_refinement: bool = Field(default=True, description="Fix failed workflows with edit operations")
+    deadline_s: Optional[float] = Field(default=None, gt=0, description="Wall-clock seconds before returning early")
+    max_tokens: Optional[int] = Field(default=None, gt=0, description="LLM tokens before returning early")
+    max_deployments: Optional[int] = Field(default=None, gt=0, description="Workflows created on n8n at most")
+    stagnation_limit: int = Field(
+        default=2, ge=0, description="Stop after this many reflections leave the workflow unchanged, 0 to disable"
+    )
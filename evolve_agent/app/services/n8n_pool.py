@@ -0,0 +1,260 @@
+"""Pool of n8n backends shared by every `N8nService` of the process.
+
+New workflows are placed on a healthy backend, by least load or by consistent
+(rendezvous) hashing of their name, and stay pinned to it together with their
+webhook paths, so every later call reaches the instance that holds the workflow.
+Webhook calls of a known workflow are routed by its ID, as several workflows on
+different backends may share a path; the path alone routes to the last one created.
+Workflows the pool has not placed, e.g. after a restart, are looked up on every
+backend once.
+
+A background health check ejects a backend from placement after
+`N8N_HEALTH_FAILURES` consecutive failed probes and readmits it on the first
+successful one. Pinned workflows keep being served by their backend.
+"""
+
+import asyncio
+import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import httpx
+from loguru import logger
+
+from ..config import settings
+from .resilience import UpstreamUnavailableError, get_breaker
+
+# Pinned workflows and webhook paths kept, the oldest are looked up again when needed
+MAX_PINS = 100_000
+HEALTH_TIMEOUT = 5.0
+
+
+class N8nBackend:
+    def __init__(self, name: str, base_url: str, api_key: str, upstream: str = None):
+        """
+        Args:
+            name: Name of the backend in the pool
+            base_url: Base URL of the n8n instance
+            api_key: API key of the n8n instance
+            upstream: Circuit breaker name, `n8n:<name>` by default
+        """
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_url = f"{self.base_url}/api/v1"
+        self.webhook_url = f"{self.base_url}/webhook"
+        self.headers = {"X-N8N-API-KEY": api_key, "Content-Type": "application/json"}
+        self.upstream = upstream or f"n8n:{name}"
+
+        self.in_flight = 0
+        self.workflows = 0
+        self.healthy = True
+        self.failed_checks = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        """Whether new workflows may be placed on the backend."""
+        return self.healthy and get_breaker(self.upstream).state != "open"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "circuit": get_breaker(self.upstream).state,
+            "in_flight": self.in_flight,
+            "workflows": self.workflows,
+            "last_error": self.last_error,
+        }
+
+
+class N8nBackendPool:
+    def __init__(
+        self,
+        backends: List[N8nBackend],
+        placement: str = "least_load",
+        health_interval: float = 15.0,
+        health_failures: int = 2,
+    ):
+        """
+        Args:
+            backends: The n8n instances of the pool
+            placement: "least_load" or "hash", how new workflows are placed
+            health_interval: Seconds between two health checks
+            health_failures: Consecutive failed checks ejecting a backend
+        """
+        if not backends:
+            raise ValueError("An n8n backend pool needs at least one backend")
+        if placement not in ("least_load", "hash"):
+            raise ValueError(f"Unknown placement {placement!r}, expected 'least_load' or 'hash'")
+        self.backends = {backend.name: backend for backend in backends}
+        self.placement = placement
+        self.health_interval = health_interval
+        self.health_failures = health_failures
+        self.workflow_pins: OrderedDict = OrderedDict()  # workflow ID -> backend name
+        self.webhook_pins: OrderedDict = OrderedDict()  # webhook path -> backend name
+        self.health_task: Optional[asyncio.Task] = None
+
+    @property
+    def single(self) -> Optional[N8nBackend]:
+        """The only backend of a pool of one, which needs no placement nor lookup."""
+        return next(iter(self.backends.values())) if len(self.backends) == 1 else None
+
+    def place(self, key: str = "") -> N8nBackend:
+        """Choose the backend of a new workflow.
+
+        Raises:
+            UpstreamUnavailableError: If every backend is ejected or its circuit open
+        """
+        self.ensure_health_checks()
+        if self.single:
+            return self.single
+        candidates = [backend for backend in self.backends.values() if backend.available]
+        if not candidates:
+            raise UpstreamUnavailableError("n8n", "no healthy n8n backend")
+        if self.placement == "hash":
+
+            def weight(backend: N8nBackend) -> int:
+                digest = hashlib.blake2b(f"{backend.name}|{key}".encode(), digest_size=8).digest()
+                return int.from_bytes(digest, "big")
+
+            return max(candidates, key=weight)
+        return min(candidates, key=lambda backend: (backend.in_flight, backend.workflows))
+
+    def pin(self, workflow_id: str, backend: N8nBackend, webhook_paths: List[str] = ()):
+        """Route the later calls of a workflow and of its webhooks to `backend`."""
+        self.unpin(workflow_id)
+        self.workflow_pins[workflow_id] = backend.name
+        backend.workflows += 1
+        while len(self.workflow_pins) > MAX_PINS:
+            self.unpin(next(iter(self.workflow_pins)))
+        for path in webhook_paths:
+            self.webhook_pins[path] = backend.name
+            self.webhook_pins.move_to_end(path)
+        while len(self.webhook_pins) > MAX_PINS:
+            self.webhook_pins.popitem(last=False)
+
+    def unpin(self, workflow_id: str):
+        name = self.workflow_pins.pop(workflow_id, None)
+        if name in self.backends:
+            self.backends[name].workflows -= 1
+
+    def get(self, name: str) -> N8nBackend:
+        if name not in self.backends:
+            raise ValueError(f"Unknown n8n backend {name!r}")
+        return self.backends[name]
+
+    async def resolve(self, workflow_id: str) -> N8nBackend:
+        """Backend holding a workflow, looked up on every backend if not pinned.
+
+        Falls back to the first backend if no backend has it, so the call fails with
+        the usual 404.
+        """
+        name = self.workflow_pins.get(workflow_id)
+        if name in self.backends:
+            return self.backends[name]
+        if self.single:
+            return self.single
+        for backend in self.backends.values():
+            try:
+                async with httpx.AsyncClient(timeout=HEALTH_TIMEOUT) as client:
+                    response = await client.get(f"{backend.api_url}/workflows/{workflow_id}", headers=backend.headers)
+            except httpx.HTTPError as e:
+                logger.warning(f"[N8N] Could not look up workflow {workflow_id} on {backend.name}: {e}")
+                continue
+            if response.status_code == 200:
+                self.pin(workflow_id, backend, self.webhook_paths(response.json()))
+                return backend
+        logger.warning(f"[N8N] Workflow {workflow_id} not found on any backend")
+        return next(iter(self.backends.values()))
+
+    def resolve_webhook(self, path: str) -> N8nBackend:
+        """Backend serving a webhook path, the least loaded one if it is not pinned."""
+        name = self.webhook_pins.get(path)
+        if name in self.backends:
+            return self.backends[name]
+        return self.place(path)
+
+    @staticmethod
+    def webhook_paths(workflow: Dict[str, Any]) -> List[str]:
+        return [
+            node["parameters"]["path"]
+            for node in workflow.get("nodes", [])
+            if node.get("type") == "n8n-nodes-base.webhook" and (node.get("parameters") or {}).get("path")
+        ]
+
+    @contextmanager
+    def track(self, backend: N8nBackend):
+        """Count a call in flight on `backend` for least-load placement."""
+        backend.in_flight += 1
+        try:
+            yield
+        finally:
+            backend.in_flight -= 1
+
+    async def check_health(self):
+        """Probe every backend once, ejecting or readmitting it."""
+
+        async def probe(backend: N8nBackend):
+            try:
+                async with httpx.AsyncClient(timeout=HEALTH_TIMEOUT) as client:
+                    response = await client.get(
+                        f"{backend.api_url}/workflows", headers=backend.headers, params={"limit": 1}
+                    )
+                    response.raise_for_status()
+            except httpx.HTTPError as e:
+                backend.failed_checks += 1
+                backend.last_error = f"{type(e).__name__}: {e}"
+                if backend.healthy and backend.failed_checks >= self.health_failures:
+                    backend.healthy = False
+                    logger.warning(f"[N8N] Ejected backend {backend.name}: {backend.last_error}")
+                return
+            if not backend.healthy:
+                logger.info(f"[N8N] Readmitted backend {backend.name}")
+            backend.healthy, backend.failed_checks, backend.last_error = True, 0, None
+
+        await asyncio.gather(*(probe(backend) for backend in self.backends.values()))
+
+    async def _health_loop(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_interval)
+
+    def ensure_health_checks(self):
+        """Start the background health checks of a pool of several backends, once an
+        event loop runs."""
+        if self.single or (self.health_task is not None and not self.health_task.done()):
+            return
+        try:
+            self.health_task = asyncio.get_running_loop().create_task(self._health_loop())
+        except RuntimeError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"placement": self.placement, "backends": [backend.stats() for backend in self.backends.values()]}
+
+
+_pool: Optional[N8nBackendPool] = None
+
+
+def get_backend_pool() -> N8nBackendPool:
+    """Get the process-wide pool of `settings.N8N_BACKENDS`, or of the single
+    `settings.N8N_BASE_URL` backend."""
+    global _pool
+    if _pool is None:
+        if settings.N8N_BACKENDS:
+            backends = [
+                N8nBackend(b.get("name") or f"n8n-{i + 1}", b["url"], b.get("api_key", settings.N8N_API_KEY))
+                for i, b in enumerate(settings.N8N_BACKENDS)
+            ]
+        else:
+            # Same circuit breaker name as before pools existed
+            backends = [N8nBackend("default", settings.N8N_BASE_URL, settings.N8N_API_KEY, upstream="n8n")]
+        _pool = N8nBackendPool(
+            backends,
+            placement=settings.N8N_PLACEMENT,
+            health_interval=settings.N8N_HEALTH_INTERVAL,
+            health_failures=settings.N8N_HEALTH_FAILURES,
+        )
+    return _pool
@@ -5,18 +5,34 @@ from loguru import logger
 
 from ..config import settings
 from ..schemas.workflow import HTTPMethod, WebhookNodeParameters
+from .n8n_pool import N8nBackend, N8nBackendPool, get_backend_pool
+from .resilience import call_with_retry
 
 
 class N8nService:
-    def __init__(self):
-        self.base_url = settings.N8N_BASE_URL
-        self.prefix = "api/v1"
-        self.webhook_prefix = "webhook"
-        self.api_url = f"{self.base_url}/{self.prefix}"
-        self.webhook_url = f"{self.base_url}/{self.webhook_prefix}"
+    """Client of the n8n API and webhooks over the process-wide backend pool, see
+    `n8n_pool`. Calls about a workflow go to the backend holding it."""
 
-        self.api_key = settings.N8N_API_KEY
-        self.headers = {"X-N8N-API-KEY": self.api_key, "Content-Type": "application/json"}
+    def __init__(self, pool: N8nBackendPool = None):
+        self.pool = pool or get_backend_pool()
+
+    async def _request(
+        self, backend: N8nBackend, method: str, path: str, webhook: bool = False, **kwargs
+    ) -> httpx.Response:
+        url = f"{backend.webhook_url if webhook else backend.api_url}/{path}"
+        with self.pool.track(backend):
+            async with httpx.AsyncClient() as client:
+                response = await client.request(method, url, headers=backend.headers, **kwargs)
+                response.raise_for_status()
+                return response
+
+    async def _call(
+        self, backend: N8nBackend, method: str, path: str, idempotent: bool = True, **kwargs
+    ) -> httpx.Response:
+        """Request a backend with retries against its own circuit breaker."""
+        return await call_with_retry(
+            backend.upstream, self._request, backend, method, path, idempotent=idempotent, **kwargs
+        )
 
     @staticmethod
     def get_webhooks(json_data: Dict[str, Any]) -> List[WebhookNodeParameters]:
@@ -50,17 +66,22 @@ class N8nService:
         }
         return workflow_data
 
-    async def call_webhook(self, webhook_path: str, webhook_method: HTTPMethod, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Call a webhook."""
-        async with httpx.AsyncClient() as client:
-            response = await client.request(
-                method=webhook_method.value,
-                url=f"{self.webhook_url}/{webhook_path}",
-                headers=self.headers,
-                json=data,
-            )
-            response.raise_for_status()
-            return response.json()
+    async def call_webhook(
+        self, webhook_path: str, webhook_method: HTTPMethod, data: Dict[str, Any], workflow_id: str = None
+    ) -> Dict[str, Any]:
+        """Call a webhook, on the backend holding `workflow_id` if given.
+
+        Without a workflow ID, the call goes to the backend of the last workflow created
+        with the path, which may belong to another run if several use the same path.
+        """
+        if workflow_id is not None:
+            backend = await self.pool.resolve(workflow_id)
+        else:
+            backend = self.pool.resolve_webhook(webhook_path)
+        response = await self._call(
+            backend, webhook_method.value, webhook_path, webhook=True, idempotent=False, json=data
+        )
+        return response.json()
 
     async def get_filtered_workflows(
         self,
@@ -83,7 +104,9 @@ class N8nService:
             cursor: Pagination cursor from previous response
 
         Returns:
-            Dict containing workflow data and next cursor
+            Dict containing workflow data and next cursor. With several backends the
+            pages of each backend follow each other and every workflow has a "backend"
+            key.
         """
         params = {}
         if active is not None:
@@ -99,30 +122,58 @@ class N8nService:
         if cursor:
             params["cursor"] = cursor
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{self.api_url}/workflows", headers=self.headers, params=params)
-            response.raise_for_status()
-            return response.json()
+        if self.pool.single:
+            return (await self._call(self.pool.single, "GET", "workflows", params=params)).json()
+
+        # Pool cursors are "<backend>:<cursor of the backend>"
+        names = list(self.pool.backends)
+        name, _, backend_cursor = (cursor or f"{names[0]}:").partition(":")
+        backend = self.pool.get(name)
+        if backend_cursor:
+            params["cursor"] = backend_cursor
+        else:
+            params.pop("cursor", None)
+        page = (await self._call(backend, "GET", "workflows", params=params)).json()
+        for workflow in page.get("data", []):
+            workflow["backend"] = backend.name
+            self.pool.pin(workflow["id"], backend, self.pool.webhook_paths(workflow))
+        if page.get("nextCursor"):
+            page["nextCursor"] = f"{backend.name}:{page['nextCursor']}"
+        elif names.index(name) + 1 < len(names):
+            page["nextCursor"] = f"{names[names.index(name) + 1]}:"
+        return page
 
     async def create_workflow(self, json_data: Dict[str, Any], is_webhook: bool = True) -> Dict[str, Any]:
-        """Create a new workflow in n8n."""
+        """Create a new workflow in n8n, on the backend chosen by the pool."""
         workflow_data = self.convert_json_to_workflow(json_data)
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f"{self.api_url}/workflows", headers=self.headers, json=workflow_data)
-            response.raise_for_status()
-            workflow = response.json()
-            return workflow
+        backend = self.pool.place(workflow_data["name"])
+        workflow = (await self._call(backend, "POST", "workflows", idempotent=False, json=workflow_data)).json()
+        self.pool.pin(workflow["id"], backend, self.pool.webhook_paths(workflow))
+        logger.debug(f"[N8N] Created workflow {workflow['id']} on backend {backend.name}")
+        return workflow
 
-    async def get_execution_results(self, execution_id: str, include_data: bool = True) -> Dict[str, Any]:
+    async def get_execution_results(
+        self, execution_id: str, include_data: bool = True, backend: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Get the results of a workflow execution, including all outputs, warnings, and
-        errors."""
-        async with httpx.AsyncClient() as client:
-            url = f"{self.api_url}/executions/{execution_id}"
-            if include_data:
-                url += "?includeData=true"
-            response = await client.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
+        errors.
+
+        Execution IDs are only unique per n8n instance, so with several backends the
+        first backend having the execution answers unless `backend` names one.
+        """
+        params = {"includeData": "true"} if include_data else {}
+        if backend is not None or self.pool.single:
+            target = self.pool.get(backend) if backend is not None else self.pool.single
+            return (await self._call(target, "GET", f"executions/{execution_id}", params=params)).json()
+        error = None
+        for target in self.pool.backends.values():
+            try:
+                return (await self._call(target, "GET", f"executions/{execution_id}", params=params)).json()
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 404:
+                    raise
+                error = e
+        raise error
 
     async def get_workflow_executions(
         self, workflow_id: str, status: Optional[str] = None, limit: int = 100, include_data: bool = True
@@ -135,33 +186,27 @@ class N8nService:
         if status:
             params["status"] = status
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{self.api_url}/executions", headers=self.headers, params=params)
-            response.raise_for_status()
-            return response.json()["data"]
+        backend = await self.pool.resolve(workflow_id)
+        return (await self._call(backend, "GET", "executions", params=params)).json()["data"]
 
     async def get_workflow(self, workflow_id: str) -> Dict[str, Any]:
         """Get workflow details by ID."""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{self.api_url}/workflows/{workflow_id}", headers=self.headers)
-            response.raise_for_status()
-            return response.json()
+        backend = await self.pool.resolve(workflow_id)
+        return (await self._call(backend, "GET", f"workflows/{workflow_id}")).json()
 
     async def update_workflow(self, workflow_id: str, json_data: Dict[str, Any]) -> Dict[str, Any]:
         """Update an existing workflow."""
         workflow_data = self.convert_json_to_workflow(json_data)
-        async with httpx.AsyncClient() as client:
-            response = await client.put(
-                f"{self.api_url}/workflows/{workflow_id}", headers=self.headers, json=workflow_data
-            )
-            response.raise_for_status()
-            return response.json()
+        backend = await self.pool.resolve(workflow_id)
+        workflow = (await self._call(backend, "PUT", f"workflows/{workflow_id}", json=workflow_data)).json()
+        self.pool.pin(workflow_id, backend, self.pool.webhook_paths(workflow))
+        return workflow
 
     async def delete_workflow(self, workflow_id: str) -> None:
         """Delete a workflow."""
-        async with httpx.AsyncClient() as client:
-            response = await client.delete(f"{self.api_url}/workflows/{workflow_id}", headers=self.headers)
-            response.raise_for_status()
+        backend = await self.pool.resolve(workflow_id)
+        await self._call(backend, "DELETE", f"workflows/{workflow_id}")
+        self.pool.unpin(workflow_id)
 
     async def delete_all_workflows(
         self,
@@ -220,21 +265,18 @@ class N8nService:
             If successful, returns {"success": True, "status": "active"}.
             If failed, returns {"success": False, "error": error_message}.
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(f"{self.api_url}/workflows/{workflow_id}/activate", headers=self.headers)
-                response.raise_for_status()
-                return {"success": True, "status": "active"}
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 400:
-                    error_msg = e.response.json().get("message", "Failed to activate workflow")
-                    logger.error(f"[N8N] Failed to activate workflow {workflow_id}: {error_msg}")
-                    return {"success": False, "error": error_msg}
-                raise  # Re-raise other HTTP errors
+        backend = await self.pool.resolve(workflow_id)
+        try:
+            await self._call(backend, "POST", f"workflows/{workflow_id}/activate")
+            return {"success": True, "status": "active"}
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 400:
+                error_msg = e.response.json().get("message", "Failed to activate workflow")
+                logger.error(f"[N8N] Failed to activate workflow {workflow_id}: {error_msg}")
+                return {"success": False, "error": error_msg}
+            raise  # Re-raise other HTTP errors
 
     async def deactivate_workflow(self, workflow_id: str) -> bool:
         """Deactivate a workflow."""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f"{self.api_url}/workflows/{workflow_id}/deactivate", headers=self.headers)
-            response.raise_for_status()
-            return response.json()["active"]
+        backend = await self.pool.resolve(workflow_id)
+        return (await self._call(backend, "POST", f"workflows/{workflow_id}/deactivate")).json()["active"]
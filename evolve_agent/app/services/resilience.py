@@ -0,0 +1,199 @@
+import asyncio
+import functools
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+import openai
+from loguru import logger
+
+from ..config import settings
+
+# Status codes that say nothing about the workflow itself. A plain 500 is left out on
+# purpose: n8n answers a failing webhook execution with 500, which is a workflow defect.
+TRANSIENT_STATUS_CODES = {408, 425, 429, 502, 503, 504}
+
+# Status codes returned before the upstream did any work, safe to retry even for calls
+# with side effects such as executing a workflow.
+REJECTED_STATUS_CODES = {429, 503}
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised when an upstream (n8n, LLM provider) keeps failing with transient errors
+    or its circuit is open."""
+
+    def __init__(self, upstream: str, message: str, original_error: Exception = None):
+        self.upstream = upstream
+        self.message = message
+        self.original_error = original_error
+        super().__init__(f"{upstream}: {message}")
+
+    def __reduce__(self):
+        # Picklable, e.g. to be raised again by the app after failing in a worker process
+        return type(self), (self.upstream, self.message)
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """Raised without calling the upstream while its circuit is open."""
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code
+    return None
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether an error comes from the infrastructure rather than from the
+    workflow."""
+    if isinstance(error, (httpx.TransportError, openai.APIConnectionError)):
+        return True
+    return _status_code(error) in TRANSIENT_STATUS_CODES
+
+
+def is_safe_to_retry(error: Exception, idempotent: bool) -> bool:
+    """Whether a transient error may be retried without repeating side effects."""
+    if idempotent:
+        return True
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+        return True
+    return _status_code(error) in REJECTED_STATUS_CODES
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None) or getattr(getattr(error, "original_error", None), "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(error: Exception, attempt: int, base_delay: float) -> float:
+    """Seconds before retrying a transient error: its Retry-After, or full-jitter
+    exponential backoff."""
+    return _retry_after(error) or random.uniform(0, min(settings.RETRY_MAX_DELAY, base_delay * 2**attempt))
+
+
+class CircuitBreaker:
+    """Per-upstream circuit breaker.
+
+    After `failure_threshold` consecutive transient failures the circuit opens and
+    calls fail fast. Once `reset_timeout` seconds have passed a single trial call is
+    let through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self.trial_in_flight):
+            raise CircuitOpenError(self.name, "circuit open, failing fast")
+        if state == "half_open":
+            self.trial_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"[Resilience] Circuit for {self.name} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+
+breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    """Get the process-wide circuit breaker of an upstream."""
+    if upstream not in breakers:
+        breakers[upstream] = CircuitBreaker(
+            upstream,
+            failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.BREAKER_RESET_TIMEOUT,
+        )
+    return breakers[upstream]
+
+
+async def call_with_retry(
+    upstream: str,
+    fn: Callable[..., Awaitable[Any]],
+    *args,
+    idempotent: bool = True,
+    max_attempts: Optional[int] = None,
+    base_delay: Optional[float] = None,
+    **kwargs,
+) -> Any:
+    """Call `fn` and retry transient errors with full-jitter exponential backoff.
+
+    Non-transient errors are re-raised untouched. Transient errors that are exhausted,
+    or not safe to retry, are raised as `UpstreamUnavailableError`.
+
+    Args:
+        upstream: Name of the upstream, selects the circuit breaker
+        fn: Async callable to invoke
+        idempotent: Whether `fn` can be repeated without side effects
+        max_attempts: Maximum number of calls, defaults to settings.RETRY_MAX_ATTEMPTS
+        base_delay: Initial backoff in seconds, defaults to settings.RETRY_BASE_DELAY
+    """
+    breaker = get_breaker(upstream)
+    max_attempts = max_attempts or settings.RETRY_MAX_ATTEMPTS
+    base_delay = settings.RETRY_BASE_DELAY if base_delay is None else base_delay
+
+    for attempt in range(1, max_attempts + 1):
+        breaker.before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            breaker.trial_in_flight = False
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                # The upstream answered, so it is healthy even if the request was wrong
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if attempt == max_attempts or not is_safe_to_retry(e, idempotent):
+                raise UpstreamUnavailableError(upstream, f"{type(e).__name__}: {e}", original_error=e) from e
+            delay = backoff_delay(e, attempt, base_delay)
+            logger.warning(f"[Resilience] Transient error from {upstream} ({e}), retry {attempt} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+def retry_transient(upstream: str, idempotent: bool = True):
+    """Decorator applying `call_with_retry` to an async function or method."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await call_with_retry(upstream, fn, *args, idempotent=idempotent, **kwargs)
+
+        return wrapper
+
+    return decorator
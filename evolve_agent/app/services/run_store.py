@@ -0,0 +1,372 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from ..config import data_dir, settings
+
+run_store_path = data_dir / "runs.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    params TEXT,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    iterations INTEGER,
+    workflow_hash TEXT,
+    error TEXT,
+    result BLOB,
+    log BLOB,
+    size INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_runs_prompt_hash ON runs (prompt_hash);
+CREATE INDEX IF NOT EXISTS idx_runs_status ON runs (status);
+CREATE INDEX IF NOT EXISTS idx_runs_created_at ON runs (created_at);
+CREATE INDEX IF NOT EXISTS idx_runs_workflow_hash ON runs (workflow_hash);
+
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    iteration INTEGER NOT NULL,
+    name TEXT,
+    workflow_hash TEXT,
+    stage TEXT,
+    error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_attempts_run_id ON attempts (run_id);
+CREATE INDEX IF NOT EXISTS idx_attempts_workflow_hash ON attempts (workflow_hash);
+
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    iteration INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    stage TEXT,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    latency_s REAL NOT NULL,
+    cost REAL NOT NULL,
+    estimated INTEGER NOT NULL,
+    error INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_usage_run_id ON usage (run_id);
+CREATE INDEX IF NOT EXISTS idx_usage_created_at ON usage (created_at);
+
+CREATE TABLE IF NOT EXISTS workflows (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+
+def _compress(value: Any) -> bytes:
+    text = value if isinstance(value, str) else json.dumps(value, separators=(",", ":"))
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def _decompress(blob: Optional[bytes], as_json: bool = True) -> Any:
+    if blob is None:
+        return None
+    text = zlib.decompress(blob).decode("utf-8")
+    return json.loads(text) if as_json else text
+
+
+def prompt_hash(prompt: str) -> str:
+    """Hash of a prompt, insensitive to case and whitespace."""
+    return hashlib.sha256(" ".join(prompt.lower().split()).encode("utf-8")).hexdigest()[:16]
+
+
+def workflow_hash(workflow: Dict[str, Any]) -> str:
+    """Hash of the semantic part of a workflow, ignoring its name."""
+    content = {key: workflow.get(key) for key in ("nodes", "connections", "settings")}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class RunStore:
+    """SQLite index of pipeline runs and their attempts.
+
+    Results and logs are stored as zlib-compressed blobs, and workflows are stored
+    once per distinct content (see `workflow_hash`). Runs older than
+    `settings.RUN_STORE_MAX_AGE_DAYS` or beyond `settings.RUN_STORE_MAX_SIZE_MB` are
+    pruned.
+    """
+
+    def __init__(self, path: Path = run_store_path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Calls block on SQLite, the app makes them from worker threads (asyncio.to_thread)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA foreign_keys=ON")
+            self.connection.executescript(SCHEMA)
+        self.finished_since_prune = 0
+
+    def _execute(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self.lock, self.connection:
+            return self.connection.execute(query, params).fetchall()
+
+    def _store_workflow(self, workflow: Dict[str, Any]) -> str:
+        digest = workflow_hash(workflow)
+        data = _compress(workflow)
+        self._execute("INSERT OR IGNORE INTO workflows (hash, data, size) VALUES (?, ?, ?)", (digest, data, len(data)))
+        return digest
+
+    def start_run(self, run_id: str, prompt: str, params: Dict[str, Any] = None):
+        self._execute(
+            "INSERT INTO runs (run_id, prompt, prompt_hash, params, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (run_id, prompt, prompt_hash(prompt), json.dumps(params or {}), "running", time.time()),
+        )
+
+    def add_attempt(
+        self,
+        run_id: str,
+        iteration: int,
+        workflow: Optional[Dict[str, Any]],
+        stage: str = None,
+        error: str = None,
+    ):
+        """Record one evolution attempt; `stage` and `error` are None for a success."""
+        digest = self._store_workflow(workflow) if workflow else None
+        self._execute(
+            "INSERT INTO attempts (run_id, iteration, name, workflow_hash, stage, error, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run_id, iteration, (workflow or {}).get("name"), digest, stage, error, time.time()),
+        )
+
+    def add_usage(self, run_id: str, records: List[Dict[str, Any]]):
+        """Record the LLM and embedding calls of a run, see `UsageLedger`."""
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO usage (run_id, iteration, role, stage, model, input_tokens, output_tokens, "
+                "cached_tokens, latency_s, cost, estimated, error, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        r["iteration"],
+                        r["role"],
+                        r["stage"],
+                        r["model"],
+                        r["input_tokens"],
+                        r["output_tokens"],
+                        r["cached_tokens"],
+                        r["latency_s"],
+                        r["cost"],
+                        int(r["estimated"]),
+                        int(r["error"]),
+                        r["created_at"],
+                    )
+                    for r in records
+                ],
+            )
+
+    def get_usage(self, run_id: str) -> List[Dict[str, Any]]:
+        rows = self._execute("SELECT * FROM usage WHERE run_id = ? ORDER BY created_at, id", (run_id,))
+        return [{**dict(row), "estimated": bool(row["estimated"]), "error": bool(row["error"])} for row in rows]
+
+    def usage_report(
+        self,
+        group_by: List[str] = ("role", "stage"),
+        since: float = None,
+        until: float = None,
+    ) -> List[Dict[str, Any]]:
+        """Aggregate the usage of all runs, e.g. by day and stage to spot prompt bloat.
+
+        Args:
+            group_by: Columns among "day", "role", "stage", "model" and "status"
+            since: Only calls made at or after this Unix timestamp
+            until: Only calls made before this Unix timestamp
+
+        Returns:
+            One row per group with call and run counts, token and cost totals and
+            the mean input tokens per call
+        """
+        columns = {
+            "day": "date(usage.created_at, 'unixepoch') AS day",
+            "role": "usage.role",
+            "stage": "usage.stage",
+            "model": "usage.model",
+            "status": "runs.status",
+        }
+        unknown = [column for column in group_by if column not in columns]
+        if unknown:
+            raise ValueError(f"Cannot group usage by {unknown}, expected some of {list(columns)}")
+        selected = [columns[column] for column in group_by]
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("usage.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("usage.created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        group = f"GROUP BY {', '.join(str(i + 1) for i in range(len(selected)))}" if selected else ""
+        rows = self._execute(
+            f"SELECT {''.join(column + ', ' for column in selected)}"
+            "COUNT(*) AS calls, COUNT(DISTINCT usage.run_id) AS runs, SUM(usage.error) AS errors, "
+            "SUM(usage.input_tokens) AS input_tokens, SUM(usage.output_tokens) AS output_tokens, "
+            "SUM(usage.cached_tokens) AS cached_tokens, AVG(usage.input_tokens) AS mean_input_tokens, "
+            "AVG(usage.latency_s) AS mean_latency_s, SUM(usage.cost) AS cost "
+            f"FROM usage JOIN runs ON runs.run_id = usage.run_id {where} {group} ORDER BY 1",
+            tuple(params),
+        )
+        return [dict(row) for row in rows]
+
+    def finish_run(
+        self,
+        run_id: str,
+        status: str,
+        result: Dict[str, Any] = None,
+        log: str = None,
+        error: str = None,
+    ):
+        """Record the outcome of a run.
+
+        Args:
+            run_id: ID of the run
+            status: One of "success", "partial", "cached" or "failed"
+            result: The pipeline result, if any
+            log: The captured log of the run
+            error: The error that ended a failed run
+        """
+        result_blob = _compress(result) if result is not None else None
+        log_blob = _compress(log) if log else None
+        workflow = (result or {}).get("workflow")
+        # A run answered from the solution cache has no attempt storing its workflow
+        digest = self._store_workflow(workflow) if workflow else None
+        self._execute(
+            "UPDATE runs SET status = ?, finished_at = ?, iterations = ?, workflow_hash = ?, error = ?, "
+            "result = ?, log = ?, size = ? WHERE run_id = ?",
+            (
+                status,
+                time.time(),
+                (result or {}).get("iterations"),
+                digest,
+                error,
+                result_blob,
+                log_blob,
+                len(result_blob or b"") + len(log_blob or b""),
+                run_id,
+            ),
+        )
+        self.finished_since_prune += 1
+        if self.finished_since_prune >= settings.RUN_STORE_PRUNE_EVERY:
+            self.prune()
+
+    def list_runs(
+        self,
+        status: str = None,
+        prompt: str = None,
+        workflow_hash: str = None,
+        since: float = None,
+        until: float = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """List runs, most recent first, without their blobs."""
+        conditions, params = [], []
+        for column, value in (
+            ("status = ?", status),
+            ("prompt_hash = ?", prompt_hash(prompt) if prompt else None),
+            ("workflow_hash = ?", workflow_hash),
+            ("created_at >= ?", since),
+            ("created_at < ?", until),
+        ):
+            if value is not None:
+                conditions.append(column)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._execute(
+            "SELECT run_id, prompt, prompt_hash, params, status, created_at, finished_at, iterations, "
+            f"workflow_hash, error, size FROM runs {where} ORDER BY created_at DESC LIMIT ?",
+            (*params, limit),
+        )
+        return [{**dict(row), "params": json.loads(row["params"] or "{}")} for row in rows]
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Get a run with its result and attempts, None if unknown."""
+        rows = self._execute("SELECT * FROM runs WHERE run_id = ?", (run_id,))
+        if not rows:
+            return None
+        run = dict(rows[0])
+        run["params"] = json.loads(run["params"] or "{}")
+        run["result"] = _decompress(run["result"])
+        del run["log"]
+        run["attempts"] = [
+            dict(row)
+            for row in self._execute("SELECT * FROM attempts WHERE run_id = ? ORDER BY iteration, id", (run_id,))
+        ]
+        return run
+
+    def get_log(self, run_id: str) -> Optional[str]:
+        rows = self._execute("SELECT log FROM runs WHERE run_id = ?", (run_id,))
+        return _decompress(rows[0]["log"], as_json=False) if rows else None
+
+    def get_workflow(self, digest: str) -> Optional[Dict[str, Any]]:
+        rows = self._execute("SELECT data FROM workflows WHERE hash = ?", (digest,))
+        return _decompress(rows[0]["data"]) if rows else None
+
+    def prune(self, max_age_days: float = None, max_size_mb: float = None) -> int:
+        """Delete runs past the age limit, then the oldest runs until the store fits
+        the size limit, and the workflows no longer referenced.
+
+        Returns:
+            Number of deleted runs
+        """
+        self.finished_since_prune = 0
+        max_age_days = settings.RUN_STORE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+        max_size = (settings.RUN_STORE_MAX_SIZE_MB if max_size_mb is None else max_size_mb) * 1024 * 1024
+
+        with self.lock, self.connection:
+            deleted = self.connection.execute(
+                "DELETE FROM runs WHERE status != 'running' AND created_at < ?",
+                (time.time() - max_age_days * 86400,),
+            ).rowcount
+            total = self.connection.execute(
+                "SELECT (SELECT COALESCE(SUM(size), 0) FROM runs) + (SELECT COALESCE(SUM(size), 0) FROM workflows)"
+            ).fetchone()[0]
+            if total > max_size:
+                # Walk from the oldest run and delete until enough size is freed
+                excess, cutoff = total - max_size, None
+                for row in self.connection.execute(
+                    "SELECT created_at, size FROM runs WHERE status != 'running' ORDER BY created_at"
+                ):
+                    excess -= row["size"]
+                    cutoff = row["created_at"]
+                    if excess <= 0:
+                        break
+                if cutoff is not None:
+                    deleted += self.connection.execute(
+                        "DELETE FROM runs WHERE status != 'running' AND created_at <= ?", (cutoff,)
+                    ).rowcount
+            self.connection.execute(
+                "DELETE FROM workflows WHERE hash NOT IN (SELECT workflow_hash FROM attempts "
+                "WHERE workflow_hash IS NOT NULL UNION SELECT workflow_hash FROM runs WHERE workflow_hash IS NOT NULL)"
+            )
+        if deleted:
+            logger.info(f"[RunStore] Pruned {deleted} run(s)")
+        return deleted
+
+    def compact(self) -> int:
+        """Prune, then rebuild the database file to release the freed pages."""
+        deleted = self.prune()
+        with self.lock:
+            self.connection.execute("VACUUM")
+        return deleted
@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+
+def request_key(kind: str, prompt: str, **params: Any) -> str:
+    """Key of a request, equal for prompts that only differ by whitespace."""
+    normalized = {"kind": kind, "prompt": " ".join(prompt.split()), "params": params}
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Flight:
+    def __init__(self, key: str, task: asyncio.Task, data: Dict[str, Any]):
+        self.key = key
+        self.task = task
+        self.data = data
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.joined = 0
+
+    async def wait(self) -> Any:
+        """Result of the flight. Cancelling a waiter does not cancel the flight, which
+        other requests may be waiting for."""
+        return await asyncio.shield(self.task)
+
+
+class SingleFlight:
+    """Coalesce identical concurrent requests into one execution.
+
+    The first request of a key starts the work, and requests of the same key join it
+    until it finishes and for `grace` seconds after it succeeded, so a client
+    retrying right after the answer gets the same result. Failed flights are
+    forgotten at once so that a retry runs again.
+    """
+
+    def __init__(self, name: str, grace: float = 10.0):
+        """
+        Args:
+            name: Name of the coalesced requests, for the logs
+            grace: Seconds a succeeded flight is still joined
+        """
+        self.name = name
+        self.grace = grace
+        self.flights: Dict[str, Flight] = {}
+
+    def join(self, key: str, factory: Callable[[], Awaitable[Any]], **data: Any) -> Flight:
+        """Join the flight of `key`, or start one running `factory()`.
+
+        Args:
+            key: Key of the request, see `request_key`
+            factory: Returns the coroutine of the work, only called to start a flight
+            data: Data of a new flight, e.g. its run ID, shared with the joined requests
+        """
+        flight = self.flights.get(key)
+        if flight is not None and flight.finished_at is not None and time.monotonic() - flight.finished_at > self.grace:
+            del self.flights[key]
+            flight = None
+        if flight is not None:
+            flight.joined += 1
+            logger.info(f"[SingleFlight] Joined {self.name} {flight.data or key[:12]} ({flight.joined} duplicate(s))")
+            return flight
+
+        flight = Flight(key, asyncio.ensure_future(factory()), data)
+        self.flights[key] = flight
+        flight.task.add_done_callback(lambda _: self._finish(flight))
+        return flight
+
+    def _finish(self, flight: Flight):
+        if self.flights.get(flight.key) is not flight:
+            return
+        if flight.task.cancelled() or flight.task.exception() is not None:
+            del self.flights[flight.key]
+            return
+        flight.finished_at = time.monotonic()
+        asyncio.get_running_loop().call_later(self.grace, self._expire, flight)
+
+    def _expire(self, flight: Flight):
+        if self.flights.get(flight.key) is flight:
+            del self.flights[flight.key]
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]], **data: Any) -> Any:
+        """Join or start the flight of `key` and wait for its result."""
+        return await self.join(key, factory, **data).wait()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": sum(flight.finished_at is None for flight in self.flights.values()),
+            "recent": sum(flight.finished_at is not None for flight in self.flights.values()),
+            "joined": sum(flight.joined for flight in self.flights.values()),
+        }
@@ -1,28 +1,134 @@
+import asyncio
 import json
 import sys
-from contextlib import contextmanager
+import threading
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Optional
 
 from loguru import logger
 
 
-@contextmanager
-def log_context(log_path: Path):
-    """Context manager for handling log file setup and cleanup.
+class RunLogRouter:
+    """Single loguru sink writing the records of each pipeline run to its own file.
 
-    Args:
-        log_path: Path to the log file
+    Records are routed by the run ID of the logging task (see `key`), buffered in
+    memory and appended to the run files in batches by one background writer, so the
+    cost of a log call does not grow with the number of concurrent runs. Records
+    logged outside of an open run are not formatted.
 
-    Example:
-        with log_context(Path("logs/my_log.txt")):
-            logger.info("This will be logged to the file")
+    A run file is a spool: `close` returns the log of the run and deletes the file.
     """
-    handler_id = logger.add(log_path, rotation=None, retention=None)
-    try:
-        yield
-    finally:
-        logger.remove(handler_id)
+
+    def __init__(
+        self,
+        log_dir: Path,
+        key: Callable[[], Optional[str]],
+        level: str = "DEBUG",
+        flush_interval: float = 0.5,
+    ):
+        """
+        Args:
+            log_dir: Directory of the run files
+            key: Returns the run ID of the calling task, None outside of a run
+            level: Minimum level of the routed records
+            flush_interval: Seconds between two batched writes
+        """
+        self.log_dir = Path(log_dir)
+        self.key = key
+        self.level = level
+        self.flush_interval = flush_interval
+        self.paths: Dict[str, Path] = {}
+        self.pending: Dict[str, List[str]] = {}
+        # Records may be logged from worker threads
+        self.lock = threading.Lock()
+        # Held from taking a batch until it is appended, so `close` never misses it
+        self.write_lock = threading.Lock()
+        self.handler_id: Optional[int] = None
+        self.writer: Optional[asyncio.Task] = None
+
+    def _filter(self, record: Dict[str, Any]) -> bool:
+        return self.key() in self.pending
+
+    def _sink(self, message: str):
+        with self.lock:
+            lines = self.pending.get(self.key())
+            if lines is not None:
+                lines.append(message)
+
+    def open(self, run_id: str) -> Path:
+        """Start routing the records of `run_id` to its file."""
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        path = self.log_dir / f"{run_id}.log"
+        path.write_text("")
+        with self.lock:
+            self.paths[run_id] = path
+            self.pending[run_id] = []
+        if self.handler_id is None:
+            self.handler_id = logger.add(
+                self._sink,
+                level=self.level,
+                filter=self._filter,
+                format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} | {message}",
+            )
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None  # no writer, lines are written by `flush` and `close`
+        if loop is not None and self.writer is None:
+            self.writer = loop.create_task(self._write_loop())
+        return path
+
+    async def _write_loop(self):
+        try:
+            while self.paths:
+                await asyncio.sleep(self.flush_interval)
+                await asyncio.to_thread(self.flush)
+        finally:
+            self.writer = None
+
+    def flush(self, run_id: Optional[str] = None):
+        """Append the buffered lines of `run_id`, by default of every run, to their files."""
+        with self.write_lock:
+            self._flush(run_id)
+
+    def _flush(self, run_id: Optional[str] = None):
+        with self.lock:
+            run_ids = [run_id] if run_id is not None else list(self.pending)
+            batches = []
+            for key in run_ids:
+                if self.pending.get(key):
+                    batches.append((self.paths[key], self.pending[key]))
+                    self.pending[key] = []
+        for path, lines in batches:
+            self._append(path, lines)
+
+    @staticmethod
+    def _append(path: Path, lines: List[str]):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+    def read(self, run_id: str) -> Optional[str]:
+        """Log of an open run so far, None if the run is not open."""
+        with self.write_lock:
+            if run_id not in self.paths:
+                return None
+            self._flush(run_id)
+            return self.paths[run_id].read_text(encoding="utf-8")
+
+    def close(self, run_id: str) -> str:
+        """Stop routing the records of `run_id` and return its log."""
+        with self.write_lock:
+            self._flush(run_id)
+            with self.lock:
+                self.pending.pop(run_id, None)
+                path = self.paths.pop(run_id)
+                idle = not self.paths
+            log = path.read_text(encoding="utf-8")
+            path.unlink(missing_ok=True)
+        if idle and self.handler_id is not None:
+            logger.remove(self.handler_id)
+            self.handler_id = None
+        return log
 
 
 def setup_logger(log_path: str = None):
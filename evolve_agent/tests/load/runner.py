@@ -0,0 +1,340 @@
+"""Load test of the app against local LLM and n8n stubs.
+
+Boots the stubs and the app as subprocesses, with a fresh DATA_DIR so the stub
+embeddings neither read nor pollute the real template index, run store and solutions.
+Then drives a mix of pipeline, generate_workflow and webhook requests, either in a
+closed loop of `--concurrency` clients, each sending its next request when the last
+one returns, or in an open loop of Poisson arrivals at `--rate` per second, which
+keeps arriving when the app slows down and so shows where latency collapses.
+
+The report holds the throughput and latency percentiles per request kind, the lag
+of the event loop of the app and its memory growth, and the git commit measured.
+With `--baseline`, the deltas to an earlier report are printed, to compare commits.
+
+Usage:
+    python -m evolve_agent.tests.load.runner --mode closed --concurrency 16 --duration 60
+    python -m evolve_agent.tests.load.runner --mode open --rate 20 --mix generate=1,webhook=4 \\
+        --llm-latency 1.0 --llm-jitter 0.5 --llm-error-rate 0.02 --baseline before.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from evolve_agent.agents.evaluate import percentile
+
+project_root = Path(__file__).parent.parent.parent.parent
+KINDS = ("pipeline", "generate", "webhook")
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Weights of the request kinds, e.g. "pipeline=1,webhook=4"."""
+    weights = {}
+    for part in filter(None, mix.split(",")):
+        kind, _, weight = part.partition("=")
+        if kind not in KINDS:
+            raise ValueError(f"Unknown request kind: {kind}, expected one of {', '.join(KINDS)}")
+        weights[kind] = float(weight or 1)
+    if not any(weights.values()):
+        raise ValueError("The mix has no request kind of positive weight")
+    return weights
+
+
+def percentiles(latencies: List[float]) -> Dict[str, Optional[float]]:
+    """Latency percentiles, computed as in the benchmark reports of `evaluate`."""
+
+    def at(q: float) -> Optional[float]:
+        value = percentile(latencies, q)
+        return round(value, 4) if value is not None else None
+
+    return {"p50_s": at(50), "p90_s": at(90), "p99_s": at(99), "max_s": at(100)}
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(["git", *args], cwd=project_root, capture_output=True, text=True).stdout.strip()
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+class Requests:
+    """Requests of each kind, the pipeline and generate prompts unique so no cache answers them."""
+
+    def __init__(self, weights: Dict[str, float], seed: int = 0):
+        self.kinds = list(weights)
+        self.weights = [weights[kind] for kind in self.kinds]
+        self.rng = random.Random(seed)
+        self.ids = itertools.count(1)
+
+    def next(self) -> Tuple[str, str, Dict[str, Any]]:
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        prompt = f"Build a chatbot answering questions about product {next(self.ids)} through a webhook"
+        if kind == "pipeline":
+            return kind, "/api/v1/agent/pipeline", {"prompt": prompt, "max_iteration": 1, "use_cache": False}
+        if kind == "generate":
+            return kind, "/api/v1/agent/generate_workflow", {"prompt": prompt}
+        return kind, "/api/v1/n8n/webhooks/chat", {"content": "Hello"}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.dropped = 0
+        self.recording = False
+
+    async def send(self, client: httpx.AsyncClient, kind: str, path: str, body: Dict[str, Any]):
+        start = time.perf_counter()
+        try:
+            response = await client.post(path, json=body)
+            error = None if response.status_code < 400 else str(response.status_code)
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        if not self.recording:
+            return
+        self.latencies[kind].append(time.perf_counter() - start)
+        if error:
+            self.errors[kind][error] += 1
+
+
+async def closed_loop(client: httpx.AsyncClient, requests: Requests, recorder: Recorder, concurrency: int, end: float):
+    async def user():
+        while time.monotonic() < end:
+            await recorder.send(client, *requests.next())
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+
+
+async def open_loop(
+    client: httpx.AsyncClient, requests: Requests, recorder: Recorder, rate: float, max_in_flight: int, end: float
+):
+    in_flight = set()
+    rng = random.Random(1)
+    arrival = time.monotonic()
+    while arrival < end:
+        await asyncio.sleep(max(0.0, arrival - time.monotonic()))
+        if len(in_flight) >= max_in_flight:
+            # The load generator is saturated, count the arrival instead of queueing it
+            recorder.dropped += recorder.recording
+        else:
+            task = asyncio.create_task(recorder.send(client, *requests.next()))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        arrival += rng.expovariate(rate)
+    if in_flight:
+        await asyncio.wait(in_flight)
+
+
+async def sample_runtime(client: httpx.AsyncClient, samples: List[Dict[str, Any]], interval: float = 1.0):
+    while True:
+        try:
+            samples.append((await client.get("/_load/runtime", params={"reset": True})).json())
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+
+async def drive(base_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    requests = Requests(parse_mix(args.mix))
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        start_rss = (await client.get("/_load/runtime", params={"reset": True})).json()["rss_mb"]
+        samples: List[Dict[str, Any]] = []
+        sampler = asyncio.create_task(sample_runtime(client, samples))
+
+        async def measure():
+            await asyncio.sleep(args.warmup)
+            recorder.recording = True
+            samples.clear()
+
+        end = time.monotonic() + args.warmup + args.duration
+        marker = asyncio.create_task(measure())
+        begin = time.monotonic()
+        if args.mode == "closed":
+            await closed_loop(client, requests, recorder, args.concurrency, end)
+        else:
+            await open_loop(client, requests, recorder, args.rate, args.max_in_flight, end)
+        elapsed = time.monotonic() - begin - args.warmup
+        marker.cancel()
+        sampler.cancel()
+        final = (await client.get("/_load/runtime")).json()
+
+    lags = [sample["loop_lag_p99_s"] for sample in samples if sample.get("loop_lag_p99_s") is not None]
+    max_lags = [sample["loop_lag_max_s"] for sample in samples if sample.get("loop_lag_max_s") is not None]
+    kinds = {}
+    for kind, latencies in recorder.latencies.items():
+        errors = sum(recorder.errors[kind].values())
+        kinds[kind] = {
+            "requests": len(latencies),
+            "errors": dict(recorder.errors[kind]),
+            "error_rate": round(errors / len(latencies), 4),
+            "throughput_rps": round((len(latencies) - errors) / elapsed, 3),
+            **percentiles(latencies),
+        }
+    completed = sum(kind["requests"] for kind in kinds.values())
+    failed = sum(sum(kind["errors"].values()) for kind in kinds.values())
+    return {
+        "kinds": kinds,
+        "total": {
+            "requests": completed,
+            "errors": failed,
+            "dropped": recorder.dropped,
+            "throughput_rps": round((completed - failed) / elapsed, 3),
+            **percentiles([latency for latencies in recorder.latencies.values() for latency in latencies]),
+        },
+        "runtime": {
+            "loop_lag_p99_s": max(lags, default=None),
+            "loop_lag_max_s": max(max_lags, default=None),
+            "rss_start_mb": round(start_rss, 1),
+            "rss_end_mb": round(final["rss_mb"], 1),
+            "rss_growth_mb": round(final["rss_mb"] - start_rss, 1),
+            "tasks_end": final["tasks"],
+        },
+    }
+
+
+def start(module: List[str], env: Dict[str, str], log) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", *module], cwd=project_root, env={**os.environ, **env}, stdout=log, stderr=log
+    )
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args[2:4])} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def stub_options(prefix: str, args: argparse.Namespace) -> List[str]:
+    return [
+        f"--latency={getattr(args, f'{prefix}_latency')}",
+        f"--jitter={getattr(args, f'{prefix}_jitter')}",
+        f"--error-rate={getattr(args, f'{prefix}_error_rate')}",
+    ]
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    data_dir = Path(tempfile.mkdtemp(prefix="evolve-load-"))
+    llm_url, n8n_url, app_url = (f"http://127.0.0.1:{args.port + i}" for i in range(3))
+    app_env = {
+        "DATA_DIR": str(data_dir),
+        # The Chroma index lives in the source tree, the array index in DATA_DIR
+        "RAG_VECTOR_STORE": "array",
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_API_BASE": f"{llm_url}/v1",
+        "OPENAI_BASE_URL": f"{llm_url}/v1",
+        "N8N_BASE_URL": n8n_url,
+        "N8N_API_KEY": "stub",
+    }
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        app_env[key] = value
+
+    processes = []
+    with open(data_dir / "processes.log", "ab") as log:
+        try:
+            processes.append(
+                start(
+                    ["evolve_agent.tests.load.stubs", "llm", f"--port={args.port}", *stub_options("llm", args)], {}, log
+                )
+            )
+            processes.append(
+                start(
+                    ["evolve_agent.tests.load.stubs", "n8n", f"--port={args.port + 1}", *stub_options("n8n", args)],
+                    {},
+                    log,
+                )
+            )
+            for url, process in zip((llm_url, n8n_url), processes):
+                wait_ready(f"{url}/docs", process)
+            processes.append(start(["evolve_agent.tests.load.serve", f"--port={args.port + 2}"], app_env, log))
+            wait_ready(f"{app_url}/_load/runtime", processes[-1], timeout=args.startup_timeout)
+            results = asyncio.run(drive(app_url, args))
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait(timeout=10)
+
+    options = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    return {"git": git_revision(), "timestamp": time.time(), "options": options, "data_dir": str(data_dir), **results}
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    def delta(value, path: Tuple[str, ...]) -> str:
+        before = baseline
+        for key in path:
+            before = (before or {}).get(key)
+        if baseline is None or before is None or value is None:
+            return ""
+        return f" ({value - before:+.3f})"
+
+    print(f"commit {report['git']['commit'][:12]}{' (dirty)' if report['git']['dirty'] else ''}")
+    for kind, stats in sorted(report["kinds"].items()) + [("total", report["total"])]:
+        root = ("total",) if kind == "total" else ("kinds", kind)
+        latencies = ", ".join(
+            f"{key[:-2]} {stats[key]:.3f}s{delta(stats[key], root + (key,))}"
+            for key in ("p50_s", "p90_s", "p99_s", "max_s")
+            if stats[key] is not None
+        )
+        errors = sum(stats["errors"].values()) if isinstance(stats["errors"], dict) else stats["errors"]
+        print(
+            f"{kind}: {stats['requests']} requests, {errors} errors, "
+            f"{stats['throughput_rps']:.2f} req/s{delta(stats['throughput_rps'], root + ('throughput_rps',))}, "
+            f"{latencies}"
+        )
+    if report["total"]["dropped"]:
+        print(f"dropped arrivals: {report['total']['dropped']}")
+    runtime = report["runtime"]
+    for key in ("loop_lag_p99_s", "loop_lag_max_s", "rss_growth_mb"):
+        if runtime[key] is not None:
+            print(f"{key}: {runtime[key]:.3f}{delta(runtime[key], ('runtime', key))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the app against local LLM and n8n stubs")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients of the closed loop")
+    parser.add_argument("--rate", type=float, default=10.0, help="Arrivals per second of the open loop")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Requests in flight of the open loop")
+    parser.add_argument("--mix", default="pipeline=1,generate=2,webhook=7", help="Weights of the request kinds")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds measured")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before measuring")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds before a request fails")
+    parser.add_argument("--port", type=int, default=8101, help="Port of the LLM stub, then the n8n stub and app")
+    parser.add_argument("--startup-timeout", type=float, default=300.0, help="Seconds to build the template index")
+    for stub in ("llm", "n8n"):
+        parser.add_argument(f"--{stub}-latency", type=float, default=0.5 if stub == "llm" else 0.05)
+        parser.add_argument(f"--{stub}-jitter", type=float, default=0.0)
+        parser.add_argument(f"--{stub}-error-rate", type=float, default=0.0)
+    parser.add_argument("--app-env", action="append", default=[], help="KEY=VALUE setting of the app, repeatable")
+    parser.add_argument("--output", type=Path, help="Report file, by default under the data dir")
+    parser.add_argument("--baseline", type=Path, help="Earlier report to compare with")
+    args = parser.parse_args()
+
+    report = run(args)
+    output = args.output or Path(report["data_dir"]) / "load_report.json"
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline else None
+    print_report(report, baseline)
+    print(f"report: {output}")
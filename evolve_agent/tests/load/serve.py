@@ -0,0 +1,81 @@
+"""The app as served to load tests, with probes of its event loop lag and memory.
+
+`GET /_load/runtime` reports the lag of the event loop, i.e. how late a timer fires
+because the loop is busy, and the resident memory of the process.
+
+Usage:
+    python -m evolve_agent.tests.load.serve --port 8100
+"""
+
+import asyncio
+import os
+import resource
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from evolve_agent.agents.evaluate import percentile
+from evolve_agent.app.main import app
+
+PROBE_INTERVAL = 0.05
+
+
+def rss_mb() -> float:
+    """Current resident memory of the process, the peak where /proc is missing."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes elsewhere
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class RuntimeProbe:
+    def __init__(self, interval: float = PROBE_INTERVAL):
+        self.interval = interval
+        self.lags: List[float] = []
+        self.task: Optional[asyncio.Task] = None
+
+    async def _loop(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._loop())
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Any]:
+        """Lag percentiles since the last reset, and the memory now."""
+        lags = self.lags
+        if reset:
+            self.lags = []
+        return {
+            "samples": len(lags),
+            "loop_lag_p50_s": percentile(lags, 50),
+            "loop_lag_p99_s": percentile(lags, 99),
+            "loop_lag_max_s": max(lags, default=None),
+            "rss_mb": rss_mb(),
+            "tasks": len(asyncio.all_tasks()),
+        }
+
+
+probe = RuntimeProbe()
+app.router.on_startup.append(probe.start)
+
+
+@app.get("/_load/runtime", include_in_schema=False)
+async def runtime(reset: bool = False) -> Dict[str, Any]:
+    return probe.snapshot(reset)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the app with runtime probes")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
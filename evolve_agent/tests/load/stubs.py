@@ -0,0 +1,210 @@
+"""Local stand-ins for the OpenAI and n8n APIs, to load the app without real upstreams.
+
+Both answer after a configurable latency and fail a configurable share of requests,
+so that the retries, circuit breakers and fallbacks of the app are loaded as well.
+The LLM stub answers each agent role with a fixed JSON that the pipeline accepts, and
+the n8n stub keeps workflows in memory and echoes webhook calls.
+
+Usage:
+    python -m evolve_agent.tests.load.stubs llm --port 8101 --latency 0.5 --error-rate 0.01
+    python -m evolve_agent.tests.load.stubs n8n --port 8102 --latency 0.05
+"""
+
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from evolve_agent.agents.codec import encode_workflow
+
+webhook_template = Path(__file__).parent.parent.parent / "templates" / "LLM_With_Webhook.json"
+EMBEDDING_DIMENSION = 256
+
+
+class FaultInjection:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 503):
+        """
+        Args:
+            latency: Mean seconds before answering
+            jitter: Standard deviation of the latency, drawn from a log-normal
+                distribution so that slow outliers happen
+            error_rate: Share of requests failed with `error_status`
+            error_status: Status of the failed requests, e.g. 429 or 503
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(0)
+
+    def delay(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        if self.jitter <= 0:
+            return self.latency
+        sigma = float(np.sqrt(np.log(1 + (self.jitter / self.latency) ** 2)))
+        return self.rng.lognormvariate(float(np.log(self.latency)) - sigma**2 / 2, sigma)
+
+    def install(self, app: FastAPI):
+        @app.middleware("http")
+        async def inject(request: Request, call_next):
+            await asyncio.sleep(self.delay())
+            if self.rng.random() < self.error_rate:
+                return JSONResponse(status_code=self.error_status, content={"message": "injected failure"})
+            return await call_next(request)
+
+
+def _answer(prompt: str) -> Dict[str, Any]:
+    """Answer of each agent role, recognized by its prompt."""
+    if "# Output format" in prompt:
+        workflow = json.loads(encode_workflow(json.loads(webhook_template.read_text(encoding="utf-8"))))
+        return {**workflow, "name": "Stub Chat", "webhook_inputs": {"chat": {"content": "Hello"}}}
+    if "edit operations" in prompt:
+        return {"operations": []}
+    if "expert at testing" in prompt:
+        return {"cases": []}
+    if "Provide the input for every webhook" in prompt:
+        return {"chat": {"content": "Hello"}}
+    return {"thought": "Answer through a chat model", "guidelines": "Use a webhook, an LLM chain and a response node"}
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def create_llm_stub(faults: FaultInjection = None) -> FastAPI:
+    """OpenAI-compatible chat completions and embeddings."""
+    app = FastAPI(title="LLM stub")
+    (faults or FaultInjection()).install(app)
+    ids = itertools.count(1)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = "\n".join(_text(message.get("content")) for message in body.get("messages", []))
+        content = json.dumps(_answer(prompt))
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+        return {
+            "id": f"chatcmpl-stub-{next(ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            # Deterministic vector of the input, so equal texts are equally similar
+            seed = int.from_bytes(hashlib.blake2b(json.dumps(text).encode(), digest_size=8).digest(), "big")
+            vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSION).astype(np.float32)
+            if body.get("encoding_format") == "base64":
+                embedding: Any = base64.b64encode(vector.tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(len(text) if isinstance(text, list) else len(text) // 4 for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    return app
+
+
+def create_n8n_stub(faults: FaultInjection = None) -> FastAPI:
+    """n8n public API of workflows and executions, and webhooks echoing their input."""
+    app = FastAPI(title="n8n stub")
+    (faults or FaultInjection()).install(app)
+    workflows: Dict[str, Dict[str, Any]] = {}
+    ids = itertools.count(1)
+
+    def get(workflow_id: str) -> Dict[str, Any]:
+        if workflow_id not in workflows:
+            raise HTTPException(status_code=404, detail="Not found")
+        return workflows[workflow_id]
+
+    @app.post("/api/v1/workflows")
+    async def create_workflow(body: Dict[str, Any]) -> Dict[str, Any]:
+        workflow = {**body, "id": str(next(ids)), "active": False}
+        workflows[workflow["id"]] = workflow
+        return workflow
+
+    @app.get("/api/v1/workflows")
+    async def list_workflows(limit: int = 100) -> Dict[str, Any]:
+        return {"data": list(workflows.values())[:limit], "nextCursor": None}
+
+    @app.get("/api/v1/workflows/{workflow_id}")
+    async def get_workflow(workflow_id: str) -> Dict[str, Any]:
+        return get(workflow_id)
+
+    @app.put("/api/v1/workflows/{workflow_id}")
+    async def update_workflow(workflow_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        workflows[workflow_id] = {**get(workflow_id), **body}
+        return workflows[workflow_id]
+
+    @app.delete("/api/v1/workflows/{workflow_id}")
+    async def delete_workflow(workflow_id: str) -> Dict[str, Any]:
+        return workflows.pop(workflow_id, None) or {}
+
+    @app.post("/api/v1/workflows/{workflow_id}/activate")
+    async def activate_workflow(workflow_id: str) -> Dict[str, Any]:
+        get(workflow_id)["active"] = True
+        return workflows[workflow_id]
+
+    @app.post("/api/v1/workflows/{workflow_id}/deactivate")
+    async def deactivate_workflow(workflow_id: str) -> Dict[str, Any]:
+        get(workflow_id)["active"] = False
+        return workflows[workflow_id]
+
+    @app.get("/api/v1/executions")
+    async def list_executions() -> Dict[str, List]:
+        return {"data": [], "nextCursor": None}
+
+    @app.api_route("/webhook/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+    async def webhook(path: str, request: Request) -> Dict[str, Any]:
+        body = await request.body()
+        return {"text": f"Stub answer of {path}", "received": json.loads(body) if body else None}
+
+    return app
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a stub of the OpenAI or n8n API")
+    parser.add_argument("kind", choices=["llm", "n8n"])
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean seconds before answering")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of failed requests")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    faults = FaultInjection(args.latency, args.jitter, args.error_rate, args.error_status)
+    app = create_llm_stub(faults) if args.kind == "llm" else create_n8n_stub(faults)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,261 @@
+import asyncio
+
+import httpx
+import pytest
+from langchain_core.messages import AIMessage
+
+from evolve_agent.agents.budget import RunBudget, budget_context
+from evolve_agent.agents.core import Agent, WorkflowExecutionError
+from evolve_agent.agents.patch import PatchError
+from evolve_agent.app.services.n8n_service import N8nService
+from evolve_agent.app.services.run_store import RunStore
+
+
+def webhook_node(path: str) -> dict:
+    return {
+        "parameters": {"httpMethod": "POST", "path": path, "responseMode": "responseNode", "options": {}},
+        "type": "n8n-nodes-base.webhook",
+        "name": f"Webhook {path}",
+    }
+
+
+@pytest.fixture
+def workflow() -> dict:
+    return {"name": "Multi Webhook", "nodes": [webhook_node("chat"), webhook_node("report")], "connections": {}}
+
+
+@pytest.fixture
+def agent(mocker, workflow) -> Agent:
+    """Agent with the LLM and n8n calls mocked out."""
+    agent = Agent.__new__(Agent)
+    agent.embeddings_upstream = "llm:openai/text-embedding-3-large"
+    agent.n8n_service = mocker.Mock(spec=N8nService)
+    agent.n8n_service.get_webhooks = N8nService.get_webhooks
+    agent.n8n_service.create_workflow = mocker.AsyncMock(side_effect=lambda wf, is_webhook: {**wf, "id": "wf-1"})
+    agent.n8n_service.activate_workflow = mocker.AsyncMock(return_value={"success": True, "status": "active"})
+    agent.n8n_service.deactivate_workflow = mocker.AsyncMock(return_value=False)
+    agent.n8n_service.get_workflow_executions = mocker.AsyncMock(return_value=[])
+    mocker.patch("evolve_agent.agents.diagnostics.FETCH_DELAY", 0)
+    mocker.patch.object(
+        agent, "rag_generate_candidate", mocker.AsyncMock(side_effect=lambda *args: (dict(workflow), None))
+    )
+    mocker.patch.object(
+        agent,
+        "get_webhook_inputs",
+        mocker.AsyncMock(return_value={"chat": {"content": "hi"}, "report": {"day": "monday"}}),
+    )
+    return agent
+
+
+@pytest.mark.asyncio
+async def test_step_calls_every_webhook(agent):
+    """Test that all webhooks are called and their responses aggregated by path."""
+    agent.n8n_service.call_webhook.side_effect = lambda webhook_path, webhook_method, data, workflow_id: {"echo": data}
+
+    result = await agent.step(step_name="run---01", prompt="Chat and report")
+
+    assert result["workflow_id"] == "wf-1"
+    assert result["responses"] == {"chat": {"echo": {"content": "hi"}}, "report": {"echo": {"day": "monday"}}}
+    assert agent.n8n_service.call_webhook.await_count == 2
+    assert {call.kwargs["workflow_id"] for call in agent.n8n_service.call_webhook.await_args_list} == {"wf-1"}
+
+
+@pytest.mark.asyncio
+async def test_step_aggregates_webhook_errors(agent):
+    """Test that a failing webhook is reported together with the successful ones."""
+    request = httpx.Request("POST", "http://n8n:5678/webhook/report")
+
+    async def call_webhook(webhook_path, webhook_method, data, workflow_id):
+        if webhook_path == "report":
+            raise httpx.HTTPStatusError("500 Internal Server Error", request=request, response=httpx.Response(500))
+        return {"text": "hello"}
+
+    agent.n8n_service.call_webhook.side_effect = call_webhook
+
+    with pytest.raises(WorkflowExecutionError) as exc_info:
+        await agent.step(step_name="run---01", prompt="Chat and report")
+
+    assert exc_info.value.stage == "call_webhook"
+    assert "- report: 500 Internal Server Error" in exc_info.value.message
+    assert "- chat: {'text': 'hello'}" in exc_info.value.message
+    agent.n8n_service.deactivate_workflow.assert_awaited_once_with("wf-1")
+
+
+@pytest.mark.asyncio
+async def test_step_overlaps_input_generation_with_deployment(agent, mocker):
+    """Test that the webhook inputs are generated while the workflow is deployed,
+    and that a failed input generation cancels the deployment and cleans up."""
+    created = asyncio.Event()
+
+    async def create_workflow(workflow, is_webhook):
+        created.set()
+        await asyncio.sleep(0.01)
+        return {**workflow, "id": "wf-1"}
+
+    async def get_webhook_inputs(workflow, webhooks):
+        await created.wait()  # would deadlock if the stages ran in sequence
+        raise ValueError("invalid JSON")
+
+    agent.n8n_service.create_workflow.side_effect = create_workflow
+    agent.get_webhook_inputs.side_effect = get_webhook_inputs
+
+    with pytest.raises(WorkflowExecutionError) as exc_info:
+        await agent.step(step_name="run---01", prompt="Chat and report")
+
+    assert exc_info.value.stage == "get_webhook_input"
+    agent.n8n_service.activate_workflow.assert_not_awaited()
+    agent.n8n_service.call_webhook.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_step_uses_fused_webhook_inputs(agent, workflow):
+    """Test that inputs answered with the workflow skip the input agent, which only
+    generates those lacking a field the workflow reads."""
+    workflow["nodes"].append({"name": "Chain", "type": "chainLlm", "parameters": {"text": "={{ $json.body.content }}"}})
+    workflow["connections"] = {"Webhook chat": {"main": [[{"node": "Chain", "type": "main", "index": 0}]]}}
+    agent.n8n_service.call_webhook.side_effect = lambda webhook_path, webhook_method, data, workflow_id: {"echo": data}
+    fused_inputs = {"chat": {"body": {"content": "hello"}}, "report": {"day": "friday"}}
+    agent.rag_generate_candidate.side_effect = lambda *args: (dict(workflow), fused_inputs)
+
+    result = await agent.step(step_name="run---01", prompt="Chat and report")
+
+    assert result["webhook_inputs"] == {"chat": {"content": "hello"}, "report": {"day": "friday"}}
+    agent.get_webhook_inputs.assert_not_awaited()
+
+    fused_inputs["chat"] = {"message": "hello"}
+    result = await agent.step(step_name="run---02", prompt="Chat and report")
+
+    assert result["webhook_inputs"] == {"chat": {"content": "hi"}, "report": {"day": "friday"}}
+    assert [webhook.path for webhook in agent.get_webhook_inputs.await_args.args[1]] == ["chat"]
+
+
+@pytest.mark.asyncio
+async def test_webhook_inputs_only_ask_the_llm_for_unresolved_webhooks(agent, mocker, workflow):
+    workflow["nodes"].append({"name": "Chain", "type": "chainLlm", "parameters": {"text": "={{ $json.body.content }}"}})
+    workflow["connections"] = {"Webhook chat": {"main": [[{"node": "Chain", "type": "main", "index": 0}]]}}
+    agent.agent_input = mocker.Mock()
+    agent.agent_input.ainvoke = mocker.AsyncMock(return_value=AIMessage(content='{"body": {"day": "monday"}}'))
+    webhooks = N8nService.get_webhooks(workflow)
+
+    inputs = await Agent.get_webhook_inputs(agent, workflow, webhooks)
+
+    assert inputs == {"chat": {"content": "Hello, can you help me with my request?"}, "report": {"day": "monday"}}
+    assert "- path: chat" not in agent.agent_input.ainvoke.await_args.args[0]
+
+    inputs = await Agent.get_webhook_inputs(agent, workflow, webhooks[:1])
+
+    assert inputs == {"chat": {"content": "Hello, can you help me with my request?"}}
+    assert agent.agent_input.ainvoke.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_invalid_generated_workflow_is_a_workflow_error(agent, mocker, workflow):
+    """Test that a generated node without a name fails the attempt before deployment."""
+    nameless = {**workflow, "nodes": [*workflow["nodes"], {"type": "n8n-nodes-base.set", "parameters": {}}]}
+    agent.rag_generate_candidate.side_effect = lambda *args: (nameless, None)
+
+    with pytest.raises(WorkflowExecutionError, match="node without a name"):
+        await agent.step(step_name="run---01", prompt="Chat and report")
+
+    agent.n8n_service.create_workflow.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_step_falls_back_to_generation_on_invalid_patch(agent, mocker, workflow):
+    """Test that a rejected patch regenerates the workflow within the same step."""
+    agent.n8n_service.call_webhook.side_effect = lambda webhook_path, webhook_method, data, workflow_id: {"ok": True}
+    mocker.patch.object(agent, "rag_patch_workflow", mocker.AsyncMock(side_effect=PatchError('unknown node "Missing"')))
+    base_workflow = {**workflow, "name": "run---01---Multi Webhook"}
+
+    result = await agent.step(step_name="run---02", prompt="Chat and report", base_workflow=base_workflow)
+
+    assert result["workflow_name"] == "run---02---Multi Webhook"
+    agent.rag_generate_candidate.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "answer",
+    [
+        '{"operations": null}',
+        '{"operations": ["remove the Webhook"]}',
+        '{"operations": [{"op": "add_node", "node": "Set"}]}',
+        '{"operations": [{"op": "add_node", "node": {"type": "n8n-nodes-base.set", "parameters": {}}}]}',
+    ],
+)
+async def test_step_falls_back_to_generation_on_malformed_patch(agent, mocker, workflow, answer):
+    """Test that malformed edit operations from the LLM regenerate the workflow instead of failing the run."""
+    agent.n8n_service.call_webhook.side_effect = lambda webhook_path, webhook_method, data, workflow_id: {"ok": True}
+    agent.agent_rag = mocker.Mock()
+    agent.agent_rag.model.ainvoke = mocker.AsyncMock(return_value=AIMessage(content=answer))
+    base_workflow = {**workflow, "name": "run---01---Multi Webhook"}
+
+    result = await agent.step(step_name="run---02", prompt="Chat and report", base_workflow=base_workflow)
+
+    assert result["workflow_name"] == "run---02---Multi Webhook"
+    agent.rag_generate_candidate.assert_awaited_once()
+
+
+@pytest.fixture
+def failing_agent(agent, mocker) -> Agent:
+    """Agent whose reflections never fix the "report" webhook."""
+    request = httpx.Request("POST", "http://n8n:5678/webhook/report")
+    agent.n8n_service.call_webhook.side_effect = httpx.HTTPStatusError(
+        "500 Internal Server Error", request=request, response=httpx.Response(500)
+    )
+    agent.agent_meta = mocker.Mock()
+    agent.agent_meta.ainvoke = mocker.AsyncMock(return_value=AIMessage(content='{"guidelines": "Fix it"}'))
+    agent.run_store = mocker.Mock(spec=RunStore)
+    return agent
+
+
+@pytest.mark.asyncio
+async def test_evolve_stops_when_reflections_leave_the_workflow_unchanged(failing_agent):
+    result = await failing_agent.evolve(
+        "run", "Chat and report", max_iteration=5, use_cache=False, patch_refinement=False
+    )
+
+    assert result["success"] is False
+    assert result["stop_reason"] == "stagnation"
+    assert result["iterations"] == 3
+    assert result["workflow"]["name"] == "run---03---Multi Webhook"
+
+
+@pytest.mark.asyncio
+async def test_evolve_returns_partial_result_when_out_of_deployments(failing_agent):
+    """Test that an exhausted budget stops the run at the next stage boundary."""
+    with budget_context(RunBudget(max_deployments=1)):
+        result = await failing_agent.evolve(
+            "run", "Chat and report", max_iteration=5, use_cache=False, patch_refinement=False
+        )
+
+    assert result["stop_reason"] == "deployment_budget"
+    assert result["iterations"] == 1
+    assert failing_agent.n8n_service.create_workflow.await_count == 1
+    assert "call_webhook" in result["error"]
+
+
+@pytest.mark.asyncio
+async def test_cached_solution_of_other_parameters_only_seeds_the_generation(agent, mocker, workflow):
+    """Test that a near-duplicate prompt naming another city is not answered from the cache."""
+    agent.n8n_service.call_webhook.side_effect = lambda webhook_path, webhook_method, data, workflow_id: {"ok": True}
+    agent.agent_meta = mocker.Mock()
+    agent.agent_meta.ainvoke = mocker.AsyncMock(return_value=AIMessage(content='{"guidelines": "Build it"}'))
+    agent.run_store = mocker.Mock(spec=RunStore)
+    record = {"id": "paris", "prompt": "Send me the weather in Paris every morning", "workflow": workflow}
+    agent.solution_cache = mocker.Mock()
+    agent.solution_cache.lookup = mocker.AsyncMock(return_value=[(0.97, record)])
+    agent.solution_cache.add = mocker.AsyncMock()
+    mocker.patch.object(
+        agent, "reuse_solution", mocker.AsyncMock(return_value={"cached": True, "workflow_name": "paris"})
+    )
+
+    result = await agent.evolve("run", "Send me the weather in Berlin every morning", max_iteration=1)
+
+    agent.reuse_solution.assert_not_awaited()
+    assert result["success"] is True and not result["cached"]
+    agent.rag_generate_candidate.assert_awaited_once()
+
+    result = await agent.evolve("run", "Send me the weather in Paris every morning.", max_iteration=1)
+    assert result["cached"] is True
+    agent.reuse_solution.assert_awaited_once()
@@ -0,0 +1,38 @@
+import pytest
+
+from evolve_agent.agents.budget import (
+    BudgetExceededError,
+    RunBudget,
+    workflow_fingerprint,
+)
+from evolve_agent.agents.context import run_context
+from evolve_agent.agents.usage import UsageLedger
+
+
+def test_budget_checks_deadline_tokens_and_deployments():
+    ledger = UsageLedger()
+    budget = RunBudget(deadline_s=60, max_tokens=1000, max_deployments=2, ledger=ledger)
+    with run_context("run"):
+        budget.check("reflect")
+        ledger.record("meta", "openai/gpt-4o", 900, 200, 1.0)
+        with pytest.raises(BudgetExceededError) as exc_info:
+            budget.check("generate_workflow")
+    assert exc_info.value.reason == "token_budget" and exc_info.value.stage == "generate_workflow"
+
+    budget = RunBudget(max_deployments=1)
+    budget.deployments = 1
+    with pytest.raises(BudgetExceededError, match="Deployment budget"):
+        budget.check("create_workflow")
+
+    budget = RunBudget(deadline_s=10)
+    budget.started_at -= 11
+    with pytest.raises(BudgetExceededError, match="Deadline"):
+        budget.check("reflect")
+
+
+def test_workflow_fingerprint_ignores_name_ids_and_positions():
+    node = {"name": "Webhook", "type": "n8n-nodes-base.webhook", "parameters": {"path": "chat"}}
+    first = {"name": "run---01---Chat", "nodes": [{**node, "id": "1", "position": [0, 0]}], "connections": {}}
+    second = {"name": "run---02---Chat", "nodes": [{**node, "id": "2", "position": [200, 0]}], "connections": {}}
+    changed = {**second, "nodes": [{**node, "parameters": {"path": "talk"}}]}
+    assert workflow_fingerprint(first) == workflow_fingerprint(second) != workflow_fingerprint(changed)
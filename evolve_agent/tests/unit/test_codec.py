@@ -0,0 +1,45 @@
+import json
+
+from evolve_agent.agents.codec import decode_workflow, encode_workflow, measure_savings
+from evolve_agent.agents.prompt import llm_with_webhook_template
+
+TEMPLATE = json.loads(llm_with_webhook_template.read_text())
+
+
+def test_encode_strips_non_semantic_fields():
+    """Test that the encoded workflow is valid JSON without UI or instance fields."""
+    encoded = encode_workflow(TEMPLATE)
+    compact = json.loads(encoded)
+    assert set(compact) == {"name", "nodes", "connections", "settings"}
+    assert all("position" not in node and "id" not in node for node in compact["nodes"])
+    assert compact["connections"]["Webhook"] == {"main": [["Basic LLM Chain"]]}
+    assert encoded.count("\n") == len(TEMPLATE["nodes"]) + 4
+    assert measure_savings([TEMPLATE])["savings"] > 0.3
+
+
+def test_decode_restores_deployable_workflow():
+    """Test that a compact answer round-trips to the original connections and gets
+    IDs, positions and settings back."""
+    decoded = decode_workflow(json.loads(encode_workflow(TEMPLATE)))
+    assert decoded["connections"] == TEMPLATE["connections"]
+    assert decoded["settings"]["executionOrder"] == "v1"
+    positions = {node["name"]: node["position"] for node in decoded["nodes"]}
+    assert positions["Webhook"][0] < positions["Basic LLM Chain"][0] < positions["Respond to Webhook"][0]
+    webhook = next(node for node in decoded["nodes"] if node["name"] == "Webhook")
+    assert webhook["id"] and webhook["webhookId"]
+
+    restored = decode_workflow(json.loads(encode_workflow(TEMPLATE)), original=TEMPLATE)
+    assert [node["id"] for node in restored["nodes"]] == [node["id"] for node in TEMPLATE["nodes"]]
+    assert decode_workflow(TEMPLATE) == TEMPLATE
+
+
+def test_decode_keeps_settings_and_leaves_nameless_nodes_to_validation():
+    """Test that workflow settings survive the round-trip and that a node without a
+    name is decoded rather than failing the layout."""
+    workflow = {**TEMPLATE, "settings": {"executionOrder": "v1", "timezone": "Europe/Paris"}}
+    assert decode_workflow(json.loads(encode_workflow(workflow)))["settings"] == workflow["settings"]
+
+    compact = json.loads(encode_workflow(TEMPLATE))
+    compact["nodes"].append({"type": "n8n-nodes-base.set", "parameters": {}})
+    decoded = decode_workflow(compact)
+    assert decoded["nodes"][-1]["position"] and "name" not in decoded["nodes"][-1]
@@ -0,0 +1,50 @@
+import json
+
+from evolve_agent.agents.dedup import cluster_templates, workflow_features
+from evolve_agent.agents.rag import JSONTemplateLoader
+
+
+def chain(*types: str, prefix: str = "") -> dict:
+    """Workflow of nodes of `types` connected in sequence."""
+    nodes = [{"name": f"{prefix}{i}", "type": t, "parameters": {"value": prefix}} for i, t in enumerate(types)]
+    connections = {
+        f"{prefix}{i}": {"main": [[{"node": f"{prefix}{i + 1}", "type": "main", "index": 0}]]}
+        for i in range(len(types) - 1)
+    }
+    return {"name": prefix, "nodes": nodes, "connections": connections}
+
+
+CHAT = ["webhook", "agent", "openAi", "set", "set", "respondToWebhook"]
+REPORT = ["scheduleTrigger", "googleSheets", "code", "gmail"]
+
+
+def test_features_are_a_multiset_of_node_types_and_edges():
+    features = workflow_features(chain("webhook", "set", "set"))
+    assert {"node:set#1", "node:set#2", "edge:webhook>set:main#1", "edge:set>set:main#1"} <= features
+
+
+def test_variants_cluster_around_one_canonical_template():
+    """Test that renamed variants with other parameters are clustered, and that an
+    extra node still counts as a near-duplicate."""
+    workflows = {
+        "chat.json": chain(*CHAT, prefix="chat"),
+        "chat_copy.json": chain(*CHAT, prefix="copy"),
+        "chat_extended.json": chain(*CHAT, "slack", prefix="extended"),
+        "report.json": chain(*REPORT, prefix="report"),
+    }
+    clusters = cluster_templates(workflows, threshold=0.7)
+    assert clusters == [
+        {"canonical": "chat.json", "members": ["chat.json", "chat_copy.json", "chat_extended.json"]},
+        {"canonical": "report.json", "members": ["report.json"]},
+    ]
+
+
+def test_loader_indexes_canonical_templates_only(tmp_path):
+    for name, workflow in [("a.json", chain(*CHAT, prefix="a")), ("b.json", chain(*CHAT, prefix="b"))]:
+        (tmp_path / name).write_text(json.dumps(workflow))
+
+    documents = JSONTemplateLoader(tmp_path, dedup_threshold=0.8).load()
+    assert [(d.metadata["source"], d.metadata["cluster_size"], d.metadata["duplicates"]) for d in documents] == [
+        ("a.json", 2, "b.json")
+    ]
+    assert len(JSONTemplateLoader(tmp_path).load()) == 2
@@ -0,0 +1,62 @@
+import pytest
+
+from evolve_agent.agents.diagnostics import (
+    diagnose_failed_execution,
+    extract_node_errors,
+    format_node_errors,
+)
+
+WORKFLOW = {
+    "nodes": [
+        {"name": "Webhook", "type": "n8n-nodes-base.webhook", "parameters": {"path": "weather"}},
+        {
+            "name": "Get Weather",
+            "type": "n8n-nodes-base.httpRequest",
+            "parameters": {"url": "https://api.example.com/weather?q={{ $json.body.city }}"},
+        },
+    ]
+}
+
+EXECUTION = {
+    "id": "42",
+    "status": "error",
+    "data": {
+        "resultData": {
+            "lastNodeExecuted": "Get Weather",
+            "error": {
+                "message": "The resource you are requesting could not be found",
+                "description": "city not found",
+                "httpCode": "404",
+                "node": {"name": "Get Weather", "type": "n8n-nodes-base.httpRequest"},
+            },
+            "runData": {
+                "Webhook": [{"executionStatus": "success", "data": {}}],
+                "Get Weather": [{"error": {"message": "The resource you are requesting could not be found"}}],
+            },
+        }
+    },
+}
+
+
+def test_extract_node_errors():
+    """Test finding the failing node once, with its parameters from the workflow."""
+    [error] = extract_node_errors(EXECUTION, WORKFLOW)
+    assert error["node"] == "Get Weather"
+    assert error["type"] == "n8n-nodes-base.httpRequest"
+    assert error["parameters"]["url"].startswith("https://api.example.com")
+
+    text = format_node_errors([error])
+    assert text.startswith('- Node "Get Weather" (n8n-nodes-base.httpRequest): [HTTP 404] The resource')
+    assert "Details: city not found" in text
+    assert extract_node_errors({"data": None}, WORKFLOW) == []
+
+
+@pytest.mark.asyncio
+async def test_diagnose_waits_for_the_saved_execution(mocker):
+    """Test polling until n8n has saved the failed execution."""
+    mocker.patch("evolve_agent.agents.diagnostics.FETCH_DELAY", 0)
+    n8n_service = mocker.Mock()
+    n8n_service.get_workflow_executions = mocker.AsyncMock(side_effect=[[], [EXECUTION]])
+    errors = await diagnose_failed_execution(n8n_service, "wf-1", WORKFLOW)
+    assert [error["node"] for error in errors] == ["Get Weather"]
+    n8n_service.get_workflow_executions.assert_awaited_with("wf-1", status="error", limit=1, include_data=True)
@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import pytest
+
+from evolve_agent.agents.evaluate import (
+    expand_matrix,
+    load_prompts,
+    percentile,
+    run_one,
+    summarize,
+)
+
+
+def test_load_prompts(tmp_path):
+    """Test loading prompts given as objects or bare strings."""
+    path = tmp_path / "prompts.jsonl"
+    path.write_text(json.dumps({"id": "weather", "prompt": "Send me the weather"}) + "\n\n" + json.dumps("Echo") + "\n")
+
+    prompts = load_prompts(path)
+    assert prompts == [{"id": "weather", "prompt": "Send me the weather"}, {"id": "3", "prompt": "Echo"}]
+
+
+def test_expand_matrix():
+    """Test that every combination of the configuration axes is produced."""
+    configs = expand_matrix(["openai/gpt-4o", "ollama/llama3.2"], [0.2, 0.5], [3], [3, 5])
+    assert len(configs) == 8
+    assert {"model_id": "ollama/llama3.2", "temperature": 0.5, "max_iteration": 3, "k": 5} in configs
+
+
+def test_percentile():
+    """Test percentile interpolation."""
+    assert percentile([], 50) is None
+    assert percentile([3.0], 90) == 3.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == pytest.approx(2.5)
+    assert percentile([1.0, 2.0, 3.0, 4.0], 100) == 4.0
+
+
+def test_summarize():
+    """Test aggregating run records per configuration."""
+    config = {"model_id": "openai/gpt-4o", "temperature": 0.2, "max_iteration": 5, "k": 3}
+    records = [
+        {"config": config, "success": True, "iterations": 1, "latency_s": 10.0, "input_tokens": 100, "output_tokens": 50, "total_tokens": 150},
+        {"config": config, "success": True, "iterations": 3, "latency_s": 30.0, "input_tokens": 300, "output_tokens": 150, "total_tokens": 450},
+        {"config": config, "success": False, "iterations": 5, "latency_s": 50.0, "input_tokens": 500, "output_tokens": 250, "total_tokens": 750},
+    ]  # fmt: skip
+
+    summary = summarize(records)
+    stats = summary["openai/gpt-4o|t=0.2|iter=5|k=3"]
+    assert stats["runs"] == 3
+    assert stats["success_rate"] == pytest.approx(2 / 3)
+    assert stats["iterations_to_success"]["mean"] == 2
+    assert stats["tokens"]["total"] == 1350
+    assert stats["latency_s"]["p50"] == 30.0
+
+
+@pytest.mark.asyncio
+async def test_run_one_bypasses_the_solution_cache(mocker):
+    """Test that benchmark runs are not answered from solutions of earlier runs."""
+    agent = mocker.Mock()
+    agent.pipeline = mocker.AsyncMock(return_value={"run_id": "r", "success": True, "iterations": 1, "fitness": None})
+    config = {"model_id": "openai/gpt-4o", "temperature": 0.2, "max_iteration": 5, "k": 3}
+
+    record = await run_one(agent, config, {"id": "1", "prompt": "Echo"}, asyncio.Semaphore(1))
+
+    assert record["success"] is True
+    assert agent.pipeline.await_args.kwargs["use_cache"] is False
@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+import pytest
+
+from evolve_agent.agents.context import run_context
+from evolve_agent.agents.events import RunEventBus, format_sse
+
+
+async def collect(bus: RunEventBus, run_id: str, last_event_id: int = 0):
+    return [event async for event in bus.subscribe(run_id, last_event_id)]
+
+
+@pytest.mark.asyncio
+async def test_subscriber_receives_history_and_live_events_until_done():
+    """Test that a late subscriber replays the history, then follows the run."""
+    bus = RunEventBus()
+    with run_context("run"):
+        bus.publish("iteration_started", iteration=1)
+    subscriber = asyncio.create_task(collect(bus, "run"))
+    await asyncio.sleep(0)
+    bus.publish("stage_completed", run_id="run", stage="create_workflow", duration_s=0.1)
+    bus.publish("done", run_id="run", status="succeeded")
+    bus.publish("iteration_started", run_id="other", iteration=1)
+
+    events = await asyncio.wait_for(subscriber, 1)
+    assert [(e["id"], e["type"]) for e in events] == [(1, "iteration_started"), (2, "stage_completed"), (3, "done")]
+
+
+@pytest.mark.asyncio
+async def test_resume_after_last_event_id():
+    """Test that a reconnecting client only receives the events it missed."""
+    bus = RunEventBus()
+    for i in range(3):
+        bus.publish("iteration_started", run_id="run", iteration=i + 1)
+    bus.publish("done", run_id="run", status="failed")
+
+    events = await collect(bus, "run", last_event_id=2)
+    assert [e["id"] for e in events] == [3, 4]
+
+
+def test_events_outside_of_a_run_are_dropped():
+    bus = RunEventBus()
+    bus.publish("iteration_started", iteration=1)
+    assert bus.channels == {}
+
+
+def test_format_sse():
+    event = {"id": 7, "type": "error", "time": 1.0, "data": {"stage": "call_webhook", "message": "500"}}
+    lines = format_sse(event).splitlines()
+    assert lines[:2] == ["id: 7", "event: error"]
+    assert json.loads(lines[2][len("data: ") :]) == {"time": 1.0, "stage": "call_webhook", "message": "500"}
+    assert format_sse(None).startswith(":")
@@ -0,0 +1,57 @@
+import pytest
+
+from evolve_agent.agents.fitness import (
+    _MISSING,
+    check_expectation,
+    fitness_key,
+    resolve_path,
+)
+
+RESPONSE = {"text": "Sunny in Singapore, 31°C", "items": [{"city": "Singapore", "temp": 31}], "ok": True}
+
+
+def test_resolve_path():
+    """Test resolving dotted paths through objects and lists."""
+    assert resolve_path(RESPONSE, "items.0.city") == "Singapore"
+    assert resolve_path(RESPONSE, "") is RESPONSE
+    assert resolve_path(RESPONSE, "items.3.city") is _MISSING
+
+
+@pytest.mark.parametrize(
+    "expectation",
+    [
+        {"path": "text", "op": "exists"},
+        {"path": "text", "op": "not_empty"},
+        {"path": "text", "op": "contains", "value": "singapore"},
+        {"path": "items.0.temp", "op": "equals", "value": 31},
+        {"path": "items.0.temp", "op": "type", "value": "number"},
+        {"path": "ok", "op": "type", "value": "boolean"},
+    ],
+)
+def test_check_expectation_passes(expectation):
+    """Test predicates that hold on the response."""
+    assert check_expectation(RESPONSE, expectation) is None
+
+
+@pytest.mark.parametrize(
+    "expectation",
+    [
+        {"path": "summary", "op": "exists"},
+        {"path": "text", "op": "contains", "value": "rain"},
+        {"path": "items.0.temp", "op": "equals", "value": 30},
+        {"path": "ok", "op": "type", "value": "number"},
+        {"path": "text", "op": "matches", "value": ".*"},
+    ],
+)
+def test_check_expectation_fails(expectation):
+    """Test predicates that do not hold, or cannot be evaluated, on the response."""
+    assert check_expectation(RESPONSE, expectation)
+
+
+def test_fitness_key_prefers_correctness_then_speed():
+    """Test ranking candidates by pass rate, then by latency."""
+    slow_correct = {"pass_rate": 1.0, "latency_s": {"mean": 5.0}}
+    fast_correct = {"pass_rate": 1.0, "latency_s": {"mean": 1.0}}
+    fast_wrong = {"pass_rate": 0.5, "latency_s": {"mean": 0.1}}
+    ranked = sorted([slow_correct, fast_wrong, fast_correct], key=fitness_key, reverse=True)
+    assert ranked == [fast_correct, slow_correct, fast_wrong]
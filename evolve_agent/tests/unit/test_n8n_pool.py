@@ -0,0 +1,109 @@
+import httpx
+import pytest
+
+from evolve_agent.app.schemas.workflow import HTTPMethod
+from evolve_agent.app.services import resilience
+from evolve_agent.app.services.n8n_pool import N8nBackend, N8nBackendPool
+from evolve_agent.app.services.n8n_service import N8nService
+
+
+@pytest.fixture(autouse=True)
+def reset_breakers():
+    resilience.breakers.clear()
+    yield
+    resilience.breakers.clear()
+
+
+@pytest.fixture
+def n8n_hosts(monkeypatch):
+    """Fake n8n instances "a" and "b", recording the requests they receive."""
+    requests, down = [], set()
+    workflows = {"a": {}, "b": {}}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        requests.append((host, request.method, request.url.path))
+        if host in down:
+            raise httpx.ConnectError("connection refused", request=request)
+        path = request.url.path
+        if path == "/api/v1/workflows" and request.method == "POST":
+            workflow = {**httpx.Response(200, content=request.content).json(), "id": f"{host}-{len(workflows[host])}"}
+            workflows[host][workflow["id"]] = workflow
+            return httpx.Response(200, json=workflow)
+        if path == "/api/v1/workflows":
+            return httpx.Response(200, json={"data": list(workflows[host].values()), "nextCursor": None})
+        if path.startswith("/api/v1/workflows/"):
+            workflow = workflows[host].get(path.split("/")[4])
+            return httpx.Response(200, json=workflow) if workflow else httpx.Response(404, json={})
+        if path.startswith("/webhook/"):
+            return httpx.Response(200, json={"host": host})
+        return httpx.Response(404, json={})
+
+    transport = httpx.MockTransport(handler)
+    client = httpx.AsyncClient
+    monkeypatch.setattr(httpx, "AsyncClient", lambda **kwargs: client(transport=transport, **kwargs))
+    return requests, down, workflows
+
+
+def make_pool(**kwargs) -> N8nBackendPool:
+    return N8nBackendPool([N8nBackend(name, f"http://{name}:5678", "key") for name in "ab"], **kwargs)
+
+
+def webhook_workflow(name: str, path: str) -> dict:
+    return {"name": name, "nodes": [{"type": "n8n-nodes-base.webhook", "parameters": {"path": path}}]}
+
+
+@pytest.mark.asyncio
+async def test_workflows_are_spread_and_pinned_to_their_backend(n8n_hosts):
+    """Test least-load placement, then routing the calls of each workflow to its
+    backend."""
+    requests, _, _ = n8n_hosts
+    service = N8nService(make_pool(health_interval=3600))
+    first = await service.create_workflow(webhook_workflow("one", "one"))
+    second = await service.create_workflow(webhook_workflow("two", "two"))
+    assert {first["id"], second["id"]} == {"a-0", "b-0"}
+
+    assert await service.call_webhook("two", HTTPMethod.POST, {}) == {"host": second["id"][0]}
+    await service.get_workflow(first["id"])
+    assert requests[-1] == (first["id"][0], "GET", f"/api/v1/workflows/{first['id']}")
+
+
+@pytest.mark.asyncio
+async def test_webhooks_sharing_a_path_are_routed_by_workflow(n8n_hosts):
+    """Test that the runs of two workflows with the same webhook path each reach their own."""
+    service = N8nService(make_pool(health_interval=3600))
+    first = await service.create_workflow(webhook_workflow("one", "chat"))
+    second = await service.create_workflow(webhook_workflow("two", "chat"))
+    assert first["id"][0] != second["id"][0]
+
+    for workflow in (first, second):
+        response = await service.call_webhook("chat", HTTPMethod.POST, {}, workflow_id=workflow["id"])
+        assert response == {"host": workflow["id"][0]}
+
+
+@pytest.mark.asyncio
+async def test_unpinned_workflow_is_looked_up_on_every_backend(n8n_hosts):
+    _, _, workflows = n8n_hosts
+    workflows["b"]["b-7"] = {"id": "b-7", **webhook_workflow("seven", "seven")}
+    pool = make_pool()
+    assert (await pool.resolve("b-7")).name == "b"
+    assert pool.resolve_webhook("seven").name == "b"
+
+
+@pytest.mark.asyncio
+async def test_failing_backend_is_ejected_then_readmitted(n8n_hosts):
+    """Test that health checks take a failing backend out of placement."""
+    _, down, _ = n8n_hosts
+    pool = make_pool(placement="hash", health_failures=2)
+    down.add("b")
+    await pool.check_health()
+    assert pool.backends["b"].healthy
+    await pool.check_health()
+    assert not pool.backends["b"].healthy
+    assert {pool.place(f"workflow-{i}").name for i in range(20)} == {"a"}
+
+    down.clear()
+    await pool.check_health()
+    assert {pool.place(f"workflow-{i}").name for i in range(20)} == {"a", "b"}
+    # Consistent hashing places a workflow name on the same backend every time
+    assert pool.place("workflow-1") is pool.place("workflow-1")
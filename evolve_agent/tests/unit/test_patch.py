@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from evolve_agent.agents.patch import PatchError, apply_patch, merge_patch
+from evolve_agent.agents.prompt import llm_with_webhook_template
+
+TEMPLATE = json.loads(llm_with_webhook_template.read_text())
+
+
+def test_merge_patch():
+    """Test RFC 7396 merging, null deleting a key."""
+    assert merge_patch({"a": {"b": 1, "c": 2}, "d": 3}, {"a": {"b": None, "e": 4}}) == {"a": {"c": 2, "e": 4}, "d": 3}
+
+
+def test_apply_patch_edits_nodes_and_connections():
+    """Test updating, adding, renaming and connecting nodes, keeping the IDs of the
+    untouched ones."""
+    patched = apply_patch(
+        TEMPLATE,
+        [
+            {"op": "update_node", "node": "Basic LLM Chain", "patch": {"parameters": {"text": "={{ $json.body.q }}"}}},
+            {"op": "add_node", "node": {"name": "Set", "type": "n8n-nodes-base.set", "parameters": {}}},
+            {"op": "rename_node", "node": "Respond to Webhook", "name": "Respond"},
+            {"op": "disconnect", "from": "Basic LLM Chain", "to": "Respond"},
+            {"op": "connect", "from": "Basic LLM Chain", "to": "Set"},
+            {"op": "connect", "from": "Set", "to": "Respond"},
+        ],
+    )
+    nodes = {node["name"]: node for node in patched["nodes"]}
+    assert nodes["Basic LLM Chain"]["parameters"] == {"promptType": "define", "text": "={{ $json.body.q }}"}
+    assert nodes["Webhook"]["id"] == next(n["id"] for n in TEMPLATE["nodes"] if n["name"] == "Webhook")
+    assert nodes["Set"]["id"] and nodes["Set"]["position"]
+    assert patched["connections"]["Basic LLM Chain"]["main"] == [[{"node": "Set", "type": "main", "index": 0}]]
+    assert patched["connections"]["Set"]["main"] == [[{"node": "Respond", "type": "main", "index": 0}]]
+    assert "Respond to Webhook" not in json.dumps(patched["connections"])
+    assert TEMPLATE["nodes"][2]["parameters"]["text"] == "={{ $json.body.content }}"  # original untouched
+
+
+@pytest.mark.parametrize(
+    "operations, error",
+    [
+        ([{"op": "update_node", "node": "Missing", "patch": {}}], 'unknown node "Missing"'),
+        ([{"op": "add_node", "node": {"name": "Webhook", "type": "x"}}], "already exists"),
+        ([{"op": "remove_node", "node": "Webhook"}], "no webhook node"),
+        ([{"op": "connect", "from": "Webhook"}], "malformed"),
+        ([{"op": "replace_all"}], "unknown operation"),
+        (None, "list of objects"),
+        (["remove the Webhook"], "list of objects"),
+        ([{"op": "add_node", "node": "Set"}], "malformed"),
+        ([{"op": "add_node", "node": {"type": "n8n-nodes-base.set", "parameters": {}}}], "invalid patched workflow"),
+    ],
+)
+def test_apply_patch_rejects_invalid_patches(operations, error):
+    """Test that invalid operations or results are rejected before deployment."""
+    with pytest.raises(PatchError, match=error):
+        apply_patch(TEMPLATE, operations)
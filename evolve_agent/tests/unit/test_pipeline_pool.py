@@ -0,0 +1,97 @@
+import asyncio
+import os
+
+import pytest
+from loguru import logger
+
+from evolve_agent.agents.context import run_context, run_id_var
+from evolve_agent.agents.events import emit, event_bus
+from evolve_agent.agents.models import llm_scheduler
+from evolve_agent.agents.pipeline_pool import (
+    PipelinePool,
+    PipelineWorkerError,
+    _share_rate_limits,
+)
+from evolve_agent.app.config import settings
+from evolve_agent.app.services.resilience import UpstreamUnavailableError
+from evolve_agent.app.utils import RunLogRouter
+
+
+class FakeAgent:
+    """Agent of the workers, answering with the process that ran the pipeline."""
+
+    async def pipeline(self, prompt: str, run_id: str, max_iteration: int = 5):
+        with run_context(run_id):
+            event_bus.open(run_id)
+            emit("run_started", max_iteration=max_iteration)
+            logger.info(f"[Agent] Running {prompt}")
+            await asyncio.sleep(0.05)
+            if prompt == "unavailable":
+                raise UpstreamUnavailableError("llm", "circuit open")
+            if prompt == "crash":
+                os._exit(1)
+            emit("done", status="success")
+            return {"run_id": run_id, "pid": os.getpid()}
+
+
+@pytest.mark.asyncio
+async def test_pool_runs_pipelines_in_workers_and_forwards_their_events_and_logs(tmp_path):
+    """Test that runs are spread over the workers and their progress reaches the app."""
+    pool = PipelinePool(2, RunLogRouter(tmp_path, key=run_id_var.get), agent_factory=FakeAgent)
+    logs = []
+    handler_id = logger.add(lambda message: logs.append(message.record), level="INFO")
+    try:
+        event_bus.open("pool-1")
+        events = []
+
+        async def subscribe():
+            async for event in event_bus.subscribe("pool-1"):
+                events.append(event["type"])
+
+        subscriber = asyncio.create_task(subscribe())
+        results = await asyncio.wait_for(
+            asyncio.gather(*(pool.run(f"prompt {i}", run_id=f"pool-{i}", max_iteration=1) for i in range(1, 5))),
+            timeout=120,
+        )
+        await asyncio.wait_for(subscriber, timeout=5)
+
+        assert [result["run_id"] for result in results] == ["pool-1", "pool-2", "pool-3", "pool-4"]
+        assert {result["pid"] for result in results} == {worker.process.pid for worker in pool.workers}
+        assert os.getpid() not in {result["pid"] for result in results}
+        assert events == ["run_started", "done"]
+        forwarded = [record for record in logs if record["message"] == "[Agent] Running prompt 1"]
+        assert forwarded and forwarded[0]["function"] == "pipeline"
+        assert pool.stats()["runs"] == 0
+
+        with pytest.raises(UpstreamUnavailableError) as error:
+            await asyncio.wait_for(pool.run("unavailable", run_id="pool-5"), timeout=30)
+        assert error.value.upstream == "llm"
+    finally:
+        logger.remove(handler_id)
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_fails_the_runs_of_a_dead_worker_and_replaces_it(tmp_path):
+    pool = PipelinePool(1, agent_factory=FakeAgent)
+    try:
+        with pytest.raises(PipelineWorkerError):
+            await asyncio.wait_for(pool.run("crash", run_id="pool-crash"), timeout=120)
+        result = await asyncio.wait_for(pool.run("after the crash", run_id="pool-after"), timeout=120)
+        assert result["pid"] == pool.workers[0].process.pid
+    finally:
+        pool.close()
+
+
+def test_app_and_workers_together_stay_within_the_rate_limits(monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "queues", {})
+    monkeypatch.setitem(settings.LLM_RATE_LIMITS, "openai/gpt-4o", {"rpm": 500, "tpm": 30000})
+    monkeypatch.setattr(settings, "PIPELINE_APP_RATE_SHARE", 0.2)
+    pool = PipelinePool(4, agent_factory=FakeAgent)
+
+    _share_rate_limits(pool.worker_share)
+    worker_rpm = llm_scheduler.queues["openai/gpt-4o"].requests.rate * 60
+    _share_rate_limits(settings.PIPELINE_APP_RATE_SHARE)
+    app_rpm = llm_scheduler.queues["openai/gpt-4o"].requests.rate * 60
+    assert worker_rpm == pytest.approx(100) and app_rpm == pytest.approx(100)
+    assert app_rpm + 4 * worker_rpm == pytest.approx(500)
@@ -0,0 +1,45 @@
+import json
+
+from evolve_agent.agents.prompt import get_reflection_prompt, get_system_prompt
+from evolve_agent.agents.prompt_cache import (
+    cacheable_tokens,
+    measure_prefix_reuse,
+    simulate_run,
+)
+from evolve_agent.agents.rag import templates_dir
+
+
+def test_iterations_only_differ_after_the_question():
+    """Test that successive RAG prompts of a run share everything up to their archive."""
+    templates = [json.loads(path.read_text(encoding="utf-8")) for path in sorted(templates_dir.glob("*.json"))[:6]]
+    prompts = simulate_run(templates, "Summarize the messages posted to a webhook", iterations=3)
+
+    for previous, prompt in zip(prompts, prompts[1:]):
+        static, _ = prompt.split("# Archive", 1)
+        assert previous.startswith(static)
+
+    report = measure_prefix_reuse(prompts)
+    assert report["calls"][0]["cached_tokens"] == 0
+    assert all(call["cached_tokens"] > 0 for call in report["calls"][1:])
+    assert 0 < report["cost"] < report["uncached_cost"]
+
+
+def test_cacheable_tokens():
+    assert cacheable_tokens(1000) == 0
+    assert cacheable_tokens(1100) == 1024
+    assert cacheable_tokens(1300) == 1280
+
+
+def test_reflection_instructions_are_in_the_system_prompt():
+    reflection = get_reflection_prompt("{...}", "Stage: call_webhook")
+
+    assert "**Interestingness**" in get_system_prompt()
+    assert "**Interestingness**" not in reflection
+    assert reflection.startswith("Here is the previous agent RAG response:\n{...}")
+
+
+def test_system_prompt_has_a_single_output_schema():
+    system_prompt = get_system_prompt()
+
+    assert system_prompt.count("Please return in JSON format") == 1
+    assert '"mode": "patch"' in system_prompt
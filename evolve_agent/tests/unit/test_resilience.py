@@ -0,0 +1,92 @@
+import httpx
+import pytest
+
+from evolve_agent.app.services import resilience
+from evolve_agent.app.services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    UpstreamUnavailableError,
+    call_with_retry,
+    is_transient,
+)
+
+
+def http_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://n8n:5678/webhook/chat")
+    response = httpx.Response(status_code, request=request)
+    return httpx.HTTPStatusError(f"{status_code}", request=request, response=response)
+
+
+@pytest.fixture(autouse=True)
+def reset_breakers():
+    resilience.breakers.clear()
+    yield
+    resilience.breakers.clear()
+
+
+def test_is_transient():
+    """Test telling infrastructure errors apart from workflow defects."""
+    assert is_transient(http_error(429))
+    assert is_transient(http_error(502))
+    assert is_transient(httpx.ConnectError("connection refused"))
+    assert not is_transient(UpstreamUnavailableError("llm:rag", "all models failed"))
+    assert not is_transient(http_error(500))
+    assert not is_transient(http_error(404))
+    assert not is_transient(ValueError("bad workflow"))
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    """Test the closed -> open -> half-open -> closed transitions."""
+    breaker = CircuitBreaker("n8n", failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "half_open"  # reset_timeout of 0 elapses immediately
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one trial call while half-open
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_call_with_retry_recovers_from_transient_errors():
+    """Test that transient errors are retried until the call succeeds."""
+    errors = [http_error(503), httpx.ConnectError("reset")]
+
+    async def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert await call_with_retry("n8n", flaky, max_attempts=3, base_delay=0) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_call_with_retry_raises_workflow_errors_untouched():
+    """Test that non-transient errors are not retried."""
+    calls = []
+
+    async def broken():
+        calls.append(1)
+        raise http_error(500)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await call_with_retry("n8n", broken, max_attempts=3, base_delay=0)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_call_with_retry_does_not_repeat_side_effects():
+    """Test that a non-idempotent call is not retried once the upstream may have run
+    it."""
+    calls = []
+
+    async def gateway_timeout():
+        calls.append(1)
+        raise http_error(504)
+
+    with pytest.raises(UpstreamUnavailableError):
+        await call_with_retry("n8n", gateway_timeout, idempotent=False, max_attempts=3, base_delay=0)
+    assert len(calls) == 1
@@ -0,0 +1,132 @@
+import asyncio
+
+import httpx
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from evolve_agent.agents.router import ModelRouter
+from evolve_agent.app.config import settings
+from evolve_agent.app.services import resilience
+from evolve_agent.app.services.resilience import (
+    UpstreamUnavailableError,
+    call_with_retry,
+    get_breaker,
+)
+
+
+def stub_model(answer: str = None, delay: float = 0.0, error: Exception = None, calls: list = None) -> RunnableLambda:
+    """Stand-in for an Ollama or OpenAI chat model."""
+
+    async def respond(_):
+        if calls is not None:
+            calls.append(1)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return AIMessage(content=answer)
+
+    return RunnableLambda(lambda _: None, afunc=respond)
+
+
+@pytest.fixture(autouse=True)
+def reset_breakers():
+    resilience.breakers.clear()
+    yield
+    resilience.breakers.clear()
+
+
+@pytest.mark.asyncio
+async def test_falls_back_on_error_and_timeout():
+    """Test that a failing or slow model hands the call to the next one."""
+    router = ModelRouter(
+        "input",
+        [
+            ("ollama/broken", stub_model(error=httpx.ConnectError("connection refused"))),
+            ("ollama/slow", stub_model("slow", delay=1.0)),
+            ("openai/gpt-4o-mini", stub_model("ok")),
+        ],
+        timeout=0.05,
+        base_delay=0,
+    )
+    assert (await router.ainvoke("hi")).content == "ok"
+    stats = router.stats()
+    assert stats["ollama/broken"]["failures"] == settings.RETRY_MAX_ATTEMPTS
+    assert stats["ollama/slow"]["calls"] == 1  # timeouts fall back without retrying
+    assert stats["ollama/slow"]["latency_s"] == pytest.approx(0.05)
+    assert stats["openai/gpt-4o-mini"]["failures"] == 0
+
+
+@pytest.mark.asyncio
+async def test_latency_aware_prefers_fastest():
+    """Test that measured latencies reorder the candidates."""
+    router = ModelRouter(
+        "meta", [("openai/gpt-4o", stub_model("slow", delay=0.03)), ("ollama/llama3.2", stub_model("fast"))]
+    )
+    router.latency_aware = True
+    await router.ainvoke("hi")  # unmeasured candidates are tried in order
+    router.candidates[1].observe(0.001)
+    assert (await router.ainvoke("hi")).content == "fast"
+
+
+@pytest.mark.asyncio
+async def test_errors_when_every_model_fails():
+    """Test that infrastructure failures surface as an unavailable upstream, and
+    other errors as themselves."""
+    unavailable = ModelRouter("rag", [("ollama/llama3.2", stub_model(delay=1.0))], timeout=0.01)
+    with pytest.raises(UpstreamUnavailableError):
+        await unavailable.ainvoke("hi")
+
+    invalid = ModelRouter("rag", [("ollama/llama3.2", stub_model(error=ValueError("bad request")))])
+    with pytest.raises(ValueError):
+        await invalid.ainvoke("hi")
+
+    mixed = ModelRouter(
+        "rag",
+        [("openai/gpt-4o", stub_model(error=ValueError("bad request"))), ("ollama/llama3.2", stub_model(delay=1.0))],
+        timeout=0.01,
+    )
+    with pytest.raises(ValueError):
+        await mixed.ainvoke("hi")
+
+
+def rate_limited() -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, request=request)
+    return httpx.HTTPStatusError("429 Too Many Requests", request=request, response=response)
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_model_is_retried_before_falling_back():
+    """Test that transient errors are retried on the same model, and that an
+    exhausted chain is not retried as a whole."""
+    limited, fallback = [], []
+    router = ModelRouter(
+        "rag",
+        [("openai/gpt-4o", stub_model(error=rate_limited(), calls=limited)), ("ollama/llama3.2", stub_model("ok"))],
+        base_delay=0,
+    )
+    assert (await router.ainvoke("hi")).content == "ok"
+    assert len(limited) == settings.RETRY_MAX_ATTEMPTS
+    assert get_breaker("llm:openai/gpt-4o").failures == settings.RETRY_MAX_ATTEMPTS
+
+    router = ModelRouter("rag", [("ollama/llama3.2", stub_model(error=rate_limited(), calls=fallback))], base_delay=0)
+    with pytest.raises(UpstreamUnavailableError):
+        await call_with_retry("llm", router.ainvoke, "hi", base_delay=0)
+    assert len(fallback) == settings.RETRY_MAX_ATTEMPTS
+
+
+@pytest.mark.asyncio
+async def test_bad_requests_do_not_open_the_circuit_of_a_model():
+    """Test that only transient errors and timeouts count against a model."""
+    router = ModelRouter("input", [("openai/gpt-4o", stub_model(error=ValueError("bad request")))])
+    for _ in range(settings.BREAKER_FAILURE_THRESHOLD + 1):
+        with pytest.raises(ValueError):
+            await router.ainvoke("hi")
+    assert get_breaker("llm:openai/gpt-4o").state == "closed"
+
+    router = ModelRouter("input", [("openai/gpt-4o", stub_model(error=rate_limited()))], base_delay=0)
+    for _ in range(settings.BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(UpstreamUnavailableError):
+            await router.ainvoke("hi")
+    assert get_breaker("llm:openai/gpt-4o").state == "open"
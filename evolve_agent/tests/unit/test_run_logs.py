@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+import pytest
+from loguru import logger
+
+from evolve_agent.agents.context import run_context, run_id_var
+from evolve_agent.app.utils import RunLogRouter
+
+
+@pytest.mark.asyncio
+async def test_concurrent_runs_log_to_their_own_file(tmp_path):
+    """Test that each run only receives its own records, through a single sink."""
+    router = RunLogRouter(tmp_path, key=run_id_var.get, flush_interval=0.01)
+
+    async def run(run_id: str):
+        with run_context(run_id):
+            router.open(run_id)
+            for i in range(3):
+                logger.info(f"{run_id} line {i}")
+                await asyncio.sleep(0.01)
+            return router.close(run_id)
+
+    logger.info("outside of any run")
+    log_a, log_b = await asyncio.gather(run("a"), run("b"))
+    assert log_a.count("a line") == 3 and "b line" not in log_a
+    assert log_b.count("b line") == 3 and "a line" not in log_b
+    assert "outside" not in log_a + log_b
+    assert router.handler_id is None
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_read_open_run(tmp_path):
+    """Test that the background writer flushes the log of a running run."""
+    router = RunLogRouter(tmp_path, key=run_id_var.get, flush_interval=0.01)
+    with run_context("run"):
+        router.open("run")
+        logger.info("started")
+        await asyncio.sleep(0.05)
+        assert "started" in (tmp_path / "run.log").read_text()
+        assert "started" in router.read("run")
+        router.close("run")
+    assert router.read("run") is None
+
+
+def test_close_waits_for_a_batch_being_written(tmp_path):
+    """Test that a run closed while the writer appends its lines still returns them,
+    and no file is left behind."""
+    router = RunLogRouter(tmp_path, key=run_id_var.get)
+    appending, release = threading.Event(), threading.Event()
+    append = router._append
+
+    def slow_append(path, lines):
+        appending.set()
+        release.wait(5)
+        append(path, lines)
+
+    router._append = slow_append
+    with run_context("run"):
+        router.open("run")
+        logger.info("written by the writer")
+    writer = threading.Thread(target=router.flush)
+    writer.start()
+    assert appending.wait(5)
+    threading.Timer(0.1, release.set).start()
+
+    log = router.close("run")
+    writer.join()
+    assert "written by the writer" in log
+    assert list(tmp_path.iterdir()) == []
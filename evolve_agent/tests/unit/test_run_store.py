@@ -0,0 +1,60 @@
+import time
+
+from evolve_agent.app.services.run_store import RunStore, prompt_hash, workflow_hash
+
+WORKFLOW = {"name": "run---01---Weather", "nodes": [{"name": "Webhook"}], "connections": {}}
+
+
+def test_hashes_ignore_formatting_and_name():
+    """Test that equivalent prompts and workflows share a hash."""
+    assert prompt_hash("Send the  weather") == prompt_hash("send the weather ")
+    assert workflow_hash(WORKFLOW) == workflow_hash({**WORKFLOW, "name": "run---02---Weather"})
+
+
+def test_run_lifecycle(tmp_path):
+    """Test recording a run, its attempts, result and log, then querying it."""
+    store = RunStore(tmp_path / "runs.sqlite3")
+    store.start_run("run", "Send the weather", {"max_iteration": 2})
+    store.add_attempt("run", 1, WORKFLOW, stage="call_webhook", error="404")
+    store.add_attempt("run", 2, WORKFLOW)
+    result = {"run_id": "run", "success": True, "iterations": 2, "workflow": WORKFLOW}
+    store.finish_run("run", "success", result, "line 1\nline 2\n")
+
+    [listed] = store.list_runs(prompt="send the weather")
+    assert listed["status"] == "success" and listed["iterations"] == 2
+    assert store.list_runs(status="failed") == []
+
+    run = store.get_run("run")
+    assert run["result"] == result
+    assert [(a["iteration"], a["stage"]) for a in run["attempts"]] == [(1, "call_webhook"), (2, None)]
+    assert store.get_workflow(run["workflow_hash"]) == WORKFLOW
+    assert store.get_log("run") == "line 1\nline 2\n"
+    assert store.get_run("unknown") is None
+
+
+def test_prune_by_age_and_size(tmp_path):
+    """Test deleting runs past the age limit, then the oldest beyond the size limit."""
+    store = RunStore(tmp_path / "runs.sqlite3")
+    for run_id in ("old", "mid", "new"):
+        store.start_run(run_id, run_id)
+        store.add_attempt(run_id, 1, {**WORKFLOW, "nodes": [{"name": run_id}]})
+        store.finish_run(run_id, "failed", log=run_id * 1000)
+    store._execute("UPDATE runs SET created_at = ? WHERE run_id = 'old'", (time.time() - 10 * 86400,))
+    store._execute("UPDATE runs SET created_at = ? WHERE run_id = 'mid'", (time.time() - 86400,))
+
+    assert store.prune(max_age_days=5, max_size_mb=1) == 1
+    assert store.prune(max_age_days=5, max_size_mb=0) == 2
+    assert store.list_runs() == []
+    assert store._execute("SELECT COUNT(*) FROM workflows")[0][0] == 0
+
+
+def test_cached_run_stores_its_workflow(tmp_path):
+    """Test that a run answered from the solution cache, without attempts, can still
+    serve its workflow, also after pruning."""
+    store = RunStore(tmp_path / "runs.sqlite3")
+    store.start_run("cached", "Send the weather")
+    store.finish_run("cached", "cached", {"run_id": "cached", "success": True, "iterations": 0, "workflow": WORKFLOW})
+
+    digest = store.get_run("cached")["workflow_hash"]
+    store.prune(max_age_days=5)
+    assert store.get_workflow(digest) == WORKFLOW
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from evolve_agent.agents.context import iteration_var, run_context
+from evolve_agent.agents.models import LLMScheduler, TokenBucket
+
+
+def test_token_bucket_wait_time():
+    """Test waiting, consuming and refunding budget."""
+    bucket = TokenBucket(per_minute=600)  # 10 units per second
+    assert bucket.wait_time(600) == 0
+    bucket.consume(600)
+    assert bucket.wait_time(10) == pytest.approx(1.0, abs=0.05)
+    bucket.adjust(-10)  # refund
+    assert bucket.wait_time(10) == 0
+    # Calls larger than the whole budget wait for a full bucket instead of forever
+    assert bucket.wait_time(10_000) < 61
+
+
+@pytest.mark.asyncio
+async def test_scheduler_unthrottled_model():
+    """Test that models without limits are not queued."""
+    scheduler = LLMScheduler()
+    assert await scheduler.acquire("openai/gpt-4o", 1000) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_serves_runs_in_progress_first():
+    """Test that a later iteration overtakes a new run once budget frees up."""
+    scheduler = LLMScheduler({"openai/gpt-4o": {"rpm": 600, "tpm": 1_000_000}})
+    scheduler.queues["openai/gpt-4o"].requests.tokens = 0  # exhausted budget
+    order = []
+
+    async def call(run_id: str, iteration: int):
+        with run_context(run_id):
+            iteration_var.set(iteration)
+            await scheduler.acquire("openai/gpt-4o", 100)
+            order.append(run_id)
+
+    new_run = asyncio.create_task(call("new", 1))
+    await asyncio.sleep(0)
+    running_run = asyncio.create_task(call("running", 3))
+    await asyncio.sleep(0)
+    assert scheduler.stats()["openai/gpt-4o"]["queue_depth"] == 2
+
+    await asyncio.gather(new_run, running_run)
+    assert order == ["running", "new"]
+    assert scheduler.stats()["openai/gpt-4o"]["granted"] == 2
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from evolve_agent.app.services.single_flight import SingleFlight, request_key
+
+
+def test_request_key_normalizes_whitespace():
+    assert request_key("pipeline", " Send the  weather\n", max_iteration=5) == request_key(
+        "pipeline", "Send the weather", max_iteration=5
+    )
+    assert request_key("pipeline", "Send the weather", max_iteration=5) != request_key(
+        "pipeline", "Send the weather", max_iteration=3
+    )
+
+
+@pytest.mark.asyncio
+async def test_duplicates_share_one_execution_within_the_grace_window():
+    """Test that concurrent and just-late duplicates get the result of one run."""
+    flights = SingleFlight("pipeline", grace=0.05)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"run": len(calls)}
+
+    results = await asyncio.gather(*(flights.run("key", work) for _ in range(3)))
+    assert results == [{"run": 1}] * 3
+    assert await flights.run("key", work) == {"run": 1}
+
+    await asyncio.sleep(0.1)
+    assert await flights.run("key", work) == {"run": 2}
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_flight_is_not_reused_and_survives_cancelled_waiters():
+    flights = SingleFlight("generation", grace=10)
+    attempts = []
+
+    async def work():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("n8n down")
+        return "ok"
+
+    impatient = asyncio.create_task(flights.run("key", work))
+    patient = asyncio.create_task(flights.run("key", work))
+    await asyncio.sleep(0)
+    impatient.cancel()
+    with pytest.raises(RuntimeError):
+        await patient
+    assert await flights.run("key", work) == "ok"
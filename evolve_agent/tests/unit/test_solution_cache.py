@@ -0,0 +1,91 @@
+import asyncio
+from typing import List
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from evolve_agent.agents.solution_cache import (
+    SolutionCache,
+    format_solutions,
+    same_parameters,
+)
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embeds a text by counting a few keywords, enough to rank similar prompts."""
+
+    keywords = ["weather", "whatsapp", "email", "invoice"]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [float(text.lower().count(keyword)) + 0.01 for keyword in self.keywords]
+
+
+@pytest.mark.asyncio
+async def test_lookup_ranks_similar_prompts_first(tmp_path):
+    """Test storing solutions and finding the nearest one."""
+    cache = SolutionCache(KeywordEmbeddings(), directory=tmp_path)
+    assert await cache.lookup("Send me the weather on WhatsApp") == []
+
+    await cache.add("Send the weather to WhatsApp", {"name": "Weather"}, {"chat": {}}, {"chat": {"ok": True}})
+    await cache.add("Email me each invoice", {"name": "Invoices"}, {"invoice": {}}, {"invoice": {"ok": True}})
+
+    matches = await cache.lookup("Send me the weather on WhatsApp", k=2)
+    assert [record["workflow"]["name"] for _, record in matches] == ["Weather", "Invoices"]
+    assert matches[0][0] == pytest.approx(1.0, abs=1e-3)
+    assert 'Workflow:\n{"name":"Weather"}' in format_solutions(matches[:1])
+
+
+@pytest.mark.asyncio
+async def test_cache_persists_across_instances(tmp_path):
+    """Test that a new cache instance loads the stored solutions."""
+    cache = SolutionCache(KeywordEmbeddings(), directory=tmp_path)
+    await cache.add("Email me each invoice", {"name": "Invoices"}, {}, {})
+
+    reloaded = SolutionCache(KeywordEmbeddings(), directory=tmp_path)
+    matches = await reloaded.lookup("Forward invoice emails", k=1)
+    assert matches[0][1]["workflow"] == {"name": "Invoices"}
+
+
+@pytest.mark.asyncio
+async def test_caches_sharing_a_directory_see_each_others_solutions(tmp_path):
+    """Test that caches of several processes reload the solutions the others stored."""
+    first = SolutionCache(KeywordEmbeddings(), directory=tmp_path)
+    second = SolutionCache(KeywordEmbeddings(), directory=tmp_path)
+    await first.add("Email me each invoice", {"name": "Invoices"}, {}, {})
+    await second.add("Send the weather to WhatsApp", {"name": "Weather"}, {}, {})
+
+    matches = await first.lookup("Forward invoice emails", k=2)
+    assert [record["workflow"]["name"] for _, record in matches] == ["Invoices", "Weather"]
+    assert len(SolutionCache(KeywordEmbeddings(), directory=tmp_path).records) == 2
+
+
+@pytest.mark.asyncio
+async def test_waiting_for_the_write_lock_does_not_block_the_event_loop(tmp_path):
+    """Test that other tasks run while another process holds the lock."""
+    fcntl = pytest.importorskip("fcntl")
+    cache = SolutionCache(KeywordEmbeddings(), directory=tmp_path)
+    ticks = []
+
+    async def tick():
+        for _ in range(5):
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    with open(tmp_path / ".lock", "w") as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        adding = asyncio.create_task(cache.add("Email me each invoice", {"name": "Invoices"}, {}, {}))
+        await tick()
+        assert not adding.done()
+        fcntl.flock(held, fcntl.LOCK_UN)
+    await asyncio.wait_for(adding, 5)
+    assert len(ticks) == 5 and len(cache.records) == 1
+
+
+def test_same_parameters_tells_apart_prompts_naming_other_values():
+    assert same_parameters("Send me the weather in Paris", "send me the weather in Paris.")
+    assert not same_parameters("Send me the weather in Paris", "Send me the weather in Berlin")
+    assert not same_parameters("Alert me when a payment exceeds 500 USD", "Alert me when a payment exceeds 50 USD")
+    assert not same_parameters("Summarize https://a.com/feed daily", "Summarize https://b.com/feed daily")
@@ -0,0 +1,55 @@
+import pytest
+from langchain_core.messages import AIMessage
+
+from evolve_agent.agents.context import iteration_var, run_context, stage_context
+from evolve_agent.agents.usage import UsageLedger, estimate_cost, summarize_usage
+from evolve_agent.app.services.run_store import RunStore
+
+
+def test_estimate_cost():
+    """Test pricing input, cached input and output tokens."""
+    # 1M input tokens of which half cached, 1M output tokens of gpt-4o
+    assert estimate_cost("openai/gpt-4o", 1_000_000, 1_000_000, 500_000) == pytest.approx(1.25 + 0.625 + 10.0)
+    assert estimate_cost("ollama/llama3.2", 1_000_000, 1_000_000) == 0.0
+
+
+def test_ledger_attributes_calls_to_run_and_stage(tmp_path):
+    """Test recording calls with their run, iteration and stage, then querying them
+    from the run store."""
+    ledger = UsageLedger()
+    response = AIMessage(
+        content="{}",
+        usage_metadata={
+            "input_tokens": 1000,
+            "output_tokens": 100,
+            "total_tokens": 1100,
+            "input_token_details": {"cache_read": 400},
+        },
+    )
+    ledger.record_chat("rag", "openai/gpt-4o", "prompt", response, 1.5)  # outside of a run, dropped
+    with run_context("run"):
+        iteration_var.set(2)
+        with stage_context("generate_workflow"):
+            ledger.record_chat("rag", "openai/gpt-4o", "prompt", response, 1.5)
+        with stage_context("get_webhook_input"):
+            ledger.record_chat("input", "ollama/llama3.2", "a prompt", AIMessage(content="{}"), 0.5)
+    records = ledger.pop("run")
+    assert [(r["iteration"], r["role"], r["stage"]) for r in records] == [
+        (2, "rag", "generate_workflow"),
+        (2, "input", "get_webhook_input"),
+    ]
+    assert records[0]["cached_tokens"] == 400 and not records[0]["estimated"]
+    assert records[1]["estimated"] and records[1]["cost"] == 0.0
+
+    totals = summarize_usage(records)
+    assert totals["calls"] == 2
+    assert totals["by_stage"]["generate_workflow"]["input_tokens"] == 1000
+
+    store = RunStore(tmp_path / "runs.sqlite3")
+    store.start_run("run", "prompt")
+    store.add_usage("run", records)
+    assert [r["model"] for r in store.get_usage("run")] == ["openai/gpt-4o", "ollama/llama3.2"]
+    report = {row["role"]: row for row in store.usage_report(group_by=["role"])}
+    assert report["rag"]["input_tokens"] == 1000 and report["rag"]["runs"] == 1
+    with pytest.raises(ValueError):
+        store.usage_report(group_by=["prompt"])
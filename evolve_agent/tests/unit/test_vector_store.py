@@ -0,0 +1,90 @@
+from typing import List
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from evolve_agent.agents.vector_store import ArrayVectorStore
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embeds a text by counting a few keywords."""
+
+    keywords = ["weather", "whatsapp", "email", "invoice"]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [float(text.lower().count(keyword)) + 0.01 for keyword in self.keywords]
+
+
+@pytest.mark.asyncio
+async def test_search_reopens_memory_mapped_index(tmp_path):
+    """Test building an index, then searching it from a fresh, memory-mapped store."""
+    texts = ["Weather on WhatsApp", "Email each invoice", "Weather by email"]
+    store = ArrayVectorStore.from_texts(
+        texts, KeywordEmbeddings(), metadatas=[{"source": t} for t in texts], directory=tmp_path, source="v1"
+    )
+    assert len(store) == 3
+
+    reopened = ArrayVectorStore(tmp_path, KeywordEmbeddings())
+    assert isinstance(reopened.vectors, np.memmap) and reopened.vectors.dtype == np.float16
+    assert reopened.is_current("v1") and not reopened.is_current("v2")
+    assert [d.metadata["source"] for d in reopened.similarity_search("invoice email", k=2)] == texts[1:]
+    documents = await reopened.as_retriever(search_kwargs={"k": 1}).ainvoke("whatsapp weather")
+    assert documents[0].page_content == "Weather on WhatsApp"
+
+
+def test_ivf_layer_finds_the_exact_neighbours_of_clustered_vectors(tmp_path):
+    """Test that the IVF layer only scores the clusters near the query and finds its
+    nearest row."""
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(8, 16))
+    vectors = np.concatenate([center + 0.05 * rng.normal(size=(50, 16)) for center in centers])
+    documents = [Document(page_content=str(i)) for i in range(len(vectors))]
+
+    exact = ArrayVectorStore(tmp_path / "exact", KeywordEmbeddings(), dtype="float32")
+    exact.build(documents, vectors)
+    ann = ArrayVectorStore(tmp_path / "ann", KeywordEmbeddings(), dtype="float32", ann_threshold=100, nprobe=3)
+    ann.build(documents, vectors)
+    assert exact.ivf is None and ann.ivf is not None
+
+    for cluster, query in enumerate(centers):
+        rows = [row for row, _ in ann.search_vector(query, k=5)]
+        assert all(row // 50 == cluster for row in rows)
+        assert rows[0] == exact.search_vector(query, k=1)[0][0]
+
+
+def test_chroma_index_is_rebuilt_when_the_templates_change(tmp_path, monkeypatch):
+    """Test that a Chroma index built from other templates, e.g. before the codec, is
+    rebuilt, and reused otherwise."""
+    pytest.importorskip("langchain_chroma")
+    from langchain_core.language_models import FakeListChatModel
+
+    from evolve_agent.agents.rag import TemplateRAG
+    from evolve_agent.app.config import settings
+
+    monkeypatch.setattr(settings, "RAG_DEDUP_THRESHOLD", 0)
+    embeddings = KeywordEmbeddings()
+    calls = []
+    monkeypatch.setattr(
+        embeddings, "embed_documents", lambda texts: calls.append(len(texts)) or [[1.0] * 4] * len(texts)
+    )
+    (tmp_path / "weather.json").write_text('{"name": "Weather", "nodes": [], "connections": {}}')
+
+    def open_index():
+        return TemplateRAG(FakeListChatModel(responses=["{}"]), embeddings, tmp_path, vector_store="chroma")
+
+    open_index()
+    open_index()
+    assert len(calls) == 1
+
+    (tmp_path / "email.json").write_text('{"name": "Email", "nodes": [], "connections": {}}')
+    rag = open_index()
+    assert len(calls) == 2
+    assert sorted(d.metadata["source"] for d in rag.vectorstore.similarity_search("weather", k=5)) == [
+        "email.json",
+        "weather.json",
+    ]
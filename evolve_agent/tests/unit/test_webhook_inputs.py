@@ -0,0 +1,91 @@
+from evolve_agent.agents.webhook_inputs import (
+    analyze_webhooks,
+    referenced_fields,
+    synthesize_webhook_inputs,
+    validate_webhook_inputs,
+)
+
+
+def webhook(name: str, path: str) -> dict:
+    return {"name": name, "type": "n8n-nodes-base.webhook", "parameters": {"httpMethod": "POST", "path": path}}
+
+
+WORKFLOW = {
+    "name": "Booking",
+    "nodes": [
+        webhook("Webhook", "book"),
+        webhook("Cancel", "cancel"),
+        {"name": "Set", "type": "n8n-nodes-base.set", "parameters": {"value": "={{ $json.body.city }}"}},
+        {
+            "name": "Mail",
+            "type": "n8n-nodes-base.emailSend",
+            "parameters": {
+                "subject": "={{ $('Webhook').item.json.body.name }} in {{ $json.city }}",
+                "options": {"to": '={{ $node["Cancel"].json["body"]["email"] }}'},
+            },
+        },
+    ],
+    "connections": {
+        "Webhook": {"main": [[{"node": "Set", "type": "main", "index": 0}]]},
+        "Set": {"main": [[{"node": "Mail", "type": "main", "index": 0}]]},
+    },
+}
+
+
+def test_referenced_fields_attributes_expressions_to_webhooks():
+    assert referenced_fields(WORKFLOW) == {"book": {"city", "name"}, "cancel": {"email"}}
+
+
+def test_validate_webhook_inputs_keeps_only_complete_inputs():
+    valid, problems = validate_webhook_inputs(
+        WORKFLOW, {"book": {"body": {"city": "Paris", "name": "Ada"}}, "cancel": {"mail": "ada@example.com"}}
+    )
+
+    assert valid == {"book": {"city": "Paris", "name": "Ada"}}
+    assert problems == {"cancel": "missing field(s) email"}
+    assert validate_webhook_inputs(WORKFLOW, {"book": "Paris"})[1] == {
+        "book": "input is a str, not an object",
+        "cancel": "no input",
+    }
+
+
+def test_synthesize_webhook_inputs_from_typed_references():
+    workflow = {
+        "nodes": [
+            webhook("Webhook", "order"),
+            webhook("Raw", "raw"),
+            {
+                "name": "If",
+                "type": "n8n-nodes-base.if",
+                "parameters": {
+                    "conditions": {
+                        "conditions": [
+                            {"leftValue": "={{ $json.body.total }}", "rightValue": 10, "operator": {"type": "number"}}
+                        ]
+                    }
+                },
+            },
+            {
+                "name": "Code",
+                "type": "n8n-nodes-base.code",
+                "parameters": {
+                    "jsCode": "const tags = $('Webhook').first().json.body.tags.join(', ');\n"
+                    "const sku = $('Webhook').item.json.body.items[0].sku.toUpperCase();\n"
+                    "return $('Raw').item.json.body;"
+                },
+            },
+            {
+                "name": "Mail",
+                "type": "n8n-nodes-base.emailSend",
+                "parameters": {"to": "={{ $json.body.customer.email }}"},
+            },
+        ],
+        "connections": {"Webhook": {"main": [[{"node": "If", "type": "main", "index": 0}]]}},
+    }
+
+    inputs, unresolved = synthesize_webhook_inputs(workflow)
+
+    assert analyze_webhooks(workflow)["order"].fields[("items", 0, "sku")] == "string"
+    assert inputs == {"order": {"total": 100, "tags": ["sample tags"], "items": [{"sku": "sample sku"}]}}
+    # The body of "raw" is returned whole, and $json in "Mail" is not the webhook request
+    assert unresolved == ["raw"]